@@ -0,0 +1,217 @@
+"""
+build_dataset.py: tokenizes formatted queries once, for every fine-tuning run
+
+Every (query, functions) pair of a formatted-queries_*.json file is put into
+the prompt template of fine-tune_llm.ipynb and tokenized in worker
+processes. The result is saved as Arrow shards (input_ids, and labels that
+are -100 over the prompt so the loss only covers the response), which
+load_from_disk memory-maps: a run starts right away and reads the examples
+from disk instead of holding the corpus in RAM.
+
+The shards are cached under a key made of the tokenizer, the template, the
+source file and the settings, so changing any of them builds new ones.
+
+    python DATA/build_dataset.py DATA/formatted-queries_2024-Jan-30_23-29-10.json \\
+        --tokenizer mistralai/Mistral-7B-Instruct-v0.2 --num-proc 8
+
+    dataset = load_from_disk(path)  # printed by the command above
+    Trainer(
+        train_dataset=dataset["train"],
+        data_collator=DataCollatorForSeq2Seq(tokenizer, padding=True),
+        ...
+    )
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+
+from dedup import find_clusters, split_clusters
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+DATA_DIR = Path(__file__).resolve().parent
+CACHE_DIR = DATA_DIR / "tokenized"
+# generate_prompt of fine-tune_llm.ipynb
+TRAIN_TEMPLATE = """<s>[INST] 
+        # TASK DESCRIPTION: 
+        Translate user queries about industrial robotic operations into JSON outputs for specific function calls. 
+        # USER QUERY: 
+        {user_query} 
+        # RESPONSE: [/INST]
+        {function_calling}
+    """
+
+
+def render(template, query, result):
+    """
+    Returns (prompt, whole text) of one example, the prompt being the part
+    before the response
+    """
+    prompt, _ = template.split("{function_calling}")
+    prompt = prompt.format(user_query=query).lstrip()
+    text = template.format(user_query=query, function_calling=str(result)).strip()
+    return prompt, text
+
+
+def tokenizer_fingerprint(tokenizer):
+    if tokenizer.is_fast:
+        vocabulary = tokenizer.backend_tokenizer.to_str()
+    else:
+        vocabulary = json.dumps(tokenizer.get_vocab(), sort_keys=True)
+    special = json.dumps(tokenizer.special_tokens_map, sort_keys=True)
+    return hashlib.sha256(
+        (type(tokenizer).__name__ + special + vocabulary).encode()
+    ).hexdigest()
+
+
+def cache_key(source, tokenizer, template, **settings):
+    digest = hashlib.sha256()
+    with open(source, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(tokenizer_fingerprint(tokenizer).encode())
+    digest.update(template.encode())
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+class Tokenize:
+    """
+    The map function of build_dataset, a class so worker processes get it
+    with its tokenizer
+    """
+
+    def __init__(self, tokenizer, template, max_length, add_eos):
+        self.tokenizer = tokenizer
+        self.template = template
+        self.max_length = max_length
+        self.add_eos = add_eos
+
+    def __call__(self, batch):
+        prompts, texts = zip(
+            *(
+                render(self.template, query, result)
+                for query, result in zip(batch["query"], batch["result"])
+            )
+        )
+        # The templates start with <s> already
+        encoded = self.tokenizer(
+            list(texts),
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            truncation=True,
+            max_length=self.max_length - 1 if self.add_eos else self.max_length,
+        )
+        labels = []
+        for i, (ids, offsets) in enumerate(
+            zip(encoded["input_ids"], encoded["offset_mapping"])
+        ):
+            if self.add_eos:
+                ids.append(self.tokenizer.eos_token_id)
+                offsets.append((len(texts[i]), len(texts[i])))
+            # Tokens that start inside the prompt are not learned
+            prompt_length = len(prompts[i].rstrip())
+            labels.append(
+                [
+                    -100 if start < prompt_length else token
+                    for token, (start, _) in zip(ids, offsets)
+                ]
+            )
+        return {"input_ids": encoded["input_ids"], "labels": labels}
+
+
+def build_dataset(
+    source,
+    tokenizer,
+    template=TRAIN_TEMPLATE,
+    max_length=512,
+    add_eos=True,
+    test_size=0.1,
+    seed=0,
+    num_proc=None,
+    cache_dir=CACHE_DIR,
+):
+    """
+    Returns the path of the tokenized train/test DatasetDict of source (a
+    formatted-queries_*.json file), built unless it is cached already.
+    Near-duplicate queries (dedup.py) never end up in both splits.
+    """
+    from datasets import Dataset, DatasetDict
+
+    settings = {"max_length": max_length, "add_eos": add_eos}
+    settings.update(test_size=test_size, seed=seed)
+    path = Path(cache_dir) / cache_key(source, tokenizer, template, **settings)
+    if (path / "dataset_dict.json").exists():
+        log.info("Using the cached %s", path)
+        return path
+
+    with open(source, encoding="utf-8") as file:
+        pairs = json.load(file)
+    queries = [query for query, _ in pairs]
+    # The results are dicts of varying shape, Arrow gets their text
+    results = [str(result) for _, result in pairs]
+    sides = split_clusters(find_clusters(queries), test_size, seed)
+
+    tokenize = Tokenize(tokenizer, template, max_length, add_eos)
+    splits = {}
+    for side in ("train", "test"):
+        rows = [i for i, s in enumerate(sides) if s == side]
+        split = Dataset.from_dict(
+            {
+                "query": [queries[i] for i in rows],
+                "result": [results[i] for i in rows],
+            }
+        )
+        splits[side] = split.map(
+            tokenize,
+            batched=True,
+            num_proc=num_proc if num_proc and len(split) >= num_proc else None,
+            remove_columns=["query", "result"],
+            desc=f"Tokenizing {side}",
+        )
+
+    # Written next to the cache and moved in place once complete, so an
+    # interrupted build is never mistaken for a cached one
+    partial = path.with_name(path.name + ".partial")
+    shutil.rmtree(partial, ignore_errors=True)
+    DatasetDict(splits).save_to_disk(str(partial))
+    os.replace(partial, path)
+    log.info("Built %s", path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("source", help="formatted-queries_*.json file")
+    parser.add_argument(
+        "--tokenizer",
+        default="mistralai/Mistral-7B-Instruct-v0.2",
+        help="name or path of the tokenizer",
+    )
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--test-size", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--num-proc", type=int, default=os.cpu_count())
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR))
+    args = parser.parse_args()
+    logging.basicConfig(level="INFO", format="%(asctime)s %(levelname)s %(message)s")
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, cache_dir="./weights")
+    path = build_dataset(
+        args.source,
+        tokenizer,
+        max_length=args.max_length,
+        test_size=args.test_size,
+        seed=args.seed,
+        num_proc=args.num_proc,
+        cache_dir=args.cache_dir,
+    )
+    print(path)
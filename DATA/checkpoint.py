@@ -0,0 +1,103 @@
+"""
+checkpoint.py: append-only JSONL log of generated records
+
+Every finished record is appended as one line, instead of rewriting the
+whole list at each checkpoint, so the cost of saving stays the same however
+large the dataset grows. Lines are flushed right away (a crash of the
+process loses nothing) and fsynced every sync_every records (a crash of the
+machine loses at most those).
+
+    with CheckpointLog("DATA/formatted-queries.jsonl") as log:
+        done = {record["query"] for record in log.records}
+        log.append({"query": query, "result": result})
+
+A line cut short (or left garbled) by a crash at the end of the log is
+dropped when the log is opened again.
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+def read_log(path):
+    """
+    Returns the records of the log at path, [] if there is none
+    """
+    path = Path(path)
+    if not path.exists():
+        return []
+    records = []
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.endswith("\n"):
+                log.warning("Dropping the unfinished last line of %s", path)
+                break
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                log.warning("Skipping the malformed line %i of %s", number, path)
+    return records
+
+
+def repair(path):
+    """
+    Cuts the log at path after its last complete record: an unfinished last
+    line goes, and so do malformed lines before it at the end of the log
+    """
+    with open(path, "rb+") as file:
+        data = file.read()
+        end = data.rfind(b"\n") + 1
+        while end:
+            start = data.rfind(b"\n", 0, end - 1) + 1
+            try:
+                json.loads(data[start:end])
+                break
+            except ValueError:
+                end = start
+        if end != len(data):
+            log.warning("Cutting %i bytes off the end of %s", len(data) - end, path)
+            file.truncate(end)
+
+
+class CheckpointLog:
+    def __init__(self, path, sync_every=100):
+        """
+        sync_every: records appended between two fsyncs
+        """
+        self.path = Path(path)
+        self.sync_every = sync_every
+        self.records = read_log(self.path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            repair(self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.unsynced = 0
+
+    def append(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.records.append(record)
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
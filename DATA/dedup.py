@@ -0,0 +1,232 @@
+"""
+dedup.py: clusters near-duplicate queries with MinHash and LSH
+
+High temperature prompts phrase the same command many times over ("Rotate
+the 6th joint by -30 degrees", "Rotate the sixth joint by -30 degrees.").
+Every query is reduced to a MinHash signature of its character n-grams, and
+locality sensitive hashing (bands of the signature as bucket keys) finds the
+candidate pairs without comparing every pair, so the cost grows linearly
+with the number of queries. Candidates whose estimated Jaccard similarity
+reaches the threshold are joined into clusters.
+
+Queries that differ in a number, an axis, an ordinal or a direction are
+never duplicates, however similar the rest of the text: "rotate joint 2 by
+30 degrees" and "rotate joint 3 by 30 degrees" have different labels.
+
+    python DATA/dedup.py DATA/generated-queries.json --output unique.json
+"""
+
+import re
+import json
+import time
+import zlib
+import logging
+import argparse
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Largest prime below 2**32, keeps the hashes in uint32 and the products
+# of the universal hashing below 2**64
+PRIME = 4294967291
+# Tokens that change the meaning of a query, duplicates must agree on them.
+# Spelled out ordinals are digits by then, see normalize
+KEY_TOKENS = re.compile(
+    r"-?\d+(?:\.\d+)?|\bpi\b|\b[xyz]\b|\b(?:last|base|left|right|up|down|forward"
+    r"|backward|back|clockwise|counterclockwise|negative|positive)\b"
+    r"|(?<![a-z])(?:mm|cm|m|deg|rad|inch|inches)\b"
+    r"|(?:milli|mili|centi)?met(?:er|re)s?\b|degrees?\b|radians?\b"
+)
+# Spellings of the units in KEY_TOKENS: canonical unit
+UNITS = {
+    "millimeter": "mm",
+    "millimeters": "mm",
+    "millimetre": "mm",
+    "millimetres": "mm",
+    "milimeter": "mm",
+    "milimeters": "mm",
+    "centimeter": "cm",
+    "centimeters": "cm",
+    "centimetre": "cm",
+    "centimetres": "cm",
+    "meter": "m",
+    "meters": "m",
+    "metre": "m",
+    "metres": "m",
+    "degree": "deg",
+    "degrees": "deg",
+    "radian": "rad",
+    "radians": "rad",
+    "inches": "inch",
+}
+# Ordinals spelled out: as digits, so "sixth joint" and "6th joint" agree
+ORDINALS = {
+    "first": "1st",
+    "second": "2nd",
+    "third": "3rd",
+    "fourth": "4th",
+    "fifth": "5th",
+    "sixth": "6th",
+}
+ORDINAL_WORDS = re.compile(r"\b(" + "|".join(ORDINALS) + r")\b")
+
+
+def normalize(text):
+    text = text.lower().replace("π", "pi").replace("−", "-").replace("°", " deg")
+    text = re.sub(r"[^\w\s.\-/]", " ", text)
+    text = ORDINAL_WORDS.sub(lambda match: ORDINALS[match[1]], text)
+    return re.sub(r"\s+", " ", text).strip(" .")
+
+
+def key_tokens(text):
+    return tuple(UNITS.get(token, token) for token in KEY_TOKENS.findall(text))
+
+
+class MinHasher:
+    def __init__(self, num_perm=128, ngram=5, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, PRIME, num_perm, dtype=np.uint64)[:, None]
+        self.ngram = ngram
+
+    def shingles(self, text):
+        n = self.ngram
+        grams = {text[i : i + n] for i in range(max(1, len(text) - n + 1))}
+        return np.fromiter(
+            (zlib.crc32(gram.encode()) % PRIME for gram in grams),
+            dtype=np.uint64,
+            count=len(grams),
+        )
+
+    def signature(self, text):
+        """
+        MinHash signature of the n-grams of the normalized text, num_perm
+        uint32 values
+        """
+        hashes = (self.a * self.shingles(text)[None, :] + self.b) % PRIME
+        return hashes.min(axis=1).astype(np.uint32)
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        # The smaller index, the earlier query, stays the root
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def find_clusters(texts, threshold=0.7, num_perm=128, bands=16, ngram=5, seed=0):
+    """
+    Returns the cluster of every text: the index of the first text of its
+    cluster, which is its representative.
+
+    threshold: estimated Jaccard similarity of the n-grams from which two
+               texts are duplicates
+    bands: LSH bands of num_perm / bands rows each. Pairs above about
+           (1 / bands) ** (bands / num_perm) similarity become candidates,
+           keep it below threshold.
+    """
+    if num_perm % bands:
+        raise ValueError(f"num_perm {num_perm} is not a multiple of bands {bands}")
+    hasher = MinHasher(num_perm, ngram, seed)
+    normalized = [normalize(text) for text in texts]
+    keys = [key_tokens(text) for text in normalized]
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for i, text in enumerate(normalized):
+        signatures[i] = hasher.signature(text)
+
+    clusters = UnionFind(len(texts))
+    rows = num_perm // bands
+    for band in range(bands):
+        # Every text is compared with the first text of its bucket only, so
+        # a crowded bucket costs linear time, not quadratic
+        buckets = {}
+        columns = signatures[:, band * rows : (band + 1) * rows]
+        for i, key in enumerate(map(bytes, columns)):
+            first = buckets.setdefault((keys[i], key), i)
+            if first == i or clusters.find(first) == clusters.find(i):
+                continue
+            similarity = np.mean(signatures[i] == signatures[first])
+            if similarity >= threshold:
+                clusters.union(first, i)
+    return [clusters.find(i) for i in range(len(texts))]
+
+
+def deduplicate(texts, **kwargs):
+    """
+    Returns the representative of every cluster of texts, in their order.
+    kwargs go to find_clusters.
+    """
+    clusters = find_clusters(texts, **kwargs)
+    return [text for i, text in enumerate(texts) if clusters[i] == i]
+
+
+def split_clusters(clusters, test_size=0.1, seed=None):
+    """
+    Returns "train" or "test" for every item of clusters (as find_clusters
+    returns them), about test_size of the items in test. Whole clusters go
+    to one side, so near-duplicates never end up in both.
+    """
+    roots = sorted(set(clusters))
+    sizes = {root: 0 for root in roots}
+    for root in clusters:
+        sizes[root] += 1
+    np.random.default_rng(seed).shuffle(roots)
+    test, count = set(), 0
+    for root in roots:
+        if count >= test_size * len(clusters):
+            break
+        test.add(root)
+        count += sizes[root]
+    return ["test" if root in test else "train" for root in clusters]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", help="JSON list of queries")
+    parser.add_argument("--output", help="JSON file for the representatives")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    parser.add_argument("--num-perm", type=int, default=128)
+    parser.add_argument("--bands", type=int, default=16)
+    parser.add_argument("--show", type=int, default=0, help="clusters to print")
+    args = parser.parse_args()
+    logging.basicConfig(level="INFO", format="%(asctime)s %(levelname)s %(message)s")
+
+    with open(args.input, encoding="utf-8") as file:
+        queries = json.load(file)
+    start = time.perf_counter()
+    clusters = find_clusters(
+        queries, threshold=args.threshold, num_perm=args.num_perm, bands=args.bands
+    )
+    elapsed = time.perf_counter() - start
+    representatives = [query for i, query in enumerate(queries) if clusters[i] == i]
+    log.info(
+        "%i queries, %i clusters, %i duplicates removed in %.2f s",
+        len(queries),
+        len(representatives),
+        len(queries) - len(representatives),
+        elapsed,
+    )
+
+    members = {}
+    for i, root in enumerate(clusters):
+        members.setdefault(root, []).append(queries[i])
+    largest = sorted(members.values(), key=len, reverse=True)
+    for cluster in largest[: args.show]:
+        print(json.dumps(cluster, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(representatives, file, indent=4, ensure_ascii=False)
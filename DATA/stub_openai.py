@@ -0,0 +1,149 @@
+"""
+stub_openai.py: local stand-in for the OpenAI chat completions endpoint
+
+Answers the prompts of synthetic_data.py after a fixed latency, without an
+API key or network, so the generator can be tried and timed offline:
+
+    python DATA/stub_openai.py --port 8001 --latency 0.5 --error-rate 0.05
+
+A prompt asking for "N unique queries" gets N made up queries, any other
+prompt gets the function calls of the query after its last "USER QUERY:".
+A fraction of requests (--error-rate) is answered with 429 Too Many
+Requests, to exercise the retries.
+"""
+
+import re
+import json
+import time
+import random
+import logging
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+QUERY_TEMPLATES = [
+    "Rotate joint {joint} by {angle} degrees",
+    "Move the TCP along the {axis}-axis by {length} mm",
+    "Give me the current joint values",
+    "Rotate the base by {angle} degrees and move the TCP along {axis} by {length} mm",
+]
+
+
+def make_queries(count):
+    return [
+        random.choice(QUERY_TEMPLATES).format(
+            joint=random.randint(0, 5),
+            angle=random.randint(-180, 180),
+            axis=random.choice("xyz"),
+            length=random.randint(1, 500),
+        )
+        for _ in range(count)
+    ]
+
+
+def make_functions(query):
+    return {
+        "query": query,
+        "functions": [{"function_name": "get_joint_values", "inputs": []}],
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 8001), latency=0.5, error_rate=0.0):
+        """
+        latency: seconds every request takes
+        error_rate: fraction of requests answered with 429
+        """
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+
+    def handle_error(self, request, client_address):
+        # Clients going away mid request, e.g. a stopped generator
+        log.debug("Request of %s failed", client_address, exc_info=True)
+
+    def answer(self, content):
+        match = re.search(r"Generate (\d+) unique queries", content)
+        if match:
+            return {"queries": make_queries(int(match[1]))}
+        query = content.rsplit("USER QUERY:", 1)[-1]
+        return make_functions(query.replace("RESPONSE:", "").strip())
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep connections open between requests, like the real endpoint
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            return self.reply(404, {"error": {"message": "not found"}})
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length))
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        if random.random() < self.server.error_rate:
+            error = {"message": "Rate limit reached", "type": "requests"}
+            return self.reply(429, {"error": error})
+
+        prompt = body["messages"][-1]["content"]
+        content = json.dumps(self.server.answer(prompt))
+        # Rough token counts, enough for the rate limiter
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        self.reply(
+            200,
+            {
+                "id": f"chatcmpl-stub{self.server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.debug("%s " + format, self.address_string(), *args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=args.log_level, format="%(asctime)s %(levelname)s %(message)s"
+    )
+
+    server = StubServer((args.host, args.port), args.latency, args.error_rate)
+    log.info("Serving on http://%s:%i/v1", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,585 @@
+"""
+synthetic_data.py: generates fine-tuning queries and their JSON function
+calls with GPT, many requests at a time
+
+The notebook (synthetic-data-dev.ipynb) makes one blocking chat completion
+call after the other. Here up to `concurrency` calls are in flight at once,
+kept under the requests and tokens per minute of the account (tokens counted
+with tiktoken), and failed calls are retried with exponential backoff.
+
+    python DATA/synthetic_data.py queries --num-examples 50000 --concurrency 64
+    python DATA/synthetic_data.py format DATA/generated-queries.json
+
+Results are appended to a JSONL log (checkpoint.py) as they arrive. Running
+the same command again resumes it: queries already in the log count towards
+--num-examples, and queries already formatted are skipped. Near-duplicate
+queries (dedup.py) are formatted once, by their first occurrence. compact
+turns a log into the final JSON file, and a formatted log also into the
+Arrow dataset for fine-tuning, with near-duplicates kept out of it and
+never split between train and test:
+
+    python DATA/synthetic_data.py compact DATA/formatted-queries.jsonl
+
+Point --base-url at stub_openai.py to try it without an API key:
+
+    python DATA/stub_openai.py --port 8001 --latency 0.5
+    python DATA/synthetic_data.py queries --base-url http://127.0.0.1:8001/v1
+"""
+
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+import openai
+import tiktoken
+from tqdm.auto import tqdm
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from checkpoint import CheckpointLog, read_log
+from dedup import deduplicate, find_clusters, split_clusters
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+DATA_DIR = Path(__file__).resolve().parent
+MODEL_ID = "gpt-3.5-turbo-1106"
+# Limits of the account, per minute
+REQUESTS_PER_MINUTE = 3500
+TOKENS_PER_MINUTE = 60000
+# Errors worth another attempt, everything else fails the call right away
+RETRIED = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+# Completion tokens expected per call, reserved before the call is made
+COMPLETION_TOKENS = {"queries": 30, "format": 200}
+
+PROMPT_JSON = """
+# TASK DESCRIPTION
+Create a dataset for LLM fine-tuning from user queries about industrial robotic operations by formatting them to corresponding JSON function calls.
+
+# JSON PARAMETER VALUES
+- functions: Array of function calls derived from the query, identified using separators like "and", "then", ",", etc.
+- function_name: Specific robot function ("move_tcp", "move_joint", "get_joint_values").
+- input_name: Name of the function's input parameter, specifying the type (integer, float, string).
+- input_value: Value of the input parameter, adhering to the specified type.
+
+# FUNCTIONS EXPLAINED WITH EXAMPLES
+- move_tcp: Moves the robot's TCP. 
+    Inputs: x, y, z (position; type: float), q1, q2, q3, q4 (quaternion values; type: float), unit (correlates to x, y, z; type: str, ["m", "cm", "mm"]). 
+    Example: "Move TCP to coordinates (0.5, 0.3, 0.7) m" translates to x: 0.5, y: 0.3, z: 0.7; unit: m
+- move_joint: Rotates/moves a robot joint. 
+    Inputs: joint (index number; type: array of integers; note: joints go from 0 to n-1), angle (degrees or radians, type: array of floats), unit (correlates to angle; type: str, ["rad", "deg"]). 
+    Example: "Rotate joint 2 by 45 degrees" results in joint: [2], angle: [45], unit: deg.
+- get_joint_values: Retrieves robot joint statuses, no input parameters required. 
+    Example: "Get the current status of robot joints."
+
+# GUIDANCE
+- Focus on verbs and technical terms for function selection.
+- Include only the necessary functions directly implied by the query.
+- Maintain the sequence of functions as in the query.
+- Include only necessary functions as per the query.
+- Specify units only when required, omit default values.
+
+# RESPONSE JSON FORMAT
+{{
+    "query": "<generated_query>",
+    "functions": [
+        {{
+            "function_name": "<name>",
+            "inputs": [
+                {{"name": "<name>", "value": "<value>", "unit": "<unit>"}},
+                {{"name": "<name>", "value": "<value>", "unit": "<unit>"}}
+            ]
+        }},
+        {{
+            "function_name": "<name>",
+            "inputs": [{{"name": "<name>", "value": "<value>", "unit": "<unit>"}}]
+        }}
+    ]
+}}
+
+USER QUERY: Move robot tcp along x and y for 1000mm
+RESPONSE:
+{{
+    'functions': [{{'function_name': 'move_tcp',
+        'inputs': [
+            {{'name': 'x', 'value': 1000.0, 'unit': 'mm'}},
+            {{'name': 'y', 'value': 1000.0, 'unit': 'mm'}}
+            ]
+        }}
+    ]
+}}
+
+USER QUERY: Move robot sixth joint for -30 degrees
+RESPONSE:
+{{
+    'functions': [{{'function_name': 'move_joint',
+        'inputs': [
+            {{'name': 'joint', 'value': [5], 'unit': None}},
+            {{'name': 'angle', 'value': [-30.0], 'unit': 'deg'}}
+            ]
+        }}
+    ]
+}}
+
+USER QUERY: Give me robot joints info
+RESPONSE:
+{{
+    'functions': [{{'function_name': 'get_joint_values',
+        'inputs': []
+        }}
+    ]
+}}
+
+USER QUERY: Rotate robot base for 45 and move TCP along x axis for 50 milimeters.
+RESPONSE:
+{{
+    'functions': [
+        {{'function_name': 'move_joint',
+            'inputs': [
+                {{'name': 'joint', 'value': [0], 'unit': None}},
+                {{'name': 'angle', 'value': [45.0], 'unit': 'deg'}}
+            ]
+        }},
+        {{'function_name': 'move_tcp',
+            'inputs': [{{'name': 'x', 'value': 50.0, 'unit': 'mm'}}]
+        }}
+    ]
+}}
+
+USER QUERY: I want you to rotate joint 2 for 30 and joint 7 for 45 degrees then joint 3 for pi/4
+RESPONSE:
+{{
+    'functions': [
+        {{'function_name': 'move_joint',
+            'inputs': [
+                {{'name': 'joint', 'value': [2, 7], 'unit': None}},
+                {{'name': 'angle', 'value': [30.0, 45.0], 'unit': 'deg'}}
+                ]
+        }},
+        {{'function_name': 'move_joint',
+            'inputs': [
+                {{'name': 'joint', 'value': [3], 'unit': None}},
+                {{'name': 'angle', 'value': [0.785398], 'unit': 'rad'}}
+                ]
+        }}
+    ]
+}}
+
+USER QUERY: {user_query}
+RESPONSE:
+"""
+
+PROMPT_QUERIES = """
+# TASK DESCRIPTION {rand_num}
+Create a dataset for LLM fine-tuning consisting of user queries about industrial robotic operations and their corresponding JSON function calls. Focus on generating queries with varying complexity levels, from simple to advanced, and provide examples in real-world scenarios.
+
+# FUNCTIONS EXPLAINED WITH EXAMPLES
+- move_tcp: Moves the robot's TCP. 
+    Inputs: x, y, z (position; type: float), q1, q2, q3, q4 (quaternion values; type: float), unit (correlates to x, y, z; type: str, ["m", "cm", "mm"]). 
+    Example: "Move TCP to coordinates (0.5, 0.3, 0.7) m" translates to x: 0.5, y: 0.3, z: 0.7; unit: m
+- move_joint: Rotates/moves a robot joint. 
+    Inputs: joint (index number; type: array of integers; note: joints go from 0 to n-1), angle (degrees or radians, type: array of floats), unit (correlates to angle; type: str, ["rad", "deg"]). 
+    Example: "Rotate joint 2 by 45 degrees" results in joint: [2], angle: [45], unit: deg.
+- get_joint_values: Retrieves robot joint statuses, no input parameters required. 
+    Example: "Get the current status of robot joints."
+
+# GUIDANCE
+- Focus on verbs and technical terms for function selection.
+- Ensure queries are deterministic and precise.
+- Queries should vary in complexity, from direct instructions to those requiring contextual understanding.
+- Real-World Scenarios: Frame queries in practical industrial settings.
+
+# RESPONSE FORMAT
+- Return format is JSON.
+- Only one key: "queries"
+- Values are list with strings that are generated queries.
+- Generate {num_examples_per_prompt} unique queries.
+- Query examples:
+    - Move robot tcp along x and y for 1000mm
+    - Move robot sixth joint for -30 degrees
+    - Give me robot joints info
+    - Rotate robot base for 45 and move TCP along x axis for 50 milimeters.
+    - I want you to rotate joint 2 for 30 and joint 7 for 45 degrees then joint 3 for pi/4
+    - 
+- Output format example:
+    {{
+        "queries" : [<generated_query>, <generated_query>, ..., <generated_query>]
+    }}
+
+"""
+
+
+def save_data(output_path, queries):
+    with open(output_path, "w", encoding="utf-8") as file:
+        json.dump(queries, file, indent=4, ensure_ascii=False)
+
+
+def load_encoding(model_id):
+    """
+    tiktoken encoding of model_id, or None if it cannot be loaded (tiktoken
+    downloads it on first use), in which case tokens are estimated
+    """
+    try:
+        return tiktoken.encoding_for_model(model_id)
+    except Exception as e:
+        log.warning("No tiktoken encoding for %s, estimating tokens: %r", model_id, e)
+        return None
+
+
+class RateLimiter:
+    """
+    Token buckets for the requests and the tokens per minute. Both start
+    full and refill continuously, acquire waits until both have room.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.capacity = [requests_per_minute, tokens_per_minute]
+        self.available = list(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        for i, capacity in enumerate(self.capacity):
+            self.available[i] = min(
+                capacity, self.available[i] + elapsed * capacity / 60
+            )
+
+    async def acquire(self, tokens):
+        # A call larger than the whole budget still goes, once it is full
+        needed = [1, min(tokens, self.capacity[1])]
+        # Callers wait in order, the first one in line holds the lock
+        async with self.lock:
+            while True:
+                self.refill()
+                missing = [n - a for n, a in zip(needed, self.available)]
+                if max(missing) <= 0:
+                    break
+                await asyncio.sleep(
+                    max(m * 60 / c for m, c in zip(missing, self.capacity))
+                )
+            self.available[0] -= 1
+            self.available[1] -= needed[1]
+
+    def adjust(self, tokens):
+        """
+        Takes tokens more from the token bucket (fewer if negative), once
+        the real usage of a call is known
+        """
+        self.available[1] -= tokens
+
+
+class Generator:
+    def __init__(
+        self,
+        model_id=MODEL_ID,
+        base_url=None,
+        api_key=None,
+        concurrency=16,
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+        max_attempts=6,
+        timeout=60,
+    ):
+        """
+        base_url: OpenAI compatible endpoint, e.g. stub_openai.py, defaults
+                  to the OpenAI API
+        concurrency: calls in flight at once
+        max_attempts: attempts per call, with exponential backoff between
+        """
+        if api_key is None:
+            # A local endpoint needs no key
+            api_key = os.environ.get("OPENAI_API_KEY", "local" if base_url else None)
+        # Retries are done here, around the rate limiter
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout
+        )
+        self.model_id = model_id
+        self.encoding = load_encoding(model_id)
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_attempts = max_attempts
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.tokens = 0
+
+    def count_tokens(self, messages):
+        # Every message costs a few tokens on top of its content
+        total = 0
+        for message in messages:
+            content = message["content"]
+            if self.encoding is None:
+                total += len(content) // 4 + 4
+            else:
+                total += len(self.encoding.encode(content)) + 4
+        return total + 3
+
+    async def generate_data(
+        self, temperature, messages, frequency_penalty=None, completion_tokens=200
+    ):
+        """
+        The notebook's generate_data: one chat completion in JSON mode,
+        returned parsed
+        """
+        reserved = self.count_tokens(messages) + completion_tokens
+        async for attempt in AsyncRetrying(
+            wait=wait_random_exponential(min=1, max=60),
+            stop=stop_after_attempt(self.max_attempts),
+            retry=retry_if_exception_type(RETRIED),
+            reraise=True,
+        ):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    self.retries += 1
+                await self.limiter.acquire(reserved)
+                self.calls += 1
+                response = await self.client.chat.completions.create(
+                    model=self.model_id,
+                    temperature=temperature,
+                    response_format={"type": "json_object"},
+                    frequency_penalty=frequency_penalty,
+                    messages=messages,
+                )
+        if response.usage is not None:
+            self.tokens += response.usage.total_tokens
+            self.limiter.adjust(response.usage.total_tokens - reserved)
+        return json.loads(response.choices[0].message.content)
+
+    async def run(self, jobs, checkpoint):
+        """
+        Runs the coroutines of jobs, at most concurrency at a time, and
+        appends their records to checkpoint (a CheckpointLog) as each one
+        finishes. A job returns a list of records, empty if it failed.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(job):
+            async with semaphore:
+                try:
+                    return await job
+                except (openai.APIError, json.JSONDecodeError, KeyError) as e:
+                    self.failures += 1
+                    log.error("Call failed: %r", e)
+                    return []
+
+        records = 0
+        tasks = [asyncio.ensure_future(limited(job)) for job in jobs]
+        with tqdm(total=len(tasks)) as progress:
+            for task in asyncio.as_completed(tasks):
+                for record in await task:
+                    checkpoint.append(record)
+                    records += 1
+                progress.update()
+        return records
+
+    async def generate_queries(
+        self, num_examples, checkpoint, num_examples_per_prompt=20
+    ):
+        """
+        Generates queries until checkpoint holds num_examples of them (give
+        or take a prompt), returns how many were added
+        """
+        async def job():
+            messages = [
+                {
+                    "role": "user",
+                    "content": PROMPT_QUERIES.format(
+                        rand_num=round(random.random(), 5),
+                        num_examples_per_prompt=num_examples_per_prompt,
+                    ),
+                },
+            ]
+            result = await self.generate_data(
+                temperature=1,
+                frequency_penalty=round(random.random() * 0.4, 4),
+                messages=messages,
+                completion_tokens=COMPLETION_TOKENS["queries"]
+                * num_examples_per_prompt,
+            )
+            # Check for empty strings
+            return [{"query": query} for query in result["queries"] if len(query)]
+
+        missing = num_examples - len(checkpoint.records)
+        iterations = max(0, math.ceil(missing / num_examples_per_prompt))
+        jobs = [job() for _ in range(iterations)]
+        return await self.run(jobs, checkpoint)
+
+    async def format_queries(self, queries, checkpoint, dedup=True):
+        """
+        Formats every query not formatted in checkpoint yet, returns how
+        many were added. With dedup only the first of near-duplicate
+        queries is formatted.
+        """
+        async def job(query):
+            messages = [
+                {"role": "user", "content": PROMPT_JSON.format(user_query=query)}
+            ]
+            result = await self.generate_data(
+                temperature=0,
+                messages=messages,
+                completion_tokens=COMPLETION_TOKENS["format"],
+            )
+            return [{"query": query, "result": result}]
+
+        queries = list(dict.fromkeys(queries))
+        if dedup:
+            unique = deduplicate(queries)
+            log.info("%i near-duplicate queries skipped", len(queries) - len(unique))
+            queries = unique
+        done = {record["query"] for record in checkpoint.records}
+        jobs = [job(query) for query in queries if query not in done]
+        return await self.run(jobs, checkpoint)
+
+
+def compact(
+    log_path,
+    output_path=None,
+    dataset_path=None,
+    test_size=0.1,
+    seed=None,
+    dedup=True,
+):
+    """
+    Writes the records of a log as the notebook's JSON files: a list of
+    queries for a queries log, a list of (query, result) pairs for a
+    formatted one. A formatted log is also saved as the Arrow dataset of
+    the notebook ({"data": {"user_query", "function_calling"}}, split into
+    train and test) to dataset_path. Returns the paths written.
+
+    dedup: keep only the first query of every cluster of near-duplicates.
+           Either way whole clusters go to train or to test.
+    """
+    records = read_log(log_path)
+    current_dt = datetime.now().strftime("%Y-%b-%d_%H-%M-%S")
+    if not records or "result" not in records[0]:
+        output_path = output_path or DATA_DIR / f"generated-queries_{current_dt}.json"
+        save_data(output_path, [record["query"] for record in records])
+        return [output_path]
+
+    # The last result of a query wins
+    formatted = list({record["query"]: record["result"] for record in records}.items())
+    clusters = find_clusters([query for query, _ in formatted])
+    if dedup:
+        formatted = [pair for i, pair in enumerate(formatted) if clusters[i] == i]
+        clusters = list(range(len(formatted)))
+    output_path = output_path or DATA_DIR / f"formatted-queries_{current_dt}.json"
+    save_data(output_path, formatted)
+
+    from datasets import Dataset, DatasetDict
+
+    dataset_path = dataset_path or DATA_DIR / f"dataset_{current_dt}"
+    splits = {"train": [], "test": []}
+    for (query, result), side in zip(
+        formatted, split_clusters(clusters, test_size, seed)
+    ):
+        splits[side].append({"user_query": query, "function_calling": str(result)})
+    dataset = DatasetDict(
+        {side: Dataset.from_dict({"data": data}) for side, data in splits.items()}
+    )
+    dataset.save_to_disk(str(dataset_path))
+    return [output_path, dataset_path]
+
+
+def main(args):
+    if args.task == "compact":
+        paths = compact(
+            args.input,
+            args.output,
+            args.dataset,
+            seed=args.seed,
+            dedup=not args.keep_duplicates,
+        )
+        for path in paths:
+            log.info("Wrote %s", path)
+        return
+
+    generator = Generator(
+        model_id=args.model,
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_attempts=args.max_attempts,
+    )
+    start = time.perf_counter()
+    if args.task == "queries":
+        log_path = args.log or DATA_DIR / "generated-queries.jsonl"
+        with CheckpointLog(log_path, args.sync_every) as checkpoint:
+            added = asyncio.run(
+                generator.generate_queries(
+                    args.num_examples, checkpoint, args.num_examples_per_prompt
+                )
+            )
+    else:
+        with open(args.input, encoding="utf-8") as file:
+            queries = json.load(file)
+        log_path = args.log or DATA_DIR / "formatted-queries.jsonl"
+        with CheckpointLog(log_path, args.sync_every) as checkpoint:
+            added = asyncio.run(
+                generator.format_queries(
+                    queries, checkpoint, dedup=not args.keep_duplicates
+                )
+            )
+    elapsed = time.perf_counter() - start
+    log.info(
+        "%i records added in %.1f s to %s: %i calls, %i retries, %i failed, "
+        "%i tokens",
+        added,
+        elapsed,
+        log_path,
+        generator.calls,
+        generator.retries,
+        generator.failures,
+        generator.tokens,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("task", choices=["queries", "format", "compact"])
+    parser.add_argument(
+        "input", nargs="?", help="queries to format (JSON list), or log to compact"
+    )
+    parser.add_argument("--log", type=Path, help="JSONL log to append to")
+    parser.add_argument("--sync-every", type=int, default=100)
+    parser.add_argument("--output", type=Path, help="JSON file compact writes")
+    parser.add_argument("--dataset", type=Path, help="Arrow dataset compact writes")
+    parser.add_argument("--seed", type=int, help="of the train/test split")
+    parser.add_argument(
+        "--keep-duplicates",
+        action="store_true",
+        help="format and keep near-duplicate queries too",
+    )
+    parser.add_argument("--num-examples", type=int, default=1000)
+    parser.add_argument("--num-examples-per-prompt", type=int, default=20)
+    parser.add_argument("--model", default=MODEL_ID)
+    parser.add_argument("--base-url", help="OpenAI compatible endpoint to use")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--requests-per-minute", type=float, default=REQUESTS_PER_MINUTE
+    )
+    parser.add_argument("--tokens-per-minute", type=float, default=TOKENS_PER_MINUTE)
+    parser.add_argument("--max-attempts", type=int, default=6)
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    if args.task != "queries" and args.input is None:
+        parser.error(f"{args.task} needs an input file")
+    logging.basicConfig(
+        level=args.log_level, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    main(args)
@@ -1,7 +1,13 @@
+# Functions the model may call, constrained decoding restricts names to these
+FUNCTION_NAMES = ["move_tcp", "move_joint", "get_joint_values"]
+
 choose_function = {
     "type": "object",
     "properties": {
-        "function_name": {"type": "array", "items": {"type": "string"}},
+        "function_name": {
+            "type": "array",
+            "items": {"type": "string", "enum": FUNCTION_NAMES},
+        },
     },
 }
 generic_function = {
@@ -12,7 +18,7 @@ generic_function = {
             "items": {
                 "type": "object",
                 "properties": {
-                    "function_name": {"type": "string"},
+                    "function_name": {"type": "string", "enum": FUNCTION_NAMES},
                     "inputs": {
                         "type": "array",
                         "items": {
@@ -38,7 +44,7 @@ action_list = {
             "items": {
                 "type": "object",
                 "properties": {
-                    "action": {"type": "string"},
+                    "action": {"type": "string", "enum": FUNCTION_NAMES},
                     "action_description": {"type": "string"},
                 },
             },
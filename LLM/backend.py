@@ -0,0 +1,94 @@
+"""
+backend.py: loads the function-calling model once and runs batched generation
+
+    backend = TransformersBackend()
+    backend.generate([classifier_prompt_1.format(user_query=query)])
+
+Prompts of a batch are left padded, so every row continues right where its
+prompt ends and one forward pass per token serves the whole batch.
+
+torch and transformers are imported when a backend is created, so reading
+DEFAULT_MODEL, or importing a module that only needs a backend later on,
+costs nothing. A model already in cache_dir is loaded from there without
+asking the hub, its safetensors weights memory mapped (weights.py).
+"""
+
+from weights import load_model, local_snapshot
+
+DEFAULT_MODEL = "TheBloke/Mistral-7B-Instruct-v0.2-GPTQ"
+WEIGHTS_DIR = "./weights"
+
+
+class TransformersBackend:
+    def __init__(
+        self,
+        model_name_or_path=DEFAULT_MODEL,
+        cache_dir=WEIGHTS_DIR,
+        device=None,
+        model=None,
+        tokenizer=None,
+    ):
+        """
+        model, tokenizer: already loaded ones to use instead of loading
+                          model_name_or_path, e.g. a small test model
+        """
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device)
+        self.model_id = model_name_or_path
+
+        path = None
+        if model is None or tokenizer is None:
+            path = local_snapshot(model_name_or_path, cache_dir)
+        if tokenizer is None:
+            tokenizer = AutoTokenizer.from_pretrained(
+                path or model_name_or_path, trust_remote_code=False, cache_dir=cache_dir
+            )
+        if model is None and path is not None:
+            model = load_model(path)
+        if model is None:
+            model = AutoModelForCausalLM.from_pretrained(
+                path or model_name_or_path,
+                device_map="auto" if self.device.type == "cuda" else None,
+                low_cpu_mem_usage=True,
+                trust_remote_code=False,
+                cache_dir=cache_dir,
+            )
+        else:
+            model = model.to(self.device)
+        self.model = model.eval()
+
+        # Batched generation needs a pad token, and padding on the left
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        self.tokenizer = tokenizer
+
+    def generate(self, prompts, max_new_tokens=256, **generate_kwargs):
+        """
+        Returns the text generated after each prompt. Decoding is greedy
+        unless generate_kwargs say otherwise.
+        """
+        import torch
+
+        with torch.inference_mode():
+            # The templates in prompts.py already start with <s>
+            inputs = self.tokenizer(
+                list(prompts),
+                return_tensors="pt",
+                padding=True,
+                add_special_tokens=False,
+                return_token_type_ids=False,
+            ).to(self.model.device)
+            generate_kwargs.setdefault("do_sample", False)
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **generate_kwargs,
+            )
+            new_tokens = output[:, inputs["input_ids"].shape[1] :]
+            return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
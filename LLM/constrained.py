@@ -0,0 +1,401 @@
+"""
+constrained.py: schema-constrained JSON generation in one generate call
+
+Jsonformer builds the object field by field, and every string or array
+field is a separate generation over the whole prompt plus the partial
+output. Here the schema (see action_models.py) is compiled once into a
+token-level state machine: for every state, which tokens of the vocabulary
+may come next and which state each of them leads to. One generate call then
+produces the whole object, with a logits processor masking every token the
+schema does not allow at that point.
+
+    decoder = ConstrainedDecoder(backend.model, backend.tokenizer)
+    decoder.generate([prompt], generic_function)  # -> [{"functions": [...]}]
+    for text in decoder.stream(prompt, generic_function):  # '{"fun', 'ctions'...
+        ...
+
+Supported schema keywords: type (object, array, string, number, integer,
+boolean), properties, items and enum. Output is compact JSON with every
+property present, in schema order.
+"""
+
+import json
+import queue
+import weakref
+import threading
+
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList
+from transformers.generation.streamers import BaseStreamer
+
+# Characters a JSON string may hold unescaped
+STRING_EXCLUDED = set('"\\') | {chr(c) for c in range(0x20)}
+ESCAPED = set('"\\/bfnrt')
+DIGITS = "0123456789"
+# Whitespace the model may emit before the object starts, at most
+# MAX_LEADING_WHITESPACE characters so it cannot spend its tokens on it
+LEADING_WHITESPACE = " \n"
+MAX_LEADING_WHITESPACE = 2
+
+# tokenizer -> {schema key: TokenAutomaton}
+_compiled = weakref.WeakKeyDictionary()
+
+
+class CharAutomaton:
+    """
+    Deterministic automaton over the characters of the JSON output.
+    transitions[state] maps a character to the next state, string states
+    additionally loop on every character allowed inside a string.
+    """
+
+    def __init__(self, schema):
+        self.transitions = []
+        self.string_states = set()
+        self.start = self.new_state()
+        starts = [self.start]
+        for _ in range(MAX_LEADING_WHITESPACE):
+            after = self.new_state()
+            for c in LEADING_WHITESPACE:
+                self.transitions[starts[-1]][c] = after
+            starts.append(after)
+        self.accept = set(self.build(schema, starts))
+
+    def new_state(self):
+        self.transitions.append({})
+        return len(self.transitions) - 1
+
+    def link(self, states, c, target):
+        for state in states:
+            existing = self.transitions[state].get(c)
+            if existing is not None and existing != target:
+                raise ValueError(f"Ambiguous schema at {c!r}")
+            self.transitions[state][c] = target
+
+    def literal(self, states, text):
+        """
+        Adds text after every state in states, returns its end state
+        """
+        for c in text:
+            target = self.new_state()
+            self.link(states, c, target)
+            states = [target]
+        return states[0]
+
+    def build(self, schema, starts):
+        """
+        Adds a value of schema after every state in starts, returns the
+        states the value can end in
+        """
+        kind = schema.get("type")
+        if "enum" in schema:
+            words = [json.dumps(value) for value in schema["enum"]]
+            return self.build_words(words, starts)
+        if kind == "object":
+            states = [self.literal(starts, "{")]
+            for i, (key, value) in enumerate(schema.get("properties", {}).items()):
+                name = ("," if i else "") + json.dumps(key) + ":"
+                states = self.build(value, [self.literal(states, name)])
+            return [self.literal(states, "}")]
+        if kind == "array":
+            items = schema.get("items", {"type": "string"})
+            opened = self.literal(starts, "[")
+            end = self.new_state()
+            self.link([opened], "]", end)
+            # The first item follows "[", every other one follows ","
+            first = self.build(items, [opened])
+            following = self.new_state()
+            rest = self.build(items, [following])
+            self.link(first + rest, ",", following)
+            self.link(first + rest, "]", end)
+            return [end]
+        if kind == "string":
+            inside = self.literal(starts, '"')
+            self.string_states.add(inside)
+            escape = self.literal([inside], "\\")
+            for c in ESCAPED:
+                self.link([escape], c, inside)
+            return [self.literal([inside], '"')]
+        if kind in ("number", "integer"):
+            sign = self.new_state()
+            whole = self.new_state()
+            self.link(starts, "-", sign)
+            for c in DIGITS:
+                self.link(starts + [sign, whole], c, whole)
+            if kind == "integer":
+                return [whole]
+            point = self.literal([whole], ".")
+            fraction = self.new_state()
+            for c in DIGITS:
+                self.link([point, fraction], c, fraction)
+            return [whole, fraction]
+        if kind == "boolean":
+            return self.build_words(["true", "false"], starts)
+        raise ValueError(f"Unsupported schema: {schema}")
+
+    def build_words(self, words, starts):
+        """
+        Adds a trie of words after every state in starts, returns the
+        states the words end in. Words may be prefixes of each other.
+        """
+        ends = []
+        for word in words:
+            states = starts
+            for c in word:
+                existing = self.transitions[states[0]].get(c)
+                if existing is None:
+                    existing = self.new_state()
+                    self.link(states, c, existing)
+                states = [existing]
+            ends.extend(states)
+        return ends
+
+    def step(self, state, c):
+        target = self.transitions[state].get(c)
+        if target is None and state in self.string_states and c not in STRING_EXCLUDED:
+            return state
+        return target
+
+
+def token_texts(tokenizer):
+    """
+    Text every token adds to the output, None for special tokens and for
+    tokens that are not whole characters (e.g. single UTF-8 bytes)
+    """
+    # Decode every token after an anchor, so tokenizers that drop a leading
+    # space at the start of the text keep it here
+    anchor = tokenizer.encode("a", add_special_tokens=False)
+    prefix = tokenizer.decode(anchor, clean_up_tokenization_spaces=False)
+    decoded = tokenizer.batch_decode(
+        [anchor + [token] for token in range(len(tokenizer))],
+        clean_up_tokenization_spaces=False,
+    )
+    special = set(tokenizer.all_special_ids)
+    texts = []
+    for token, text in enumerate(decoded):
+        if token in special or not text.startswith(prefix):
+            texts.append(None)
+            continue
+        text = text[len(prefix) :]
+        texts.append(text if text and "�" not in text else None)
+    return texts
+
+
+class TokenAutomaton:
+    """
+    CharAutomaton lifted to the tokens of one tokenizer: next_states[state]
+    maps every token allowed in state to the state after it, and
+    masks[state] is True for every token that is not allowed.
+    """
+
+    def __init__(self, schema, tokenizer):
+        chars = CharAutomaton(schema)
+        self.eos_token_id = tokenizer.eos_token_id
+        # Trie over the token texts, node = (children, tokens ending here)
+        trie = ({}, [])
+        for token, text in enumerate(token_texts(tokenizer)):
+            if text is None:
+                continue
+            node = trie
+            for c in text:
+                node = node[0].setdefault(c, ({}, []))
+            node[1].append(token)
+
+        self.next_states = []
+        for state in range(len(chars.transitions)):
+            allowed = {}
+            self.walk(chars, trie, state, state, allowed)
+            if state in chars.accept:
+                allowed[self.eos_token_id] = None
+            self.next_states.append(allowed)
+        self.start = chars.start
+        self.vocab_size = len(tokenizer)
+        self.masks = None
+
+    def walk(self, chars, node, start, state, allowed):
+        # Follow every branch of the trie the character automaton accepts
+        for c, child in node[0].items():
+            target = chars.step(state, c)
+            if target is None:
+                continue
+            for token in child[1]:
+                allowed[token] = target
+            self.walk(chars, child, start, target, allowed)
+
+    def mask(self, state, size, device):
+        """
+        Boolean mask of the tokens not allowed in state, for scores with
+        size columns (models may have more columns than the tokenizer)
+        """
+        if self.masks is None or self.masks.shape[1] != size:
+            masks = torch.ones(len(self.next_states), size, dtype=torch.bool)
+            for i, allowed in enumerate(self.next_states):
+                masks[i, list(allowed)] = False
+            self.masks = masks
+        if self.masks.device != device:
+            self.masks = self.masks.to(device)
+        return self.masks[state]
+
+
+def compile_schema(schema, tokenizer):
+    """
+    Returns the TokenAutomaton of schema for tokenizer, compiled once per
+    schema and tokenizer
+    """
+    by_schema = _compiled.setdefault(tokenizer, {})
+    key = json.dumps(schema, sort_keys=True)
+    if key not in by_schema:
+        by_schema[key] = TokenAutomaton(schema, tokenizer)
+    return by_schema[key]
+
+
+class SchemaLogitsProcessor(LogitsProcessor):
+    """
+    Tracks the automaton state of every row of a batch from the tokens
+    generated so far, and masks the scores of every token not allowed next
+    """
+
+    def __init__(self, automaton, prompt_length):
+        self.automaton = automaton
+        self.prompt_length = prompt_length
+        self.states = None
+
+    def __call__(self, input_ids, scores):
+        if self.states is None:
+            self.states = [self.automaton.start] * input_ids.shape[0]
+        elif input_ids.shape[1] > self.prompt_length:
+            last = input_ids[:, -1].tolist()
+            for row, (state, token) in enumerate(zip(self.states, last)):
+                if state is not None:
+                    self.states[row] = self.automaton.next_states[state].get(token)
+
+        eos = self.automaton.eos_token_id
+        for row, state in enumerate(self.states):
+            if state is None:
+                # Finished (or off the rails): only end of sequence is left
+                scores[row, :] = -float("inf")
+                scores[row, eos] = 0
+            elif len(self.automaton.next_states[state]):
+                mask = self.automaton.mask(state, scores.shape[1], scores.device)
+                scores[row, mask] = -float("inf")
+            else:
+                scores[row, :] = -float("inf")
+                scores[row, eos] = 0
+        return scores
+
+
+class ConstrainedDecoder:
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+
+    def generate_ids(self, prompts, schema, max_new_tokens=256, **generate_kwargs):
+        """
+        Returns the output token ids of prompts and the (padded) length of
+        their prompt
+        """
+        automaton = compile_schema(schema, self.tokenizer)
+        inputs = self.tokenizer(
+            list(prompts),
+            return_tensors="pt",
+            padding=True,
+            add_special_tokens=False,
+            return_token_type_ids=False,
+        ).to(self.model.device)
+        prompt_length = inputs["input_ids"].shape[1]
+        generate_kwargs.setdefault("do_sample", False)
+        output = self.model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=self.tokenizer.pad_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            logits_processor=LogitsProcessorList(
+                [SchemaLogitsProcessor(automaton, prompt_length)]
+            ),
+            **generate_kwargs,
+        )
+        return output, prompt_length
+
+    @torch.inference_mode()
+    def generate(self, prompts, schema, max_new_tokens=256, **generate_kwargs):
+        """
+        Returns one object matching schema per prompt, None for a prompt
+        whose output did not complete within max_new_tokens
+        """
+        output, prompt_length = self.generate_ids(
+            prompts, schema, max_new_tokens, **generate_kwargs
+        )
+        texts = self.tokenizer.batch_decode(
+            output[:, prompt_length:], skip_special_tokens=True
+        )
+        results = []
+        for text in texts:
+            try:
+                results.append(json.loads(text))
+            except json.JSONDecodeError:
+                results.append(None)
+        return results
+
+    def stream(self, prompt, schema, max_new_tokens=256, **generate_kwargs):
+        """
+        Yields the output of one prompt piece by piece, as its tokens are
+        generated (in a background thread). The pieces join into the text
+        generate would parse.
+        """
+        streamer = TextStreamer(self.tokenizer)
+        errors = []
+
+        @torch.inference_mode()
+        def run():
+            try:
+                self.generate_ids(
+                    [prompt],
+                    schema,
+                    max_new_tokens,
+                    streamer=streamer,
+                    **generate_kwargs,
+                )
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        while True:
+            text = streamer.queue.get()
+            if text is None:
+                break
+            yield text
+        thread.join()
+        if errors:
+            raise errors[0]
+
+
+class TextStreamer(BaseStreamer):
+    """
+    Queue of the text of each new token. transformers' TextIteratorStreamer
+    holds text back until a space, and the compact JSON has none.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.queue = queue.Queue()
+        self.tokens = None
+        self.sent = 0
+
+    def put(self, value):
+        if self.tokens is None:
+            # generate passes the prompt first
+            self.tokens = []
+            return
+        self.tokens.extend(value.reshape(-1).tolist())
+        text = self.tokenizer.decode(self.tokens, skip_special_tokens=True)
+        # A character split over tokens waits for its last one
+        if len(text) > self.sent and not text.endswith("\ufffd"):
+            self.queue.put(text[self.sent :])
+            self.sent = len(text)
+
+    def end(self):
+        self.queue.put(None)
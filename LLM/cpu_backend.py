@@ -0,0 +1,57 @@
+"""
+cpu_backend.py: the function-calling model on machines without a GPU
+
+The GPTQ/AWQ checkpoints need CUDA kernels. CPUBackend loads the full
+precision model instead and quantizes the weights of every linear layer to
+int8 with torch dynamic quantization: activations are quantized on the fly,
+and the matrix multiplications run on the int8 CPU kernels (fbgemm on x86,
+qnnpack on ARM). That roughly halves the memory of the linear layers
+compared to float16 and speeds up decoding on CPU.
+
+It has the interface of TransformersBackend, so the inference server and
+ConstrainedDecoder take it as it is:
+
+    backend = CPUBackend()
+    backend.generate([classifier_prompt_1.format(user_query=query)])
+"""
+
+from backend import WEIGHTS_DIR, TransformersBackend
+
+# Full precision model the GPTQ checkpoint of backend.py was quantized from
+CPU_MODEL = "mistralai/Mistral-7B-Instruct-v0.2"
+
+
+class CPUBackend(TransformersBackend):
+    def __init__(
+        self,
+        model_name_or_path=CPU_MODEL,
+        cache_dir=WEIGHTS_DIR,
+        model=None,
+        tokenizer=None,
+        quantize=True,
+        num_threads=None,
+    ):
+        """
+        model, tokenizer: already loaded ones to use instead of loading
+                          model_name_or_path, e.g. a small test model
+        quantize: False keeps the float32 weights, e.g. to compare against
+        num_threads: threads torch uses for the matrix multiplications,
+                     defaults to torch's own choice (the physical cores)
+        """
+        import torch
+        from torch.ao.quantization import quantize_dynamic
+
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        super().__init__(
+            model_name_or_path,
+            cache_dir=cache_dir,
+            device="cpu",
+            model=model,
+            tokenizer=tokenizer,
+        )
+        self.quantized = quantize
+        if quantize:
+            self.model = quantize_dynamic(
+                self.model.float(), {torch.nn.Linear}, dtype=torch.qint8
+            )
@@ -0,0 +1,285 @@
+"""
+dispatch.py: executes generic_function calls on the robot while they are generated
+
+A compound query ("rotate the base by 45 degrees, then move the TCP 50 mm
+along x") used to wait for the whole JSON before anything moved. Here the
+output is parsed as it streams in: every functions[i] object is handed to
+the robot as soon as its closing brace is generated, while the model goes
+on with the next one.
+
+    dispatcher = MotionDispatcher(robot)  # functions/abb.py Robot
+    report = stream_to_robot(decoder.stream(prompt, generic_function), dispatcher)
+    report["first_motion_s"]  # time to first motion
+
+The calls are mapped onto the robot like this, values being in the units of
+classifier_prompt_1 (radians and millimeters):
+
+    move_joint        joint += angle, set_joints of all six joints
+    move_tcp          x/y/z position, offsets with relative "true" (as
+                      fast_path.py fills it in), q1..q4 orientation,
+                      set_cartesian
+    get_joint_values  get_joints
+
+Calls wait in a bounded queue and run one after another on a worker thread.
+After a call fails, the ones behind it are dropped, the robot never runs a
+later step of an instruction whose earlier step did not happen. The calls
+that ran before the failure, or before an output that never completed,
+are not undone.
+"""
+
+import json
+import math
+import time
+import queue
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+NUM_JOINTS = 6
+
+
+class CallParser:
+    """
+    Incremental parser of a generic_function object: feed it the output as
+    it is generated, it returns each functions[i] object once complete
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.position = 0
+        # Open containers, "{" or "["
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_string = None
+        # Depth of the functions array, and start of its current item
+        self.array_depth = None
+        self.item_start = None
+        self.done = False
+
+    def feed(self, text):
+        """
+        Returns the calls completed by text, a dict each
+        """
+        self.text += text
+        calls = []
+        for i in range(self.position, len(self.text)):
+            char = self.text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    self.last_string = self.text[self.string_start : i]
+            elif char == '"':
+                self.in_string = True
+                self.string_start = i + 1
+            elif char in "{[":
+                if char == "[" and self.stack == ["{"]:
+                    if self.last_string == "functions":
+                        self.array_depth = 2
+                elif char == "{" and len(self.stack) == self.array_depth:
+                    self.item_start = i
+                self.stack.append(char)
+            elif char in "}]":
+                if not self.stack:
+                    raise ValueError(f"Unbalanced {char!r} at {i}")
+                self.stack.pop()
+                depth = len(self.stack)
+                if char == "}" and self.item_start is not None:
+                    if depth == self.array_depth:
+                        calls.append(json.loads(self.text[self.item_start : i + 1]))
+                        self.item_start = None
+                elif char == "]" and self.array_depth and depth < self.array_depth:
+                    self.array_depth = None
+                if not self.stack:
+                    self.done = True
+        self.position = len(self.text)
+        return calls
+
+
+def call_inputs(call):
+    return {
+        item.get("input_name"): item.get("input_value")
+        for item in call.get("inputs", [])
+    }
+
+
+def reply_ok(reply):
+    # Replies of the SERVER module are "<code> <ok> ...", ok being 1
+    if isinstance(reply, str):
+        reply = reply.encode()
+    return bool(reply) and reply.split()[1:2] == [b"1"]
+
+
+class MotionDispatcher:
+    def __init__(self, robot, maxsize=8, relative_tcp=False):
+        """
+        robot: functions/abb.py Robot, or anything with its set_joints,
+               get_joints, set_cartesian and get_cartesian
+        maxsize: calls waiting for the robot, submit blocks while full
+        relative_tcp: move_tcp x/y/z without a relative input are offsets
+                      from the current position, as in "move the TCP 50 mm
+                      along x", rather than the position to move to as the
+                      schema of classifier_prompt_1 has them
+        """
+        self.robot = robot
+        self.relative_tcp = relative_tcp
+        self.queue = queue.Queue(maxsize)
+        # (call, return value of the robot) of every call that ran
+        self.results = []
+        self.error = None
+        self.dropped = 0
+        # perf_counter when the first motion command was sent, and when the
+        # robot replied to it
+        self.first_motion = None
+        self.first_motion_done = None
+        # Last commanded joints and pose, so consecutive moves do not read
+        # them back from the robot. A move of one invalidates the other.
+        self.joints = None
+        self.pose = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, call):
+        self.queue.put(call)
+
+    def close(self):
+        """
+        Waits for the submitted calls to finish, returns the results
+        """
+        self.queue.put(None)
+        self.thread.join()
+        return self.results
+
+    def run(self):
+        while True:
+            call = self.queue.get()
+            if call is None:
+                break
+            if self.error is not None:
+                self.dropped += 1
+                log.warning("Dropping %s after a failed call", call)
+                continue
+            try:
+                self.results.append((call, self.execute(call)))
+            except Exception as e:
+                self.error = e
+                log.error("Call %s failed: %r", call, e)
+
+    def execute(self, call):
+        name = call.get("function_name")
+        inputs = call_inputs(call)
+        if name == "get_joint_values":
+            return self.robot.get_joints()
+        if name == "move_joint":
+            return self.move_joint(inputs)
+        if name == "move_tcp":
+            return self.move_tcp(inputs)
+        raise ValueError(f"Unknown function {name!r}")
+
+    def move_joint(self, inputs):
+        joint = int(float(inputs["joint"]))
+        if not 0 <= joint < NUM_JOINTS:
+            raise ValueError(f"No joint {joint}")
+        # Radians to the angular unit of the robot, scale_angle is degrees
+        # per unit
+        angle = math.degrees(float(inputs["angle"]))
+        angle /= getattr(self.robot, "scale_angle", 1.0)
+        if self.joints is None:
+            self.joints = list(self.robot.get_joints())
+        target = list(self.joints)
+        target[joint] += angle
+        reply = self.motion(self.robot.set_joints, target)
+        self.joints, self.pose = target, None
+        return reply
+
+    def move_tcp(self, inputs):
+        # Millimeters to the linear unit of the robot, which set_cartesian
+        # takes. self.pose is kept in that unit, get_cartesian returns
+        # millimeters whatever the unit.
+        scale = getattr(self.robot, "scale_linear", 1.0)
+        if self.pose is None:
+            position, orientation = self.robot.get_cartesian()
+            self.pose = [[p / scale for p in position], list(orientation)]
+        position, orientation = list(self.pose[0]), list(self.pose[1])
+        relative = inputs.get("relative")
+        if relative in (None, ""):
+            relative = self.relative_tcp
+        elif str(relative).lower() in ("true", "false"):
+            relative = str(relative).lower() == "true"
+        else:
+            raise ValueError(f"relative must be true or false, not {relative!r}")
+        for axis, name in enumerate("xyz"):
+            if inputs.get(name) not in (None, ""):
+                value = float(inputs[name]) / scale
+                if relative:
+                    position[axis] += value
+                else:
+                    position[axis] = value
+        quaternion = [inputs.get(f"q{i}") for i in range(1, 5)]
+        if all(q not in (None, "") for q in quaternion):
+            orientation = [float(q) for q in quaternion]
+        target = [position, orientation]
+        reply = self.motion(self.robot.set_cartesian, target)
+        self.pose, self.joints = target, None
+        return reply
+
+    def motion(self, command, target):
+        if self.first_motion is None:
+            self.first_motion = time.perf_counter()
+        reply = command(target)
+        if self.first_motion_done is None:
+            self.first_motion_done = time.perf_counter()
+        if not reply_ok(reply):
+            raise RuntimeError(f"Robot rejected {command.__name__}({target}): {reply}")
+        return reply
+
+
+def stream_to_robot(chunks, dispatcher):
+    """
+    Parses chunks (pieces of generated text, e.g. ConstrainedDecoder.stream)
+    and submits every call to dispatcher as soon as it is complete. Returns
+    when the robot is done, with the times from the start, in seconds:
+
+        first_call_s       the first call was complete
+        first_motion_s     its motion command was sent (time to first motion)
+        generated_s        the output was complete
+        done_s             the robot finished the last call
+    """
+    start = time.perf_counter()
+    parser = CallParser()
+    first_call = None
+    calls = 0
+    try:
+        for text in chunks:
+            for call in parser.feed(text):
+                if first_call is None:
+                    first_call = time.perf_counter()
+                calls += 1
+                dispatcher.submit(call)
+    finally:
+        generated = time.perf_counter()
+        results = dispatcher.close()
+    done = time.perf_counter()
+
+    def since_start(moment):
+        return None if moment is None else moment - start
+
+    return {
+        "calls": calls,
+        "complete": parser.done,
+        "results": results,
+        "error": dispatcher.error,
+        "dropped": dispatcher.dropped,
+        "first_call_s": since_start(first_call),
+        "first_motion_s": since_start(dispatcher.first_motion),
+        "first_motion_done_s": since_start(dispatcher.first_motion_done),
+        "generated_s": since_start(generated),
+        "done_s": since_start(done),
+    }
@@ -0,0 +1,386 @@
+"""
+evaluate.py: accuracy and latency of the function-calling pipeline
+
+Replays labelled queries through a predictor, in batches of batch_size with
+up to `workers` batches in flight, and reports:
+
+    sequence_accuracy    the called functions, in order, match the label
+    argument_accuracy    ... and so do all of their arguments
+    answered             share of queries with any answer (the fast path
+                         answers None for queries it leaves to the LLM)
+    p50_ms, p99_ms       latency of the batch a query was in
+    queries_per_s        over the wall time of the whole run
+
+Labels and predictions are compared in one form: one call per joint for
+move_joint, angles in radians and TCP coordinates in millimeters, since the
+dataset labels group joints and keep the units of the query while the
+pipeline (classifier_prompt_1) does not.
+
+Data:
+    test     the test split of the Arrow dataset in DATA/
+    choice   LLM/tests/functions_choice.jsonl, function names only
+
+Backends: fast_path, tiny (random model, for the mechanics), gpu
+(backend.TransformersBackend), cpu (cpu_backend.CPUBackend) and server (a
+running inference_server.py). --cache puts a QueryCache in front of any.
+
+    python LLM/evaluate.py --backend fast_path
+    python LLM/evaluate.py --backend cpu --batch-size 4 --limit 50
+    python LLM/evaluate.py --backend server --url http://127.0.0.1:8000 --workers 8
+"""
+
+import ast
+import json
+import math
+import time
+import argparse
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import prompts
+import action_models
+
+ROOT = Path(__file__).resolve().parents[1]
+TEST_DATASET = ROOT / "DATA" / "dataset_2024-Jan-30_23-29-10"
+CHOICE_FILE = ROOT / "LLM" / "tests" / "functions_choice.jsonl"
+
+# Unit: factor to millimeters, or to radians
+UNITS = {
+    "mm": 1.0,
+    "cm": 10.0,
+    "m": 1000.0,
+    "micrometers": 0.001,
+    "deg": math.pi / 180,
+    "rad": 1.0,
+    None: 1.0,
+}
+# Relative tolerance of argument values, labels are rounded (pi/4 = 0.785398)
+TOLERANCE = 1e-4
+
+
+def load_test_split(path=TEST_DATASET, split="test"):
+    """
+    Returns [(query, label)] of the Arrow dataset, label in the form of
+    canonical_label
+    """
+    from datasets import load_from_disk
+
+    examples = []
+    for row in load_from_disk(str(path))[split]["data"]:
+        text = row["function_calling"]
+        if text.startswith("{{"):
+            # The queries outside of the robot functions were saved as JSON
+            # with the braces of their format string doubled
+            label = json.loads(text.replace("{{", "{").replace("}}", "}"))
+        else:
+            label = ast.literal_eval(text)
+        examples.append((row["user_query"], canonical_label(label)))
+    return examples
+
+
+def load_choice(path=CHOICE_FILE):
+    """
+    Returns [(query, label)] of functions_choice.jsonl, whose labels only
+    hold function names (arguments None)
+    """
+    examples = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                example = json.loads(line)
+                names = example["output"]
+                examples.append((example["query"], [(name, None) for name in names]))
+    return examples
+
+
+def number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def as_list(value):
+    if isinstance(value, str) and value.startswith("["):
+        value = json.loads(value)
+    return value if isinstance(value, list) else [value]
+
+
+def canonical_label(label):
+    """
+    [(function_name, arguments)] of a dataset label, {"functions": [{
+    "function_name", "inputs": [{"name", "value", "unit"}]}]}
+    """
+    calls = []
+    for function in label["functions"]:
+        name = function["function_name"]
+        if not name:
+            continue
+        inputs = {item["name"]: item for item in function["inputs"]}
+        if name == "move_joint" and "joint" in inputs:
+            joints = as_list(inputs["joint"]["value"])
+            angle = inputs.get("angle", {})
+            angles = as_list(angle.get("value"))
+            if len(angles) == 1:
+                angles = angles * len(joints)
+            scale = UNITS.get(angle.get("unit"), 1.0)
+            for joint, value in zip(joints, angles):
+                value = number(value)
+                if isinstance(value, float):
+                    value *= scale
+                calls.append((name, {"joint": number(joint), "angle": value}))
+            continue
+        arguments = {}
+        for key, item in inputs.items():
+            value = number(item["value"])
+            if isinstance(value, float):
+                value *= UNITS.get(item.get("unit"), 1.0)
+            arguments[key] = value
+        calls.append((name, arguments))
+    return calls
+
+
+def canonical_prediction(prediction):
+    """
+    [(function_name, arguments)] of a generic_function object, None for no
+    answer. Values are already in radians and millimeters.
+    """
+    if prediction is None:
+        return None
+    calls = []
+    for function in prediction.get("functions", []):
+        name = function.get("function_name")
+        if not name:
+            continue
+        arguments = {
+            item.get("input_name"): number(item.get("input_value"))
+            for item in function.get("inputs", [])
+            # The labels do not tell offsets from positions
+            if item.get("input_name") != "relative"
+        }
+        if name == "move_joint" and isinstance(arguments.get("joint"), str):
+            # "[2, 7]": one call per joint, as in the labels
+            joints = as_list(arguments["joint"])
+            angles = as_list(arguments.get("angle"))
+            if len(angles) == 1:
+                angles = angles * len(joints)
+            for joint, angle in zip(joints, angles):
+                calls.append((name, {"joint": number(joint), "angle": number(angle)}))
+            continue
+        calls.append((name, arguments))
+    return calls
+
+
+def same_value(a, b):
+    if isinstance(a, float) and isinstance(b, float):
+        return math.isclose(a, b, rel_tol=TOLERANCE, abs_tol=TOLERANCE)
+    return a == b
+
+
+def score(label, prediction):
+    """
+    Returns (functions match, arguments match or None if the label has no
+    arguments)
+    """
+    has_arguments = all(arguments is not None for _, arguments in label)
+    if prediction is None:
+        return False, False if has_arguments else None
+    names = [name for name, _ in label] == [name for name, _ in prediction]
+    if not has_arguments:
+        return names, None
+    arguments = names and all(
+        set(expected) == set(got)
+        and all(same_value(expected[key], got[key]) for key in expected)
+        for (_, expected), (_, got) in zip(label, prediction)
+    )
+    return names, arguments
+
+
+def evaluate(examples, predict, batch_size=8, workers=1):
+    """
+    Runs predict (a list of queries to a list of generic_function objects
+    or None) over examples, [(query, label)], and returns the metrics,
+    None for the ones of no examples
+    """
+    batches = [
+        examples[i : i + batch_size] for i in range(0, len(examples), batch_size)
+    ]
+
+    def run(batch):
+        start = time.perf_counter()
+        predictions = predict([query for query, _ in batch])
+        return time.perf_counter() - start, predictions
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outcomes = list(pool.map(run, batches))
+    elapsed = time.perf_counter() - start
+
+    latencies, sequence, arguments, labelled, answered = [], 0, 0, 0, 0
+    failures = []
+    for batch, (latency, predictions) in zip(batches, outcomes):
+        for (query, label), prediction in zip(batch, predictions):
+            latencies.append(latency)
+            prediction = canonical_prediction(prediction)
+            answered += prediction is not None
+            names, values = score(label, prediction)
+            sequence += names
+            if values is not None:
+                labelled += 1
+                arguments += values
+            if not names or values is False:
+                failures.append({"query": query, "label": label, "got": prediction})
+
+    def share(count, total):
+        return count / total if total else None
+
+    ordered = sorted(latency * 1000 for latency in latencies)
+    return {
+        "queries": len(examples),
+        "sequence_accuracy": share(sequence, len(examples)),
+        "argument_accuracy": share(arguments, labelled),
+        "answered": share(answered, len(examples)),
+        "p50_ms": statistics.median(ordered) if ordered else None,
+        "p99_ms": ordered[round(0.99 * (len(ordered) - 1))] if ordered else None,
+        "queries_per_s": share(len(examples), elapsed) if examples else None,
+        "failures": failures,
+    }
+
+
+def llm_predictor(backend, template="classifier_prompt_1", max_new_tokens=256):
+    """
+    Constrained generation of generic_function on backend (anything with
+    model and tokenizer, e.g. TransformersBackend or CPUBackend)
+    """
+    from constrained import ConstrainedDecoder
+
+    decoder = ConstrainedDecoder(backend.model, backend.tokenizer)
+    template = getattr(prompts, template)
+
+    def predict(queries):
+        texts = [template.format(user_query=query) for query in queries]
+        return decoder.generate(
+            texts, action_models.generic_function, max_new_tokens=max_new_tokens
+        )
+
+    return predict
+
+
+def fast_path_predictor():
+    from fast_path import parse
+
+    return lambda queries: [parse(query) for query in queries]
+
+
+def server_predictor(url, template="classifier_prompt_1", max_new_tokens=256):
+    """
+    One request per query to a running inference_server.py, which batches
+    concurrent ones itself
+    """
+    from inference_server import generate
+
+    def predict(queries):
+        return [
+            generate(
+                url,
+                template=template,
+                user_query=query,
+                schema="generic_function",
+                max_new_tokens=max_new_tokens,
+            )["json"]
+            for query in queries
+        ]
+
+    return predict
+
+
+def cached_predictor(cache, predict, **context):
+    """
+    Answers queries from cache (a QueryCache) and only predicts the others
+    """
+
+    def cached(queries):
+        results = [cache.get(query, **context) for query in queries]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            predicted = predict([queries[i] for i in missing])
+            for i, result in zip(missing, predicted):
+                results[i] = result
+                if result is not None:
+                    cache.put(queries[i], result, **context)
+        return results
+
+    return cached
+
+
+def build_predictor(args):
+    if args.backend == "fast_path":
+        return fast_path_predictor(), "fast_path"
+    if args.backend == "server":
+        return server_predictor(args.url, max_new_tokens=args.max_new_tokens), args.url
+    if args.backend == "tiny":
+        from backend import TransformersBackend
+        from tiny_model import build_tiny_model
+
+        model, tokenizer = build_tiny_model()
+        backend = TransformersBackend("tiny", model=model, tokenizer=tokenizer)
+    elif args.backend == "cpu":
+        from cpu_backend import CPU_MODEL, CPUBackend
+
+        backend = CPUBackend(args.model or CPU_MODEL)
+    else:
+        from backend import DEFAULT_MODEL, TransformersBackend
+
+        backend = TransformersBackend(args.model or DEFAULT_MODEL)
+    predictor = llm_predictor(backend, max_new_tokens=args.max_new_tokens)
+    return predictor, backend.model_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--backend",
+        choices=["fast_path", "tiny", "gpu", "cpu", "server"],
+        default="fast_path",
+    )
+    parser.add_argument("--model", help="model of the gpu or cpu backend")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--data", choices=["test", "choice", "all"], default="all")
+    parser.add_argument("--dataset", default=str(TEST_DATASET))
+    parser.add_argument("--limit", type=int, help="first queries of every data set")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--cache", help="SQLite file of a QueryCache to use")
+    parser.add_argument("--show-failures", type=int, default=0)
+    args = parser.parse_args()
+
+    predict, model_id = build_predictor(args)
+    if args.cache:
+        from query_cache import QueryCache
+
+        context = {
+            "model": model_id,
+            "template": prompts.classifier_prompt_1,
+            "schema": action_models.generic_function,
+            "max_new_tokens": args.max_new_tokens,
+        }
+        predict = cached_predictor(QueryCache(args.cache), predict, **context)
+
+    data = {}
+    if args.data in ("test", "all"):
+        data["test"] = load_test_split(args.dataset)
+    if args.data in ("choice", "all"):
+        data["choice"] = load_choice()
+
+    results = {"backend": args.backend, "model": model_id}
+    for name, examples in data.items():
+        metrics = evaluate(
+            examples[: args.limit], predict, args.batch_size, args.workers
+        )
+        failures = metrics.pop("failures")
+        results[name] = metrics
+        for failure in failures[: args.show_failures]:
+            print(json.dumps(failure))
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,298 @@
+"""
+fast_path.py: rule-based parser for the common, unambiguous commands
+
+    "Rotate joint 2 by 30 degrees"
+    "Move TCP to (300, 150, 200) mm"
+    "Give me joint values"
+
+are parsed straight into the generic_function structure of action_models.py,
+with the conventions of classifier_prompt_1: joints are indexed from 0 (the
+base is joint 0), angles are in radians and TCP coordinates in millimeters.
+All values are strings, as the schema has them. move_tcp gets a relative
+input as well, which the schema leaves out: "true" for a move along an axis,
+"false" for a move to coordinates (see dispatch.py).
+
+A query is only parsed if every clause of it matches a rule exactly. Anything
+else (directions like "left", missing units, unknown joints, ...) returns
+None, and FastPath hands the query to the LLM instead.
+"""
+
+import re
+import math
+import time
+
+JOINTS = 6
+
+ORDINALS = {
+    "first": 1,
+    "second": 2,
+    "third": 3,
+    "fourth": 4,
+    "fifth": 5,
+    "sixth": 6,
+    "last": 6,
+}
+
+# Unit: factor to millimeters
+LENGTH_UNITS = {
+    "mm": 1.0,
+    "millimeter": 1.0,
+    "millimeters": 1.0,
+    "millimetre": 1.0,
+    "millimetres": 1.0,
+    "milimeters": 1.0,
+    "cm": 10.0,
+    "centimeter": 10.0,
+    "centimeters": 10.0,
+    "centimetre": 10.0,
+    "centimetres": 10.0,
+    "m": 1000.0,
+    "meter": 1000.0,
+    "meters": 1000.0,
+    "metre": 1000.0,
+    "metres": 1000.0,
+    "inch": 25.4,
+    "inches": 25.4,
+}
+
+# Unit: factor to radians
+ANGLE_UNITS = {
+    "degree": math.pi / 180,
+    "degrees": math.pi / 180,
+    "deg": math.pi / 180,
+    "°": math.pi / 180,
+    "radian": 1.0,
+    "radians": 1.0,
+    "rad": 1.0,
+}
+
+# Words that separate the clauses of a compound command, commas only
+# outside of parentheses
+CLAUSE_SPLIT = re.compile(
+    r"\s*(?:,(?![^()]*\))\s*(?:and\s+)?(?:then\s+)?|;\s*|\band then\b|\bthen\b"
+    r"|\bfollowed by\b|\band simultaneously\b|\band\b)\s*"
+)
+
+NUMBER = r"[-+]?\d+(?:\.\d+)?"
+# 45, -30.5, pi, -pi/4, 2pi/3, 2*pi, pi / 2
+ANGLE = rf"[-+]?(?:\d+(?:\.\d+)?\s*\*?\s*)?pi(?:\s*/\s*\d+(?:\.\d+)?)?|{NUMBER}"
+
+JOINT_PATTERNS = [
+    (re.compile(r"\bbase\b"), lambda m: 1),
+    (re.compile(r"\bjoint\s*(?:number\s*|no\.?\s*|#\s*)?(\d+)\b"), lambda m: int(m[1])),
+    (
+        re.compile(r"\b(\d+)(?:st|nd|rd|th)\s+(?:robot\s+|arm\s+)?joint\b"),
+        lambda m: int(m[1]),
+    ),
+    (
+        re.compile(r"\b(" + "|".join(ORDINALS) + r")\s+(?:robot\s+|arm\s+)?joint\b"),
+        lambda m: ORDINALS[m[1]],
+    ),
+]
+
+ANGLE_VALUE = re.compile(
+    rf"\b(?:by|for|to|of)\s+(?:an angle of\s+)?({ANGLE})\s*"
+    r"(degrees?|deg\b|°|radians?|rad\b)?"
+)
+COORDINATES = re.compile(
+    rf"\(\s*({NUMBER})\s*,\s*({NUMBER})\s*,\s*({NUMBER})\s*\)"
+)
+AXIS = re.compile(
+    r"\b(negative\s+|positive\s+|-|\+)?([xyz])(?:[- ]?axis\b|\s+direction\b)"
+)
+LENGTH = re.compile(
+    rf"({NUMBER})\s*(" + "|".join(sorted(LENGTH_UNITS, key=len, reverse=True)) + r")\b"
+)
+
+TCP_WORDS = re.compile(
+    r"\b(?:tcp|end[- ]effector|tool center point|tool centre point|tool)\b"
+)
+MOTION_WORDS = re.compile(
+    r"\b(?:move|moving|rotate|rotation|turn|adjust|set|shift|alter|change|modify"
+    r"|translate|bring|spin|perform|make|go)\b"
+)
+# Directions that need interpretation, left to the LLM
+DIRECTION_WORDS = re.compile(
+    r"\b(?:left|right|up|down|forward|forwards|backward|backwards|back"
+    r"|clockwise|counterclockwise|anticlockwise|counter-clockwise)\b"
+)
+REQUEST_WORDS = re.compile(
+    r"\b(?:give|get|what|which|provide|retrieve|request|tell|show|read|report"
+    r"|obtain|fetch|query|check|inspect|need|display|list|return|want)\b"
+)
+INFO_WORDS = re.compile(
+    r"\b(?:values?|angles?|positions?|status(?:es)?|states?|info|information"
+    r"|configurations?|readings?|data)\b"
+)
+
+
+def normalize(query):
+    query = query.lower().replace("π", "pi").replace("−", "-")
+    return re.sub(r"\s+", " ", query).strip(" .!?")
+
+
+def format_value(value):
+    text = f"{value:.6f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def parse_angle(text):
+    text = text.replace(" ", "").replace("*", "")
+    if "pi" not in text:
+        return float(text)
+    sign = -1.0 if text.startswith("-") else 1.0
+    text = text.lstrip("+-")
+    factor, _, divisor = text.partition("pi")
+    value = math.pi * float(factor or 1)
+    if divisor:
+        value /= float(divisor.lstrip("/"))
+    return sign * value
+
+
+def function(name, **inputs):
+    return {
+        "function_name": name,
+        "inputs": [
+            {"input_name": key, "input_value": value} for key, value in inputs.items()
+        ],
+    }
+
+
+def parse_joint(clause, continuing):
+    """
+    move_joint for a clause like "rotate joint 2 by 30 degrees", or like
+    "joint 3 by 45 degrees" right after such a clause (continuing). Returns
+    (joint, angle text, angle unit or None), or None.
+    """
+    if TCP_WORDS.search(clause) or AXIS.search(clause):
+        return None
+    if not continuing and not MOTION_WORDS.search(clause):
+        return None
+    joints = []
+    for pattern, index in JOINT_PATTERNS:
+        joints += [index(match) for match in pattern.finditer(clause)]
+    angles = ANGLE_VALUE.findall(clause)
+    if len(joints) != 1 or len(angles) != 1 or not 1 <= joints[0] <= JOINTS:
+        return None
+    value, unit = angles[0]
+    return joints[0] - 1, value, unit or None
+
+
+def parse_tcp(clause):
+    """
+    move_tcp inputs for "move TCP to (300, 150, 200) mm" or "move the TCP
+    along the x-axis by 50 mm" (an offset, relative "true"), or None
+    """
+    if not MOTION_WORDS.search(clause) or "joint" in clause or "base" in clause:
+        return None
+    units = LENGTH.findall(clause)
+    coordinates = COORDINATES.search(clause)
+    axes = AXIS.findall(clause)
+    if coordinates and not axes:
+        # The unit follows the coordinates, e.g. "(0.5, 0.3, 0.7) in meters"
+        rest = clause[coordinates.end() :]
+        unit = re.findall(r"\b(" + "|".join(LENGTH_UNITS) + r")(?![\w-])", rest)
+        if len(set(unit)) != 1 or not TCP_WORDS.search(clause):
+            return None
+        scale = LENGTH_UNITS[unit[0]]
+        values = [float(v) * scale for v in coordinates.groups()]
+        return dict(zip("xyz", map(format_value, values)), relative="false")
+    if len(axes) == 1 and len(units) == 1 and not coordinates:
+        sign, axis = axes[0]
+        value, unit = units[0]
+        value = float(value) * LENGTH_UNITS[unit]
+        if sign.strip() in ("negative", "-"):
+            value = -value
+        return {axis: format_value(value), "relative": "true"}
+    return None
+
+
+def parse_get_joints(clause):
+    return (
+        "joint" in clause
+        and REQUEST_WORDS.search(clause) is not None
+        and INFO_WORDS.search(clause) is not None
+        and MOTION_WORDS.search(clause) is None
+        and not re.search(r"\d|\bpi\b", clause)
+    )
+
+
+def parse(query):
+    """
+    Returns the generic_function structure for query, or None if any part
+    of it is not an unambiguous match
+    """
+    query = normalize(query)
+    if DIRECTION_WORDS.search(query):
+        return None
+    clauses = [clause for clause in CLAUSE_SPLIT.split(query) if clause]
+    if not clauses:
+        return None
+
+    functions = []
+    # move_joint clauses whose angle unit is still unknown, e.g. the first
+    # clause of "joint 2 by 30 and joint 7 by 45 degrees"
+    pending = []
+    for clause in clauses:
+        continuing = bool(pending) or (
+            bool(functions) and functions[-1]["function_name"] == "move_joint"
+        )
+        joint = parse_joint(clause, continuing)
+        if joint is not None:
+            index, value, unit = joint
+            if unit is None and "pi" in value:
+                # Multiples of pi are radians, but do not lend their unit
+                if pending:
+                    return None
+                unit = "rad"
+            if unit is None:
+                pending.append(joint)
+                continue
+            for index, value, _ in pending + [joint]:
+                angle = format_value(parse_angle(value) * ANGLE_UNITS[unit])
+                functions.append(function("move_joint", joint=str(index), angle=angle))
+            pending = []
+            continue
+        if pending:
+            return None
+        tcp = parse_tcp(clause)
+        if tcp is not None:
+            functions.append(function("move_tcp", **tcp))
+            continue
+        if parse_get_joints(clause):
+            functions.append(function("get_joint_values"))
+            continue
+        return None
+    if pending:
+        return None
+    return {"functions": functions}
+
+
+class FastPath:
+    """
+    Answers queries with parse, and the ones it cannot parse with fallback,
+    a function from a query to the same structure (e.g. the LLM pipeline)
+    """
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+        self.parse_time = 0.0
+
+    def __call__(self, query):
+        start = time.perf_counter()
+        result = parse(query)
+        self.parse_time += time.perf_counter() - start
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        if self.fallback is None:
+            return None
+        return self.fallback(query)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,430 @@
+"""
+inference_server.py: long-running local LLM service with dynamic batching
+
+The model is loaded once. Requests arrive over HTTP, and requests that
+arrive within max_wait of each other are generated together as one batch,
+so concurrent operators share forward passes instead of queueing behind
+each other.
+
+    python LLM/inference_server.py --port 8000
+
+    POST /generate {"prompt": "..."}
+    POST /generate {"template": "classifier_prompt_1", "user_query": "..."}
+        -> {"text": "...", "batch_size": 3, "queue_ms": 4.1, "generate_ms": 812.5}
+    POST /generate {..., "schema": "generic_function"}
+        -> {"json": {"functions": [...]}, ...}, constrained to that schema
+        of action_models.py
+
+With --cache, results of template requests are kept in a QueryCache
+(query_cache.py) and repeated queries are answered from it, with
+"cached": true. With --fast-path, generic_function requests the rule-based
+parser (fast_path.py) understands are answered by it, with "fast_path": true.
+With --prefix-cache, template requests without a schema are batched per
+template and only their own part of the prompt is tokenized and prefilled,
+the static part of the template once (prefix_cache.py).
+
+The server listens right away and loads the model in the background. Until
+the model is ready, requests the cache or the fast path cannot answer get
+503, and /health tells when it is:
+
+    GET /health
+        -> {"model": "...", "ready": false, "error": null}
+
+    wait_ready("http://127.0.0.1:8000")  # blocks until "ready": true
+"""
+
+import json
+import time
+import queue
+import logging
+import argparse
+import threading
+from functools import partial
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+
+import prompts
+import action_models
+from fast_path import parse
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+DEFAULT_URL = "http://127.0.0.1:8000"
+
+
+class DynamicBatcher:
+    """
+    Collects submitted items into batches for handler, a function from a
+    list of items to a list of results in the same order.
+
+    A batch is handed over once it has max_batch_size items, or max_wait
+    seconds after its first item arrived, whichever comes first. Items only
+    share a batch if key(item) is equal, e.g. the same generation settings.
+    """
+
+    def __init__(self, handler, max_batch_size=8, max_wait=0.01, key=None):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.key = key or (lambda item: None)
+        self.queue = queue.Queue()
+        # Items taken from the queue that did not fit the last batch
+        self.waiting = []
+        self.batches = 0
+        self.items = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """
+        Returns a concurrent.futures.Future of the result for item
+        """
+        future = Future()
+        self.queue.put((item, future, time.perf_counter()))
+        return future
+
+    def next_batch(self):
+        first = self.waiting.pop(0) if self.waiting else self.queue.get()
+        key = self.key(first[0])
+        batch = [first]
+        # Earlier leftovers with the same key join right away
+        for entry in list(self.waiting):
+            if len(batch) < self.max_batch_size and self.key(entry[0]) == key:
+                self.waiting.remove(entry)
+                batch.append(entry)
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                entry = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if self.key(entry[0]) == key:
+                batch.append(entry)
+            else:
+                self.waiting.append(entry)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            started = time.perf_counter()
+            try:
+                results = self.handler([item for item, _, _ in batch])
+            except Exception as e:
+                log.exception("Batch of %i failed", len(batch))
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            generated = time.perf_counter()
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future, submitted), result in zip(batch, results):
+                future.set_result(
+                    {
+                        "result": result,
+                        "batch_size": len(batch),
+                        "queue_ms": (started - submitted) * 1000,
+                        "generate_ms": (generated - started) * 1000,
+                    }
+                )
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        backend=None,
+        address=("127.0.0.1", 8000),
+        max_batch_size=8,
+        max_wait=0.01,
+        max_new_tokens=256,
+        cache=None,
+        fast_path=False,
+        prefix_cache=False,
+    ):
+        """
+        backend: anything with model_id and generate(prompts, max_new_tokens),
+                 e.g. backend.TransformersBackend. None to load one with load.
+        cache: query_cache.QueryCache for the results of template requests
+        fast_path: answer generic_function requests with fast_path.parse
+                   when it understands the query
+        prefix_cache: generate template requests without a schema with a
+                      prefix_cache.PrefixCache of the backend's model
+        """
+        super().__init__(address, RequestHandler)
+        self.backend = backend
+        self.model_id = None if backend is None else backend.model_id
+        self.max_new_tokens = max_new_tokens
+        self.cache = cache
+        self.fast_path = fast_path
+        self.prefix_cache = prefix_cache
+        self.decoder = None
+        self.prefixes = None
+        # Set once backend can generate
+        self.ready = threading.Event()
+        self.load_error = None
+        if backend is not None:
+            self.ready.set()
+        self.batcher = DynamicBatcher(
+            self.generate_batch,
+            max_batch_size=max_batch_size,
+            max_wait=max_wait,
+            key=lambda item: item[1:],
+        )
+
+    def load(self, factory, model_id):
+        """
+        Sets backend to factory() on a background thread, model_id being
+        the model it loads. The server answers what it can meanwhile.
+        """
+        self.model_id = model_id
+        start = time.perf_counter()
+
+        def run():
+            try:
+                self.backend = factory()
+            except Exception as e:
+                self.load_error = e
+                log.exception("Loading %s failed", model_id)
+                return
+            self.ready.set()
+            log.info("%s ready in %.1f s", model_id, time.perf_counter() - start)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def generate_batch(self, items):
+        # Every item of a batch has the same max_new_tokens, schema and
+        # template, see the key above. With a template, the items hold the
+        # queries to fill it with, else whole prompts.
+        texts = [text for text, _, _, _ in items]
+        _, max_new_tokens, schema, template = items[0]
+        if template is not None:
+            if self.prefixes is None:
+                from prefix_cache import PrefixCache
+
+                self.prefixes = PrefixCache(self.backend.model, self.backend.tokenizer)
+            return self.prefixes.generate_batch(
+                getattr(prompts, template), texts, max_new_tokens=max_new_tokens
+            )
+        if schema is None:
+            return self.backend.generate(texts, max_new_tokens=max_new_tokens)
+        if self.decoder is None:
+            from constrained import ConstrainedDecoder
+
+            self.decoder = ConstrainedDecoder(
+                self.backend.model, self.backend.tokenizer
+            )
+        return self.decoder.generate(
+            texts, getattr(action_models, schema), max_new_tokens=max_new_tokens
+        )
+
+    def build_prompt(self, body):
+        if "prompt" in body:
+            return body["prompt"]
+        template = getattr(prompts, body["template"])
+        return template.format(user_query=body["user_query"])
+
+    def cache_context(self, body, max_new_tokens, schema):
+        """
+        Everything the result of a template request depends on besides the
+        query, or None if it is not cached
+        """
+        if self.cache is None or "prompt" in body:
+            return None
+        return {
+            "model": self.model_id,
+            "template": getattr(prompts, body["template"]),
+            "schema": None if schema is None else getattr(action_models, schema),
+            "max_new_tokens": max_new_tokens,
+        }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/health":
+            return self.reply(404, {"error": "not found"})
+        error = self.server.load_error
+        self.reply(
+            200,
+            {
+                "model": self.server.model_id,
+                "ready": self.server.ready.is_set(),
+                "error": None if error is None else repr(error),
+            },
+        )
+
+    def do_POST(self):
+        if self.path != "/generate":
+            return self.reply(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length))
+            prompt = self.server.build_prompt(body)
+            max_new_tokens = int(
+                body.get("max_new_tokens", self.server.max_new_tokens)
+            )
+            schema = body.get("schema")
+            if schema is not None and not isinstance(
+                getattr(action_models, schema), dict
+            ):
+                raise ValueError(f"{schema} is not a schema")
+            context = self.server.cache_context(body, max_new_tokens, schema)
+        except (ValueError, KeyError, AttributeError, TypeError) as e:
+            return self.reply(400, {"error": f"bad request: {e!r}"})
+
+        field = "text" if schema is None else "json"
+        if context is not None:
+            result = self.server.cache.get(body["user_query"], **context)
+            if result is not None:
+                return self.reply(200, {field: result, "cached": True})
+        template_request = "prompt" not in body
+        if self.server.fast_path and schema == "generic_function" and template_request:
+            result = parse(body["user_query"])
+            if result is not None:
+                return self.reply(200, {field: result, "fast_path": True})
+        if not self.server.ready.is_set():
+            error = self.server.load_error
+            message = "model is loading" if error is None else f"{error!r}"
+            return self.reply(503, {"error": message})
+
+        try:
+            item = (prompt, max_new_tokens, schema, None)
+            if self.server.prefix_cache and schema is None and template_request:
+                item = (body["user_query"], max_new_tokens, None, body["template"])
+            done = self.server.batcher.submit(item).result()
+        except Exception as e:
+            return self.reply(500, {"error": repr(e)})
+        if context is not None and done["result"] is not None:
+            self.server.cache.put(body["user_query"], done["result"], **context)
+        self.reply(
+            200,
+            {
+                field: done["result"],
+                "batch_size": done["batch_size"],
+                "queue_ms": done["queue_ms"],
+                "generate_ms": done["generate_ms"],
+            },
+        )
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.debug("%s " + format, self.address_string(), *args)
+
+
+def generate(url=DEFAULT_URL, timeout=120, **body):
+    """
+    Client side: sends body (prompt=..., or template=... and user_query=...)
+    to a running server and returns its JSON reply
+    """
+    request = Request(
+        url + "/generate",
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def wait_ready(url=DEFAULT_URL, timeout=600, interval=0.5):
+    """
+    Client side: waits until the server at url has loaded its model, and
+    returns its /health reply
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urlopen(url + "/health", timeout=10) as response:
+                health = json.loads(response.read())
+        except OSError:
+            # Not listening yet
+            health = None
+        if health is not None:
+            if health["ready"]:
+                return health
+            if health.get("error"):
+                raise RuntimeError(f"{url} failed to load: {health['error']}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{url} not ready after {timeout} s")
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    from backend import DEFAULT_MODEL, TransformersBackend
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", help=f"defaults to {DEFAULT_MODEL}")
+    parser.add_argument(
+        "--cpu",
+        action="store_true",
+        help="int8 model on CPU (cpu_backend.py), defaults to its CPU_MODEL",
+    )
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=10.0,
+        help="how long a request may wait for others to batch with",
+    )
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    parser.add_argument("--cache", help="SQLite file to keep query results in")
+    parser.add_argument(
+        "--fast-path",
+        action="store_true",
+        help="answer the queries fast_path.py parses without the model",
+    )
+    parser.add_argument(
+        "--prefix-cache",
+        action="store_true",
+        help="prefill the static part of each prompt template once",
+    )
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=args.log_level, format="%(asctime)s %(levelname)s %(message)s"
+    )
+
+    cache = None
+    if args.cache:
+        from query_cache import QueryCache
+
+        cache = QueryCache(args.cache)
+
+    server = InferenceServer(
+        address=(args.host, args.port),
+        max_batch_size=args.max_batch_size,
+        max_wait=args.max_wait_ms / 1000,
+        max_new_tokens=args.max_new_tokens,
+        cache=cache,
+        fast_path=args.fast_path,
+        prefix_cache=args.prefix_cache,
+    )
+    if args.cpu:
+        from cpu_backend import CPU_MODEL, CPUBackend
+
+        model_id = args.model or CPU_MODEL
+        log.info("Loading %s on CPU", model_id)
+        server.load(partial(CPUBackend, model_id), model_id)
+    else:
+        model_id = args.model or DEFAULT_MODEL
+        log.info("Loading %s", model_id)
+        server.load(partial(TransformersBackend, model_id), model_id)
+    log.info("Serving on http://%s:%i", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
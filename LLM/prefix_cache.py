@@ -0,0 +1,188 @@
+"""
+prefix_cache.py: prefills the static part of a prompt template once
+
+Everything in the templates of prompts.py before {user_query} is the same
+for every query. PrefixCache runs the model over it once per template and
+keeps its past_key_values, so a query only tokenizes and prefills its own
+part of the prompt.
+
+    cache = PrefixCache(backend.model, backend.tokenizer)
+    cache.generate(classifier_prompt_1, "Give me robot joint info")
+    cache.generate_batch(classifier_prompt_1, ["Move joint 1 by 5 degrees", ...])
+
+The inference server uses it for template requests with --prefix-cache.
+"""
+
+import logging
+from collections import OrderedDict
+
+import torch
+from transformers import DynamicCache
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+def split_template(template, field="{user_query}"):
+    """
+    Splits template into its static prefix and the rest, at the start of
+    the line holding field. Splitting at a line break keeps tokenizers from
+    merging tokens across the split.
+    """
+    index = template.index(field)
+    split = template.rfind("\n", 0, index) + 1
+    return template[:split], template[split:]
+
+
+class PrefixCache:
+    def __init__(self, model, tokenizer, max_entries=4):
+        """
+        max_entries: number of template prefixes kept, least recently used
+                     ones are dropped first
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        # prefix -> (prefix token ids, past_key_values as legacy tuples)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # template -> whether its prompts tokenize the same split in two,
+        # checked on first use
+        self.splits = {}
+
+    def encode(self, text):
+        # The templates in prompts.py already start with <s>
+        return self.tokenizer(
+            text, return_tensors="pt", add_special_tokens=False
+        ).input_ids.to(self.model.device)
+
+    def encode_rest(self, head, text):
+        """
+        Token ids of text as they are right after head, without tokenizing
+        head again: text is tokenized behind the last character of head,
+        whose tokens are dropped (a tokenizer may treat the start of a text
+        differently). None if that character does not keep tokens of its own.
+        """
+        lead = head[-1:]
+        if not lead:
+            return None
+        lead_ids = self.encode(lead)[0]
+        ids = self.encode(lead + text)[0]
+        count = len(lead_ids)
+        if len(ids) <= count or not torch.equal(ids[:count], lead_ids):
+            return None
+        return ids[count:]
+
+    @torch.inference_mode()
+    def prefill(self, prefix):
+        """
+        Returns (token ids, past_key_values) of prefix, from the cache if
+        it was prefilled before
+        """
+        entry = self.entries.get(prefix)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(prefix)
+            return entry
+
+        self.misses += 1
+        input_ids = self.encode(prefix)
+        past = self.model(input_ids, use_cache=True).past_key_values
+        if hasattr(past, "to_legacy_cache"):
+            past = past.to_legacy_cache()
+        entry = self.entries[prefix] = (input_ids[0], past)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    @torch.inference_mode()
+    def generate(self, template, user_query, max_new_tokens=256, **generate_kwargs):
+        """
+        Returns the text generated for template filled with user_query,
+        the same text as generating from the whole prompt
+        """
+        return self.generate_batch(
+            template, [user_query], max_new_tokens, **generate_kwargs
+        )[0]
+
+    @torch.inference_mode()
+    def generate_batch(
+        self, template, user_queries, max_new_tokens=256, **generate_kwargs
+    ):
+        """
+        Returns the text generated for template filled with each of
+        user_queries. The rows share the prefilled prefix, and their own
+        parts are padded on the left, between the prefix and them.
+        """
+        prefix, rest = split_template(template)
+        # The line breaks the prefix ends with go with the rest, tokenizers
+        # split whitespace at the end of a text differently
+        head = prefix.rstrip()
+        texts = [prefix[len(head) :] + rest.format(user_query=q) for q in user_queries]
+        prefix_ids, past = self.prefill(head)
+        length = len(prefix_ids)
+
+        suffixes = None
+        if self.splits.get(template, True):
+            suffixes = [self.encode_rest(head, text) for text in texts]
+            if any(suffix is None for suffix in suffixes):
+                suffixes = None
+            elif template not in self.splits:
+                whole = self.encode(head + texts[0])[0]
+                split = torch.cat([prefix_ids, suffixes[0]])
+                self.splits[template] = torch.equal(whole, split)
+                if not self.splits[template]:
+                    log.warning("Tokenizing the whole prompts of %.40r", template)
+                    suffixes = None
+        if suffixes is None:
+            # Reuse the prefix up to the first token a prompt differs in, and
+            # at least one token short of every prompt
+            whole = [self.encode(head + text)[0] for text in texts]
+            for input_ids in whole:
+                length = min(length, len(input_ids) - 1)
+                differs = (input_ids[:length] != prefix_ids[:length]).nonzero()
+                if len(differs):
+                    length = int(differs[0])
+            suffixes = [input_ids[length:] for input_ids in whole]
+
+        pad_token_id = self.tokenizer.pad_token_id or self.tokenizer.eos_token_id
+        width = length + max(len(suffix) for suffix in suffixes)
+        input_ids = torch.full(
+            (len(suffixes), width), pad_token_id, device=prefix_ids.device
+        )
+        attention_mask = torch.zeros_like(input_ids)
+        input_ids[:, :length] = prefix_ids[:length]
+        attention_mask[:, :length] = 1
+        for row, suffix in enumerate(suffixes):
+            input_ids[row, width - len(suffix) :] = suffix
+            attention_mask[row, width - len(suffix) :] = 1
+
+        if length:
+            past = DynamicCache.from_legacy_cache(
+                tuple(
+                    (
+                        key[:, :, :length].expand(len(suffixes), -1, -1, -1),
+                        value[:, :, :length].expand(len(suffixes), -1, -1, -1),
+                    )
+                    for key, value in past
+                )
+            )
+        else:
+            past = None
+
+        generate_kwargs.setdefault("do_sample", False)
+        output = self.model.generate(
+            input_ids,
+            attention_mask=attention_mask,
+            past_key_values=past,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=pad_token_id,
+            **generate_kwargs,
+        )
+        return self.tokenizer.batch_decode(
+            output[:, width:], skip_special_tokens=True
+        )
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,191 @@
+"""
+query_cache.py: remembers the function calls generated for each query
+
+The same commands come in over and over ("get joint values", "rotate the
+base by 30 degrees"). QueryCache keeps the result of every query, in memory
+(least recently used first out) and optionally in a SQLite file that
+survives restarts, so a repeated query skips the LLM.
+
+    cache = QueryCache("./cache/queries.sqlite")
+    context = {"model": backend.model_id, "template": classifier_prompt_1,
+               "schema": generic_function}
+    result = cache.cached(query, run_pipeline, **context)
+
+Queries are normalized first (case, whitespace, number formatting, unit
+synonyms), so "Rotate joint 2 by 30.0 Degrees" hits the entry of "rotate
+joint 2 by 30 deg". The context (model, template text, schema, generation
+settings) is part of the key: changing any of it misses every old entry.
+"""
+
+import re
+import json
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from fast_path import normalize
+
+# Synonym: canonical unit
+UNITS = {
+    "degrees": "deg",
+    "degree": "deg",
+    "°": "deg",
+    "radians": "rad",
+    "radian": "rad",
+    "millimeters": "mm",
+    "millimeter": "mm",
+    "millimetres": "mm",
+    "millimetre": "mm",
+    "milimeters": "mm",
+    "centimeters": "cm",
+    "centimeter": "cm",
+    "centimetres": "cm",
+    "centimetre": "cm",
+    "meters": "m",
+    "meter": "m",
+    "metres": "m",
+    "metre": "m",
+    "inches": "inch",
+}
+UNIT_WORDS = re.compile(
+    r"(?<!\w)(" + "|".join(sorted(UNITS, key=len, reverse=True)) + r")(?!\w)"
+)
+# A number glued to its unit, "30deg" -> "30 deg"
+UNIT_SPACING = re.compile(r"(\d)\s*(deg|rad|mm|cm|m|inch)\b")
+NUMBER = re.compile(r"(?<![\w.])([-+]?)(\d+)(?:\.(\d+))?(?![\w.])")
+
+
+def format_number(match):
+    # Textual, so distinct numbers never collapse: "+030.50" -> "30.5"
+    sign, whole, fraction = match.groups()
+    whole = whole.lstrip("0") or "0"
+    fraction = (fraction or "").rstrip("0")
+    text = whole + ("." + fraction if fraction else "")
+    return ("-" if sign == "-" and text != "0" else "") + text
+
+
+def normalize_query(query):
+    query = normalize(query)
+    query = UNIT_WORDS.sub(lambda m: UNITS[m[1]], query)
+    query = NUMBER.sub(format_number, query)
+    return UNIT_SPACING.sub(r"\1 \2", query)
+
+
+def context_key(context):
+    return hashlib.sha256(
+        json.dumps(context, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class QueryCache:
+    def __init__(self, path=None, max_entries=1024):
+        """
+        path: SQLite file the entries are persisted to, None keeps them in
+              memory only
+        max_entries: number of entries kept in memory, the least recently
+                     used ones are dropped first (they stay on disk)
+        """
+        self.max_entries = max_entries
+        # key -> result as JSON text
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            # Shared by the threads of the inference server, behind self.lock
+            self.db = sqlite3.connect(str(path), check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, context TEXT, query TEXT, value TEXT)"
+            )
+            self.db.commit()
+
+    def key(self, query, context):
+        context = context_key(context)
+        query = normalize_query(query)
+        key = hashlib.sha256((context + "\n" + query).encode()).hexdigest()
+        return key, context, query
+
+    def get(self, query, **context):
+        """
+        Returns the result stored for query in context, or None
+        """
+        key, _, _ = self.key(query, context)
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(value)
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT value FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    self.remember(key, row[0])
+                    return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, query, value, **context):
+        key, context, query = self.key(query, context)
+        value = json.dumps(value)
+        with self.lock:
+            self.remember(key, value)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                    (key, context, query, value),
+                )
+                self.db.commit()
+
+    def remember(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def cached(self, query, compute, **context):
+        """
+        Returns the stored result for query, or compute(query) which is
+        stored unless it is None
+        """
+        value = self.get(query, **context)
+        if value is None:
+            value = compute(query)
+            if value is not None:
+                self.put(query, value, **context)
+        return value
+
+    def prune(self, **context):
+        """
+        Deletes every persisted entry of another context than this one,
+        returns how many were deleted
+        """
+        if self.db is None:
+            return 0
+        with self.lock:
+            deleted = self.db.execute(
+                "DELETE FROM entries WHERE context != ?", (context_key(context),)
+            ).rowcount
+            self.db.commit()
+        return deleted
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM entries")
+                self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,57 @@
+"""
+tiny_model.py: a tiny, randomly initialised Mistral and a tokenizer trained
+on the prompt templates, for running LLM code offline (tests, benchmarks)
+
+The output is gibberish, but every code path and tensor shape is the same
+as with the real model.
+"""
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+from transformers import MistralConfig, MistralForCausalLM, PreTrainedTokenizerFast
+
+import prompts
+
+TEMPLATES = [
+    prompts.classifier_prompt,
+    prompts.classifier_prompt_1,
+    prompts.split_actions,
+]
+
+
+def build_tokenizer(vocab_size=1000):
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=["<unk>", "<s>", "</s>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    tokenizer.train_from_iterator(TEMPLATES, trainer)
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        bos_token="<s>",
+        eos_token="</s>",
+        unk_token="<unk>",
+    )
+
+
+def build_tiny_model(hidden_size=64, num_hidden_layers=2, vocab_size=1000, seed=0):
+    """
+    Returns (model, tokenizer)
+    """
+    tokenizer = build_tokenizer(vocab_size)
+    torch.manual_seed(seed)
+    config = MistralConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_hidden_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=4096,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    )
+    return MistralForCausalLM(config).eval(), tokenizer
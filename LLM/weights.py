@@ -0,0 +1,169 @@
+"""
+weights.py: builds the model from weights already on disk, without copying them
+
+from_pretrained asks the hub for the latest revision on every start and (in
+transformers 4.36, without low_cpu_mem_usage) builds the model with random
+weights before copying the checkpoint over them.
+Here a model that is in the weights cache already is found locally, and its
+.safetensors files are memory mapped: the parameters are views of the page
+cache, read as they are first touched, and a restart finds them still
+cached by the OS.
+
+    path = local_snapshot("mistralai/Mistral-7B-Instruct-v0.2", "./weights")
+    model = load_model(path)  # None for quantized or .bin checkpoints
+
+The map is private (copy on write), so changing a parameter in place copies
+only its pages and never writes to the file.
+"""
+
+import json
+import mmap
+import logging
+from pathlib import Path
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# safetensors dtype: torch dtype
+DTYPES = {
+    "F64": "float64",
+    "F32": "float32",
+    "F16": "float16",
+    "BF16": "bfloat16",
+    "I64": "int64",
+    "I32": "int32",
+    "I16": "int16",
+    "I8": "int8",
+    "U8": "uint8",
+    "BOOL": "bool",
+}
+SAFETENSORS_INDEX = "model.safetensors.index.json"
+SAFETENSORS_FILE = "model.safetensors"
+
+
+def local_snapshot(model_name_or_path, cache_dir=None):
+    """
+    Returns the local directory of model_name_or_path: itself if it is a
+    directory, its snapshot in cache_dir if it was downloaded already, else
+    None
+    """
+    if Path(model_name_or_path).is_dir():
+        return Path(model_name_or_path)
+    from huggingface_hub import snapshot_download
+
+    try:
+        return Path(
+            snapshot_download(
+                model_name_or_path, cache_dir=cache_dir, local_files_only=True
+            )
+        )
+    except (OSError, ValueError):
+        # Not downloaded yet (LocalEntryNotFoundError), or not a repo name
+        return None
+
+
+def weight_files(path):
+    """
+    The .safetensors checkpoint files of the model directory path, [] if it
+    has none
+    """
+    path = Path(path)
+    if (path / SAFETENSORS_INDEX).exists():
+        with open(path / SAFETENSORS_INDEX, encoding="utf-8") as file:
+            shards = sorted(set(json.load(file)["weight_map"].values()))
+        return [path / shard for shard in shards]
+    if (path / SAFETENSORS_FILE).exists():
+        return [path / SAFETENSORS_FILE]
+    return []
+
+
+def load_safetensors(path):
+    """
+    Returns {name: tensor} of the .safetensors file at path, every tensor a
+    view of a memory map of the file
+    """
+    import torch
+
+    with open(path, "rb") as file:
+        # An 8 byte little endian header length, the JSON header, the data
+        length = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(length))
+        # The map stays valid after the file is closed
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    header.pop("__metadata__", None)
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = getattr(torch, DTYPES[info["dtype"]])
+        begin, end = info["data_offsets"]
+        if begin == end:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        size = torch.empty((), dtype=dtype).element_size()
+        tensors[name] = torch.frombuffer(
+            buffer, dtype=dtype, count=(end - begin) // size, offset=8 + length + begin
+        ).reshape(info["shape"])
+    return tensors
+
+
+@contextmanager
+def empty_parameters():
+    """
+    Parameters created meanwhile go to the meta device, without memory or
+    initialization. Buffers (e.g. rotary frequencies) are computed as usual,
+    they are not in the checkpoint. This is accelerate's init_empty_weights,
+    whose import alone costs about a second.
+    """
+    import torch
+
+    register = torch.nn.Module.register_parameter
+
+    def register_empty(module, name, param):
+        if param is not None:
+            param = torch.nn.Parameter(
+                param.to("meta"), requires_grad=param.requires_grad
+            )
+        register(module, name, param)
+
+    torch.nn.Module.register_parameter = register_empty
+    try:
+        yield
+    finally:
+        torch.nn.Module.register_parameter = register
+
+
+def load_model(path):
+    """
+    Returns the causal LM of the model directory path with its weights
+    memory mapped, in the dtype they were saved in. None if that is not
+    possible, the checkpoint being quantized, .bin only or incomplete, and
+    from_pretrained has to load it.
+    """
+    from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+    from transformers.modeling_utils import no_init_weights
+
+    path = Path(path)
+    files = weight_files(path)
+    config = AutoConfig.from_pretrained(path)
+    if not files or getattr(config, "quantization_config", None) is not None:
+        return None
+
+    # The map below is all the memory the parameters get
+    with no_init_weights(), empty_parameters():
+        model = AutoModelForCausalLM.from_config(config)
+    state = {}
+    for file in files:
+        state.update(load_safetensors(file))
+    model.load_state_dict(state, strict=False, assign=True)
+    model.tie_weights()
+    missing = [name for name, p in model.named_parameters() if p.is_meta]
+    if missing:
+        log.warning("%s has no weights for %s, loading it fully", path, missing[:5])
+        return None
+
+    try:
+        model.generation_config = GenerationConfig.from_pretrained(path)
+    except OSError:
+        pass
+    return model.eval()
@@ -0,0 +1,198 @@
+"""
+Cold start of the entry points: import time, model load time and server
+readiness, each measured in a fresh interpreter.
+
+    imports   seconds to import each module, and the ML packages that
+              came with it. The Robot client and the MockServer must not
+              pull in any.
+    load      a model saved as safetensors (a random one of --hidden-size
+              and --layers, or --model), loaded with from_pretrained as
+              before and with the memory map of LLM/weights.py
+    server    LLM/inference_server.py on that model: seconds until it
+              answers /health (and the fast path), and until it is ready
+
+Usage:
+    python benchmarks/cold_start.py --runs 3
+    python benchmarks/cold_start.py --model ./weights/models--mistralai--Mistral-7B-Instruct-v0.2/snapshots/<hash>
+"""
+
+import sys
+import json
+import time
+import tempfile
+import argparse
+import statistics
+import subprocess
+from urllib.request import urlopen
+
+from harness import ROOT, free_port
+
+ML_PACKAGES = [
+    "torch",
+    "transformers",
+    "optimum",
+    "jsonformer",
+    "bitsandbytes",
+    "accelerate",
+    "datasets",
+]
+# (name, directory on the path, module)
+MODULES = [
+    ("robot client", "functions", "abb"),
+    ("mock server", "controllers", "mock.server"),
+    ("fast path", "LLM", "fast_path"),
+    ("dispatch", "LLM", "dispatch"),
+    ("inference server", "LLM", "inference_server"),
+    ("backend", "LLM", "backend"),
+    ("constrained", "LLM", "constrained"),
+]
+
+IMPORT_SCRIPT = """
+import sys, time, json
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [p for p in {packages!r} if p in sys.modules]]))
+"""
+LOAD_SCRIPT = """
+import sys, time, json, resource
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+{load}
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps([elapsed, rss]))
+"""
+LOADERS = {
+    "from_pretrained": "from transformers import AutoModelForCausalLM\n"
+    "model = AutoModelForCausalLM.from_pretrained({model!r})",
+    "mmap": "from weights import load_model\nmodel = load_model({model!r})",
+}
+
+
+def run_script(script):
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_imports(runs):
+    results = {}
+    for name, directory, module in MODULES:
+        script = IMPORT_SCRIPT.format(
+            path=str(ROOT / directory), module=module, packages=ML_PACKAGES
+        )
+        outcomes = [run_script(script) for _ in range(runs)]
+        results[name] = {
+            "import_s": statistics.median(elapsed for elapsed, _ in outcomes),
+            "ml_packages": outcomes[0][1],
+        }
+    return results
+
+
+def measure_load(model, runs):
+    results = {}
+    for name, load in LOADERS.items():
+        script = LOAD_SCRIPT.format(
+            path=str(ROOT / "LLM"), load=load.format(model=str(model))
+        )
+        outcomes = [run_script(script) for _ in range(runs)]
+        results[name] = {
+            "load_s": statistics.median(elapsed for elapsed, _ in outcomes),
+            "max_rss_mb": statistics.median(rss for _, rss in outcomes),
+        }
+    return results
+
+
+def measure_server(model, runs):
+    listening, ready = [], []
+    for _ in range(runs):
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                str(ROOT / "LLM" / "inference_server.py"),
+                "--port",
+                str(port),
+                "--model",
+                str(model),
+                "--fast-path",
+                "--log-level",
+                "WARNING",
+            ]
+        )
+        try:
+            listened = None
+            while True:
+                try:
+                    with urlopen(url + "/health", timeout=30) as response:
+                        health = json.loads(response.read())
+                except OSError:
+                    time.sleep(0.01)
+                    continue
+                if listened is None:
+                    listened = time.perf_counter() - start
+                if health["ready"] or health["error"]:
+                    break
+                time.sleep(0.01)
+            if health["error"]:
+                raise RuntimeError(health["error"])
+            listening.append(listened)
+            ready.append(time.perf_counter() - start)
+        finally:
+            server.kill()
+            server.wait()
+    return {
+        "listening_s": statistics.median(listening),
+        "ready_s": statistics.median(ready),
+    }
+
+
+def save_random_model(directory, hidden_size, layers):
+    sys.path.insert(0, str(ROOT / "LLM"))
+    from tiny_model import build_tiny_model
+
+    model, tokenizer = build_tiny_model(
+        hidden_size=hidden_size, num_hidden_layers=layers
+    )
+    model.save_pretrained(directory, safe_serialization=True)
+    tokenizer.save_pretrained(directory)
+    return sum(p.numel() for p in model.parameters())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model", help="local model directory to load")
+    parser.add_argument("--hidden-size", type=int, default=1024)
+    parser.add_argument("--layers", type=int, default=8)
+    args = parser.parse_args()
+
+    results = {"imports": measure_imports(args.runs)}
+    with tempfile.TemporaryDirectory() as directory:
+        model = args.model
+        if model is None:
+            model = directory
+            parameters = save_random_model(directory, args.hidden_size, args.layers)
+            results["parameters"] = parameters
+        results["load"] = measure_load(model, args.runs)
+        results["server"] = measure_server(model, args.runs)
+
+    for name, result in results["imports"].items():
+        packages = ", ".join(result["ml_packages"]) or "-"
+        print(f"import {name:<17} {result['import_s']:7.3f} s  ML: {packages}")
+    for name, result in results["load"].items():
+        print(
+            f"load   {name:<17} {result['load_s']:7.3f} s  "
+            f"max RSS {result['max_rss_mb']:8.1f} MB"
+        )
+    server = results["server"]
+    print(
+        f"server listening after {server['listening_s']:.3f} s, "
+        f"ready after {server['ready_s']:.3f} s"
+    )
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,149 @@
+"""
+Replays the query datasets through the rule-based fast path (LLM/fast_path.py)
+and reports how many queries skip the LLM.
+
+Datasets:
+    generated    DATA/generated-queries.json
+    formatted    DATA/formatted-queries_*.json, whose labels are used to
+                 check the function names (label_agreement) and also the
+                 arguments (argument_agreement) of every fast path answer
+    choice       LLM/tests/functions_choice.jsonl
+
+Arguments are compared as LLM/evaluate.py compares them. Some formatted
+labels number the joints as the query does ("Rotate joint 2 by 45 degrees"
+-> joint 2) instead of from 0 as classifier_prompt_1 asks ("the third joint"
+-> joint 2), while others ("Rotate the 6th joint" -> joint 5) follow the
+prompt. The fast path follows the prompt, so answers that only disagree with
+their label by such a joint index are counted as joint_numbered_from_one.
+The labels are left as the generator wrote them, the dataset in DATA/ was
+built from them.
+
+Latency saved is the number of fast path answers times the LLM latency per
+query: pass it as --llm-latency-ms, or pass --model to measure it (the tiny
+random model by default only measures the pipeline's own overhead).
+
+Usage:
+    python benchmarks/fast_path_replay.py --llm-latency-ms 900
+    python benchmarks/fast_path_replay.py --model tiny
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from harness import ROOT
+
+sys.path.insert(0, str(ROOT / "LLM"))
+from fast_path import FastPath
+from evaluate import canonical_label, canonical_prediction, score
+
+
+def load_datasets():
+    with open(ROOT / "DATA" / "generated-queries.json", encoding="utf-8") as file:
+        generated = [(query, None) for query in json.load(file)]
+    formatted = []
+    for path in sorted((ROOT / "DATA").glob("formatted-queries_*.json")):
+        with open(path, encoding="utf-8") as file:
+            formatted += [(query, output) for query, output in json.load(file)]
+    choice = []
+    choice_path = ROOT / "LLM" / "tests" / "functions_choice.jsonl"
+    with open(choice_path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                choice.append((json.loads(line)["query"], None))
+    return {"generated": generated, "formatted": formatted, "choice": choice}
+
+
+def joint_numbered_from_one(label, answer):
+    """
+    True if the canonical label and answer only differ in move_joint
+    indices that are one higher in the label
+    """
+    if [name for name, _ in label] != [name for name, _ in answer]:
+        return False
+    shifted = []
+    for (name, expected), (_, got) in zip(label, answer):
+        if name == "move_joint" and isinstance(got.get("joint"), float):
+            if expected.get("joint") == got["joint"] + 1:
+                expected = dict(expected, joint=got["joint"])
+        shifted.append((name, expected))
+    return shifted != label and score(shifted, answer)[1]
+
+
+def measure_llm(model_name, queries):
+    """
+    Mean seconds per query of the LLM path: classifier_prompt_1 decoded
+    with the generic_function schema
+    """
+    import prompts
+    from action_models import generic_function
+    from constrained import ConstrainedDecoder
+
+    if model_name == "tiny":
+        from tiny_model import build_tiny_model
+
+        model, tokenizer = build_tiny_model()
+    else:
+        from backend import TransformersBackend
+
+        backend = TransformersBackend(model_name)
+        model, tokenizer = backend.model, backend.tokenizer
+    decoder = ConstrainedDecoder(model, tokenizer)
+    start = time.perf_counter()
+    for query in queries:
+        prompt = prompts.classifier_prompt_1.format(user_query=query)
+        decoder.generate([prompt], generic_function, max_new_tokens=128)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def replay(name, dataset, llm_latency):
+    fast_path = FastPath()
+    agree = arguments = numbered_from_one = labelled = 0
+    missed = []
+    for query, label in dataset:
+        result = fast_path(query)
+        if result is None:
+            missed.append(query)
+            continue
+        if label is not None:
+            labelled += 1
+            label, answer = canonical_label(label), canonical_prediction(result)
+            same_names, same_arguments = score(label, answer)
+            agree += same_names
+            arguments += bool(same_arguments)
+            numbered_from_one += joint_numbered_from_one(label, answer)
+    summary = {
+        "queries": len(dataset),
+        "fast_path": fast_path.hits,
+        "hit_rate": fast_path.hit_rate,
+        "fast_path_mean_us": fast_path.parse_time / len(dataset) * 1e6,
+        "latency_saved_s": fast_path.hits * llm_latency if llm_latency else None,
+    }
+    if labelled:
+        summary["label_agreement"] = agree / labelled
+        summary["argument_agreement"] = arguments / labelled
+        summary["joint_numbered_from_one"] = numbered_from_one
+    return summary, missed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--llm-latency-ms", type=float)
+    parser.add_argument("--model", help="measure the LLM latency with this model")
+    parser.add_argument("--measure-queries", type=int, default=5)
+    parser.add_argument("--show-missed", type=int, default=0)
+    args = parser.parse_args()
+
+    datasets = load_datasets()
+    llm_latency = args.llm_latency_ms / 1000 if args.llm_latency_ms else None
+    if args.model:
+        sample = [query for query, _ in datasets["generated"][: args.measure_queries]]
+        llm_latency = measure_llm(args.model, sample)
+
+    results = {"llm_latency_ms": llm_latency * 1000 if llm_latency else None}
+    for name, dataset in datasets.items():
+        results[name], missed = replay(name, dataset, llm_latency)
+        for query in missed[: args.show_missed]:
+            print(f"missed ({name}): {query}", file=sys.stderr)
+    print(json.dumps(results, indent=2))
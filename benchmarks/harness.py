@@ -0,0 +1,78 @@
+"""
+Shared helpers for the benchmarks: run a MockServer process on a free
+port, connect clients to it and summarize latencies.
+"""
+
+import os
+import sys
+import time
+import socket
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "functions"))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def start_mock_server(port, *args):
+    """
+    Starts controllers/run_mock_server.py on port, extra args are passed
+    through (e.g. "--simulate"). Its logging is limited to warnings.
+    """
+    env = dict(os.environ, PORT=str(port))
+    return subprocess.Popen(
+        [
+            sys.executable,
+            str(ROOT / "controllers" / "run_mock_server.py"),
+            "--log-level",
+            "WARNING",
+            *args,
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def stop_mock_server(server):
+    server.kill()
+    server.wait()
+
+
+def connect(robot_class, port, attempts=50, **kwargs):
+    # Wait for the MockServer process to start listening
+    for _ in range(attempts):
+        try:
+            return robot_class("127.0.0.1", port_motion=port, **kwargs)
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    raise ConnectionRefusedError(f"MockServer on port {port} never came up")
+
+
+def percentile(ordered, fraction):
+    return ordered[round(fraction * (len(ordered) - 1))]
+
+
+def summarize(latencies, elapsed=None, commands=None):
+    """
+    latencies: seconds per measured operation
+    elapsed: wall time of the whole run, defaults to the sum of latencies
+    commands: commands sent in the run, defaults to one per latency
+    """
+    ordered = sorted(latency * 1000 for latency in latencies)
+    elapsed = elapsed if elapsed is not None else sum(latencies)
+    commands = commands if commands is not None else len(latencies)
+    return {
+        "count": len(latencies),
+        "mean_ms": statistics.mean(ordered),
+        "p50_ms": percentile(ordered, 0.50),
+        "p95_ms": percentile(ordered, 0.95),
+        "p99_ms": percentile(ordered, 0.99),
+        "commands_per_s": commands / elapsed if elapsed else None,
+    }
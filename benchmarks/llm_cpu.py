@@ -0,0 +1,100 @@
+"""
+CPU decoding speed of LLM/cpu_backend.py, float32 against int8.
+
+Queries of DATA/generated-queries.json are put into classifier_prompt_1 and
+generated one at a time, a fixed number of new tokens each, once with the
+float32 weights and once with the int8 quantized ones.
+
+By default a tiny random model (LLM/tiny_model.py) is used, so it runs
+offline. Pass --model with a Hugging Face model for real numbers.
+
+Usage:
+    python benchmarks/llm_cpu.py --queries 10 --new-tokens 32
+    python benchmarks/llm_cpu.py --model mistralai/Mistral-7B-Instruct-v0.2
+"""
+
+import sys
+import json
+import time
+import argparse
+
+import torch
+
+from harness import ROOT, summarize
+
+sys.path.insert(0, str(ROOT / "LLM"))
+import prompts
+from cpu_backend import CPUBackend
+
+
+def load(model_name, quantize, num_threads):
+    if model_name == "tiny":
+        from tiny_model import build_tiny_model
+
+        model, tokenizer = build_tiny_model(hidden_size=512, num_hidden_layers=4)
+        return CPUBackend(
+            "tiny",
+            model=model,
+            tokenizer=tokenizer,
+            quantize=quantize,
+            num_threads=num_threads,
+        )
+    return CPUBackend(model_name, quantize=quantize, num_threads=num_threads)
+
+
+def run_backend(backend, queries, new_tokens):
+    # Warm up the kernels before timing
+    backend.generate([queries[0]], max_new_tokens=2)
+    latencies, texts = [], []
+    for query in queries:
+        start = time.perf_counter()
+        text = backend.generate(
+            [query], max_new_tokens=new_tokens, min_new_tokens=new_tokens
+        )
+        latencies.append(time.perf_counter() - start)
+        texts.extend(text)
+    summary = summarize(latencies)
+    summary["tokens_per_s"] = len(queries) * new_tokens / sum(latencies)
+    return summary, texts
+
+
+def linear_megabytes(model):
+    total = 0
+    for module in model.modules():
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear):
+            weight = module.weight()
+        elif isinstance(module, torch.nn.Linear):
+            weight = module.weight
+        else:
+            continue
+        total += weight.numel() * weight.element_size()
+    return total / 2**20
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--threads", type=int)
+    args = parser.parse_args()
+
+    with open(ROOT / "DATA" / "generated-queries.json", encoding="utf-8") as file:
+        queries = [
+            prompts.classifier_prompt_1.format(user_query=query)
+            for query in json.load(file)[: args.queries]
+        ]
+
+    results = {"model": args.model, "queries": len(queries)}
+    outputs = {}
+    for name, quantize in (("float32", False), ("int8", True)):
+        backend = load(args.model, quantize, args.threads)
+        results[name], outputs[name] = run_backend(backend, queries, args.new_tokens)
+        results[name]["linear_mb"] = linear_megabytes(backend.model)
+        del backend
+    results["speedup_p50"] = results["float32"]["p50_ms"] / results["int8"]["p50_ms"]
+    # Quantization changes the logits slightly, greedy outputs may diverge
+    results["same_output"] = sum(
+        a == b for a, b in zip(outputs["float32"], outputs["int8"])
+    )
+    print(json.dumps(results, indent=2))
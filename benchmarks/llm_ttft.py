@@ -0,0 +1,108 @@
+"""
+Time to first token for the prompt templates, with and without PrefixCache.
+
+Every query of DATA/generated-queries.json is put into each template of
+LLM/prompts.py and one token is generated: once prefilling the whole prompt,
+and once reusing the cached prefill of the template's static part.
+
+By default a tiny random model (LLM/tiny_model.py) is used, so it runs
+offline. Pass --model with a Hugging Face model for real numbers.
+
+Usage:
+    python benchmarks/llm_ttft.py --queries 20
+    python benchmarks/llm_ttft.py --model TheBloke/Mistral-7B-Instruct-v0.2-GPTQ
+"""
+
+import sys
+import json
+import time
+import argparse
+
+import torch
+
+from harness import ROOT, summarize
+
+sys.path.insert(0, str(ROOT / "LLM"))
+import prompts
+from prefix_cache import PrefixCache
+
+TEMPLATES = ["classifier_prompt", "classifier_prompt_1", "split_actions"]
+
+
+def load(model_name):
+    if model_name == "tiny":
+        from tiny_model import build_tiny_model
+
+        return build_tiny_model(hidden_size=256, num_hidden_layers=4)
+    from backend import TransformersBackend
+
+    backend = TransformersBackend(model_name)
+    return backend.model, backend.tokenizer
+
+
+@torch.inference_mode()
+def first_token_uncached(model, tokenizer, prompt):
+    input_ids = tokenizer(
+        prompt, return_tensors="pt", add_special_tokens=False
+    ).input_ids.to(model.device)
+    start = time.perf_counter()
+    output = model.generate(
+        input_ids,
+        attention_mask=torch.ones_like(input_ids),
+        max_new_tokens=1,
+        do_sample=False,
+        pad_token_id=tokenizer.eos_token_id,
+    )
+    elapsed = time.perf_counter() - start
+    return elapsed, tokenizer.decode(output[0, input_ids.shape[1] :])
+
+
+def first_token_cached(cache, template, query):
+    start = time.perf_counter()
+    text = cache.generate(template, query, max_new_tokens=1)
+    return time.perf_counter() - start, text
+
+
+def run(args):
+    model, tokenizer = load(args.model)
+    with open(ROOT / "DATA" / "generated-queries.json", encoding="utf-8") as file:
+        queries = json.load(file)[: args.queries]
+
+    cache = PrefixCache(model, tokenizer)
+    results = {}
+    for name in TEMPLATES:
+        template = getattr(prompts, name)
+        # Prefill the static part before timing, that happens once per process
+        start = time.perf_counter()
+        cache.generate(template, queries[0], max_new_tokens=1)
+        warmup = time.perf_counter() - start
+
+        uncached, cached, mismatches = [], [], 0
+        for query in queries:
+            elapsed, full = first_token_uncached(
+                model, tokenizer, template.format(user_query=query)
+            )
+            uncached.append(elapsed)
+            elapsed, text = first_token_cached(cache, template, query)
+            cached.append(elapsed)
+            mismatches += full != text
+        prompt_tokens = tokenizer(template, add_special_tokens=False).input_ids
+        uncached, cached = summarize(uncached), summarize(cached)
+        results[name] = {
+            "prompt_tokens": len(prompt_tokens),
+            "prefill_once_ms": warmup * 1000,
+            "uncached": uncached,
+            "cached": cached,
+            "speedup_p50": uncached["p50_ms"] / cached["p50_ms"],
+            # Queries whose first token differs between the two
+            "mismatches": mismatches,
+        }
+    return {"model": args.model, "queries": len(queries), "templates": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
@@ -0,0 +1,69 @@
+"""
+Per-command latency of the Robot client against the local MockServer.
+
+Compares the framed receive path of Robot.send with the previous behaviour
+(fixed 80 ms sleep followed by a single recv), each against its own
+MockServer process simulating a robot that moves instantly.
+
+Usage:
+    python benchmarks/motion_latency.py --commands 200
+"""
+
+import time
+import argparse
+
+from harness import free_port, start_mock_server, stop_mock_server, connect, summarize
+from abb import Robot
+
+
+class SleepingRobot(Robot):
+    """
+    Robot with the old send path: sleep for a fixed delay, then assume a
+    single recv returns exactly one reply.
+    """
+
+    delay = 0.08
+
+    def send(self, message, wait_for_response=True, timeout=None):
+        self.sock.settimeout(self.timeout)
+        self.sock.sendall(message.encode())
+        time.sleep(self.delay)
+        if not wait_for_response:
+            return
+        return self.sock.recv(4096)
+
+
+def measure(robot_class, commands):
+    port = free_port()
+    server = start_mock_server(port, "--simulate", "--time-scale", "inf")
+    try:
+        robot = connect(robot_class, port)
+        latencies = []
+        for i in range(commands):
+            joints = [i % 90, 0, 0, 0, 90, 0]
+            start = time.perf_counter()
+            robot.set_joints(joints)
+            latencies.append(time.perf_counter() - start)
+        robot.close()
+    finally:
+        stop_mock_server(server)
+    return latencies
+
+
+def report(name, latencies):
+    summary = summarize(latencies)
+    print(
+        f"{name:<8} mean {summary['mean_ms']:8.3f} ms  "
+        f"p50 {summary['p50_ms']:8.3f} ms  "
+        f"p95 {summary['p95_ms']:8.3f} ms  "
+        f"{summary['commands_per_s']:9.1f} commands/s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--commands", type=int, default=200)
+    args = parser.parse_args()
+
+    report("sleep", measure(SleepingRobot, args.commands))
+    report("framed", measure(Robot, args.commands))
@@ -0,0 +1,216 @@
+"""
+End-to-end benchmark of abb.Robot against a local MockServer.
+
+Scenarios:
+    latency      single-command round trips (get_joints, set_joints)
+    throughput   sustained set_joints/set_cartesian
+    buffer_set   uploads of 100/1k/10k poses
+    concurrent   many clients, one thread and one Robot each
+
+The MockServer simulates a robot that moves instantly, so the numbers are
+the cost of the client, the protocol and the loopback socket. Results are
+written as JSON. Pass a previous run as --baseline to flag regressions.
+
+Usage:
+    python benchmarks/motion_protocol.py --output bench.json
+    python benchmarks/motion_protocol.py --baseline bench.json
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+
+from harness import (
+    ROOT,
+    free_port,
+    start_mock_server,
+    stop_mock_server,
+    connect,
+    summarize,
+)
+from abb import Robot
+
+# Fields compared against a baseline, and whether higher is better
+COMPARED = {"p50_ms": False, "p99_ms": False, "commands_per_s": True}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def joints_target(i):
+    return [i % 90, 0, 0, 0, 90, 0]
+
+
+def pose_target(i):
+    return [[300 + i % 100, 0, 500], [0, 0, 1, 0]]
+
+
+def bench_latency(robot, commands):
+    results = {}
+    results["get_joints"] = summarize(
+        [timed(robot.get_joints) for _ in range(commands)]
+    )
+    results["set_joints"] = summarize(
+        [timed(robot.set_joints, joints_target(i)) for i in range(commands)]
+    )
+    return results
+
+
+def bench_throughput(robot, commands):
+    results = {}
+    for name, method, target in (
+        ("set_joints", robot.set_joints, joints_target),
+        ("set_cartesian", robot.set_cartesian, pose_target),
+    ):
+        start = time.perf_counter()
+        latencies = [timed(method, target(i)) for i in range(commands)]
+        results[name] = summarize(latencies, time.perf_counter() - start)
+    return results
+
+
+def bench_buffer_set(robot, sizes, repeats):
+    results = {}
+    for size in sizes:
+        poses = [pose_target(i) for i in range(size)]
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            if not robot.buffer_set(poses):
+                raise RuntimeError(f"buffer_set of {size} poses was rejected")
+            latencies.append(time.perf_counter() - start)
+        # One clear, one add per pose and one length query per upload
+        results[str(size)] = summarize(latencies, commands=(size + 2) * repeats)
+    return results
+
+
+def bench_concurrent(port, clients, commands):
+    robots = [connect(Robot, port) for _ in range(clients)]
+    latencies = [[] for _ in robots]
+    barrier = threading.Barrier(clients + 1)
+
+    def worker(robot, out):
+        barrier.wait()
+        for i in range(commands):
+            out.append(timed(robot.set_joints, joints_target(i)))
+
+    threads = [
+        threading.Thread(target=worker, args=(robot, out))
+        for robot, out in zip(robots, latencies)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    for robot in robots:
+        robot.close()
+    merged = [latency for out in latencies for latency in out]
+    return {f"{clients}_clients": summarize(merged, elapsed)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def run(args):
+    port = free_port()
+    server = start_mock_server(
+        port, "--simulate", "--time-scale", "inf", "--max-buffer", str(max(args.sizes))
+    )
+    try:
+        robot = connect(Robot, port)
+        scenarios = {
+            "latency": bench_latency(robot, args.commands),
+            "throughput": bench_throughput(robot, args.commands),
+            "buffer_set": bench_buffer_set(robot, args.sizes, args.repeats),
+        }
+        robot.close()
+        scenarios["concurrent"] = bench_concurrent(port, args.clients, args.commands)
+    finally:
+        stop_mock_server(server)
+
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "arguments": vars(args),
+        },
+        "scenarios": scenarios,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a line per metric that is more than 'tolerance' (a fraction)
+    worse than in the baseline
+    """
+    regressions = []
+    for scenario, cases in results["scenarios"].items():
+        for case, summary in cases.items():
+            reference = baseline["scenarios"].get(scenario, {}).get(case)
+            if reference is None:
+                continue
+            for field, higher_is_better in COMPARED.items():
+                new, old = summary.get(field), reference.get(field)
+                if not new or not old:
+                    continue
+                change = (new - old) / old
+                if higher_is_better:
+                    change = -change
+                if change > tolerance:
+                    regressions.append(
+                        f"{scenario}/{case} {field}: {old:.3f} -> {new:.3f}"
+                    )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--commands", type=int, default=1000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="fraction a metric may get worse than the baseline",
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
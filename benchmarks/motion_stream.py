@@ -0,0 +1,149 @@
+"""
+Time to first motion of compound queries, streaming the calls to the robot
+(LLM/dispatch.py) versus waiting for the whole generic_function output.
+
+Each query of DATA/generated-queries.json that the fast path (LLM/fast_path.py)
+parses into two or more calls is replayed as generated output: its calls as
+compact JSON, one token of the tiny tokenizer every 1 / --tokens-per-s
+seconds. The calls run on a Robot connected to a simulated MockServer, whose
+moves take their (virtual) motion time divided by --time-scale.
+
+Pass --model with a Hugging Face model to stream real constrained output of
+classifier_prompt_1 instead of the replay.
+
+Usage:
+    python benchmarks/motion_stream.py --queries 20 --tokens-per-s 30
+    python benchmarks/motion_stream.py --model TheBloke/Mistral-7B-Instruct-v0.2-GPTQ
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from harness import (
+    ROOT,
+    free_port,
+    start_mock_server,
+    stop_mock_server,
+    connect,
+    summarize,
+)
+from abb import Robot
+
+sys.path.insert(0, str(ROOT / "LLM"))
+import prompts
+import action_models
+from fast_path import parse
+from dispatch import MotionDispatcher, stream_to_robot
+
+
+def compound_queries(count):
+    with open(ROOT / "DATA" / "generated-queries.json", encoding="utf-8") as file:
+        queries = json.load(file)
+    selected = []
+    for query in queries:
+        result = parse(query)
+        if result is not None and len(result["functions"]) >= 2:
+            selected.append((query, result))
+        if len(selected) == count:
+            break
+    return selected
+
+
+def replay(tokens, tokens_per_s):
+    """
+    Yields tokens at tokens_per_s, like a model generating them
+    """
+    start = time.perf_counter()
+    for i, token in enumerate(tokens, start=1):
+        delay = start + i / tokens_per_s - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield token
+
+
+def whole(chunks):
+    # Waits for the whole output before anything is dispatched
+    yield "".join(chunks)
+
+
+def run(args):
+    if args.model:
+        from backend import TransformersBackend
+        from constrained import ConstrainedDecoder
+
+        backend = TransformersBackend(args.model)
+        decoder = ConstrainedDecoder(backend.model, backend.tokenizer)
+        template = prompts.classifier_prompt_1
+
+        def generation(query, result):
+            return decoder.stream(
+                template.format(user_query=query),
+                action_models.generic_function,
+                max_new_tokens=args.max_new_tokens,
+            )
+
+    else:
+        from tiny_model import build_tokenizer
+
+        tokenizer = build_tokenizer()
+
+        def generation(query, result):
+            text = json.dumps(result, separators=(",", ":"))
+            ids = tokenizer(text, add_special_tokens=False).input_ids
+            tokens = [tokenizer.decode([i]) for i in ids]
+            return replay(tokens, args.tokens_per_s)
+
+    port = free_port()
+    server = start_mock_server(port, "--simulate", "--time-scale", str(args.time_scale))
+    results = {}
+    try:
+        robot = connect(Robot, port, timeout=args.timeout)
+        for mode in ("whole", "stream"):
+            first_motion, done, failed = [], [], 0
+            for query, result in compound_queries(args.queries):
+                chunks = generation(query, result)
+                if mode == "whole":
+                    chunks = whole(chunks)
+                report = stream_to_robot(chunks, MotionDispatcher(robot))
+                if report["error"] is not None or report["first_motion_s"] is None:
+                    failed += 1
+                    continue
+                first_motion.append(report["first_motion_s"])
+                done.append(report["done_s"])
+            results[mode] = {
+                "first_motion": summarize(first_motion),
+                "done": summarize(done),
+                "failed": failed,
+            }
+        robot.close()
+    finally:
+        stop_mock_server(server)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--tokens-per-s", type=float, default=30.0)
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=10.0,
+        help="virtual seconds of simulated motion per real second",
+    )
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--model", help="stream a real model instead of replaying")
+    parser.add_argument("--max-new-tokens", type=int, default=256)
+    args = parser.parse_args()
+
+    results = run(args)
+    for mode, result in results.items():
+        print(
+            f"{mode:<7} first motion p50 {result['first_motion']['p50_ms']:8.1f} ms"
+            f"  p95 {result['first_motion']['p95_ms']:8.1f} ms"
+            f"  done p50 {result['done']['p50_ms']:8.1f} ms"
+            f"  failed {result['failed']}"
+        )
+    print(json.dumps(results, indent=2))
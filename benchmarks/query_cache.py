@@ -0,0 +1,68 @@
+"""
+Lookup latency of LLM/query_cache.py, from memory and from the SQLite file.
+
+Every query of DATA/generated-queries.json is stored once, then looked up
+again in a differently written form (upper case, extra spaces, "30.0" for
+"30"), once from memory and once from a fresh QueryCache on the same file,
+as after a restart.
+
+Usage:
+    python benchmarks/query_cache.py
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import tempfile
+
+from harness import ROOT, summarize
+
+sys.path.insert(0, str(ROOT / "LLM"))
+import prompts
+from action_models import generic_function
+from query_cache import QueryCache
+
+CONTEXT = {
+    "model": "benchmark",
+    "template": prompts.classifier_prompt_1,
+    "schema": generic_function,
+}
+
+
+def rewrite(query):
+    # Same query after normalization
+    query = re.sub(r"(?<![\w.])(\d+)(?![\w.])", r"\1.0", query)
+    return "  " + query.upper().replace(" ", "  ") + " "
+
+
+def lookups(cache, queries):
+    latencies, misses = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        result = cache.get(rewrite(query), **CONTEXT)
+        latencies.append(time.perf_counter() - start)
+        misses += result is None
+    summary = summarize(latencies)
+    summary["misses"] = misses
+    return summary
+
+
+if __name__ == "__main__":
+    with open(ROOT / "DATA" / "generated-queries.json", encoding="utf-8") as file:
+        queries = list(dict.fromkeys(json.load(file)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "queries.sqlite")
+        cache = QueryCache(path, max_entries=len(queries))
+        for query in queries:
+            cache.put(query, {"functions": [], "query": query}, **CONTEXT)
+        memory = lookups(cache, queries)
+        cache.close()
+
+        cache = QueryCache(path, max_entries=len(queries))
+        disk = lookups(cache, queries)
+        cache.close()
+    results = {"queries": len(queries), "memory": memory, "disk": disk}
+    print(json.dumps(results, indent=2))
@@ -60,7 +60,7 @@ PROC main()
 		
 		!Cartesian Coordinates
 		position := CRobT(\Tool:=currentTool \WObj:=currentWObj);
-		data := "# 0 ";
+		data := "0 ";
 		data := data + date + " " + time + " ";
 		data := data + NumToStr(ClkRead(timer),2) + " ";
 		data := data + NumToStr(position.trans.x,1) + " ";
@@ -69,7 +69,7 @@ PROC main()
 		data := data + NumToStr(position.rot.q1,3) + " ";
 		data := data + NumToStr(position.rot.q2,3) + " ";
 		data := data + NumToStr(position.rot.q3,3) + " ";
-		data := data + NumToStr(position.rot.q4,3); !End of string	
+		data := data + NumToStr(position.rot.q4,3) + " #"; !End of string	
 		IF connected = TRUE THEN
 			SocketSend clientSocket \Str:=data;
 		ENDIF
@@ -77,7 +77,7 @@ PROC main()
 	
 		!Joint Coordinates
 		joints := CJointT();
-		data := "# 1 ";
+		data := "1 ";
 		data := data + date + " " + time + " ";
 		data := data + NumToStr(ClkRead(timer),2) + " ";
 		data := data + NumToStr(joints.robax.rax_1,2) + " ";
@@ -85,7 +85,7 @@ PROC main()
 		data := data + NumToStr(joints.robax.rax_3,2) + " ";
 		data := data + NumToStr(joints.robax.rax_4,2) + " ";
 		data := data + NumToStr(joints.robax.rax_5,2) + " ";
-		data := data + NumToStr(joints.robax.rax_6,2); !End of string
+		data := data + NumToStr(joints.robax.rax_6,2) + " #"; !End of string
 		IF connected = TRUE THEN
 			SocketSend clientSocket \Str:=data;
 		ENDIF
@@ -38,6 +38,7 @@ CONST num MAX_BUFFER := 512;
 VAR num BUFFER_POS := 0;
 VAR robtarget bufferTargets{MAX_BUFFER};
 VAR speeddata bufferSpeeds{MAX_BUFFER};
+VAR zonedata bufferZones{MAX_BUFFER};
 
 !//External axis position variables
 VAR extjoint externalAxis;
@@ -57,6 +58,20 @@ CONST num SERVER_OK := 1;
 !LOCAL METHODS
 !////////////////
 
+!//Reads a single message, up to and including its "#", from the client.
+!// Clients may pipeline several messages back to back, reading one byte
+!// at a time keeps them from being merged into one string.
+PROC ReceiveMsg(INOUT string msg)
+    VAR string byteString := "";
+
+    msg := "";
+    WHILE byteString <> "#" DO
+        SocketReceive clientSocket \Str:=byteString \ReadNoOfBytes:=1 \Time:=WAIT_MAX;
+        msg := msg + byteString;
+    ENDWHILE
+ENDPROC
+
+
 !//Method to parse the message received from a PC
 !// If correct message, loads values on:
 !// - instructionCode.
@@ -180,7 +195,7 @@ PROC main()
         addString := "";            
 
         !//Wait for a command
-        SocketReceive clientSocket \Str:=receivedString \Time:=WAIT_MAX;
+        ReceiveMsg receivedString;
         ParseMsg receivedString;
 	
         !//Execution of the command
@@ -335,6 +350,7 @@ PROC main()
                         BUFFER_POS := BUFFER_POS + 1;
                         bufferTargets{BUFFER_POS} := cartesianTarget;
                         bufferSpeeds{BUFFER_POS} := currentSpeed;
+                        bufferZones{BUFFER_POS} := currentZone;
                     ENDIF
                     ok := SERVER_OK;
                 ELSE
@@ -358,9 +374,10 @@ PROC main()
                 ENDIF
 
             CASE 33: !Execute moves in cartesianBuffer as linear moves
-                IF nParams = 0 THEN
+                !Optional parameter: expected buffer size, nothing moves if it differs
+                IF nParams = 0 OR (nParams = 1 AND params{1} = BUFFER_POS) THEN
                     FOR i FROM 1 TO (BUFFER_POS) DO 
-                        MoveL bufferTargets{i}, bufferSpeeds{i}, currentZone, currentTool \WObj:=currentWobj ;
+                        MoveL bufferTargets{i}, bufferSpeeds{i}, bufferZones{i}, currentTool \WObj:=currentWobj ;
                     ENDFOR			
                     ok := SERVER_OK;
                 ELSE
@@ -441,6 +458,7 @@ PROC main()
 				    sendString := NumToStr(instructionCode,0);
                     sendString := sendString + " " + NumToStr(ok,0);
                     sendString := sendString + " " + addString;
+                    sendString := sendString + " #";
                     SocketSend clientSocket \Str:=sendString;
 			    ENDIF
             ENDIF
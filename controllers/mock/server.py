@@ -1,20 +1,67 @@
 import os
 import json
+import time
+import heapq
 import socket
+import logging
+import selectors
+from itertools import count
 from typing_extensions import Callable
 
 from .models import Pose
+from .simulator import RobotSimulator
+
+# Mirrors the SERVER_BAD_MSG/SERVER_OK codes and reply terminator of SERVER.mod
+SERVER_BAD_MSG = 0
+SERVER_OK = 1
+REPLY_TERMINATOR = "#"
+
+log = logging.getLogger(__name__)
+
+
+class Client:
+    """
+    State of one connected client
+    """
+
+    def __init__(self, sock: socket.socket, addr: tuple) -> None:
+        self.sock = sock
+        self.addr = addr
+        self.pending = ""
+        self.outgoing = bytearray()
+        self.waiting_to_write = False
+        # Like the controller, a client's messages are executed one after
+        # another, so an injected delay also holds back the replies behind it
+        self.busy_until = 0.0
 
 
 class MockServer:
-    def __init__(self, port: int = 5000) -> None:
+    def __init__(
+        self,
+        port: int = 5000,
+        log_level: int | str = logging.INFO,
+        latency: dict[str, float] | None = None,
+        simulator: RobotSimulator | None = None,
+    ) -> None:
+        """
+        port: PORT in the environment takes precedence, 0 picks a free port
+        log_level: logging level of the server, DEBUG logs every message
+        latency: seconds added before replying to each opcode, e.g. {"01": 0.05}
+        simulator: answer every instruction from a simulated robot, and
+                   delay motion replies by its (virtual) motion time
+        """
         self.port = int(os.environ.get("PORT", str(port)))
+        log.setLevel(log_level)
+        self.latency = latency or {}
+        self.simulator = simulator
 
         self.connection = socket.socket()
         # next line allows for port reuse
         self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
         self.connection.bind(("", self.port))
+        # PORT=0 binds an ephemeral port, report the one we actually got
+        self.port = self.connection.getsockname()[1]
         self.function_dict = {
             "01": self.move_tcp,
             "02": self.set_joints,
@@ -22,74 +69,203 @@ class MockServer:
             "06": self.set_tool,
         }
 
+        self.selector = selectors.DefaultSelector()
+        self.clients: set[Client] = set()
+        # Delayed replies: (due time, sequence number, client, reply)
+        self.scheduled: list[tuple[float, int, Client, bytes]] = []
+        self.sequence = count()
+        self.running = False
+
     def run(self) -> None:
-        self.connection.listen(5)
-        print(f"Server listening on port: {self.port}")
-        self.connection, addr = self.connection.accept()
-        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        """
+        Serves any number of clients at once until stop() is called.
+        """
+        self.connection.listen(128)
+        self.connection.setblocking(False)
+        self.selector.register(self.connection, selectors.EVENT_READ)
+        log.info(f"Server listening on port: {self.port}")
+
+        self.running = True
+        try:
+            while self.running:
+                timeout = 0.5
+                if self.scheduled:
+                    timeout = max(0.0, self.scheduled[0][0] - time.monotonic())
+                for key, events in self.selector.select(timeout):
+                    if key.data is None:
+                        self.accept()
+                        continue
+                    client = key.data
+                    if events & selectors.EVENT_READ:
+                        self.read(client)
+                    if events & selectors.EVENT_WRITE and client in self.clients:
+                        self.write(client)
+                self.send_scheduled()
+        finally:
+            for client in list(self.clients):
+                self.disconnect(client)
+            self.selector.unregister(self.connection)
+            self.connection.close()
+
+    def stop(self) -> None:
+        self.running = False
+
+    def accept(self) -> None:
+        sock, addr = self.connection.accept()
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = Client(sock, addr)
+        self.clients.add(client)
+        self.selector.register(sock, selectors.EVENT_READ, client)
+        log.info(f"Accepted connection from: {addr}")
 
-        with self.connection:
-            print(f"Accepted connection from: {addr}")
-            while True:
-                data = self.connection.recv(4096)
-                if not data:
-                    continue
-                message = str(data, encoding="utf-8")
-                print(f"Message recieved: {message}")
-                action, parameters = self.parse_message(message)
+    def disconnect(self, client: Client) -> None:
+        log.info(f"Closed connection from: {client.addr}")
+        self.clients.discard(client)
+        self.selector.unregister(client.sock)
+        client.sock.close()
 
-                if action is None:
-                    self.connection.send(b"!")
-                    continue
+    def read(self, client: Client) -> None:
+        try:
+            data = client.sock.recv(4096)
+        except ConnectionError:
+            data = b""
+        if not data:
+            self.disconnect(client)
+            return
 
-                fn = self.get_function(action)
-                if fn is None:
-                    self.connection.send(b"!")
-                    continue
+        # Clients may pipeline messages, so split the stream on the
+        # "#" that ends every message rather than trusting recv
+        client.pending += str(data, encoding="utf-8")
+        now = time.monotonic()
+        while "#" in client.pending:
+            message, _, client.pending = client.pending.partition("#")
+            message = message.strip() + "#"
+            if message[:-1].split()[:1] == ["99"]:
+                # Like SERVER.mod, close the connection without replying
+                self.disconnect(client)
+                return
+            reply, delay = self.handle_message(message)
 
-                fn(parameters)
-                self.connection.send(b"#")
+            delay += self.latency.get(message[:2], 0.0)
+            if delay > 0 or client.busy_until > now:
+                client.busy_until = max(now, client.busy_until) + delay
+                heapq.heappush(
+                    self.scheduled,
+                    (client.busy_until, next(self.sequence), client, reply),
+                )
+            else:
+                self.queue_reply(client, reply)
+
+    def send_scheduled(self) -> None:
+        now = time.monotonic()
+        while self.scheduled and self.scheduled[0][0] <= now:
+            _, _, client, reply = heapq.heappop(self.scheduled)
+            if client in self.clients:
+                self.queue_reply(client, reply)
+
+    def queue_reply(self, client: Client, reply: bytes) -> None:
+        if client not in self.clients:
+            return
+        if not client.outgoing:
+            client.outgoing += reply
+            self.write(client)
+        else:
+            client.outgoing += reply
+
+    def write(self, client: Client) -> None:
+        try:
+            sent = client.sock.send(client.outgoing)
+        except BlockingIOError:
+            sent = 0
+        except ConnectionError:
+            self.disconnect(client)
+            return
+        del client.outgoing[:sent]
+        # Only watch for writability while a reply is stuck in the buffer
+        if bool(client.outgoing) != client.waiting_to_write:
+            client.waiting_to_write = bool(client.outgoing)
+            events = selectors.EVENT_READ
+            if client.waiting_to_write:
+                events |= selectors.EVENT_WRITE
+            self.selector.modify(client.sock, events, client)
+
+    def handle_message(self, message: str) -> tuple[bytes, float]:
+        """
+        Returns the reply to message, and how long (in seconds) executing
+        it takes before the reply is sent
+        """
+        log.debug("Message recieved: %s", message)
+        action, parameters = self.parse_message(message)
+
+        if action is None:
+            return self.format_reply("0", SERVER_BAD_MSG), 0.0
+
+        if self.simulator is not None:
+            ok, data, duration = self.simulator.execute(action, parameters)
+            return (
+                self.format_reply(action, ok, data),
+                self.simulator.real_time(duration),
+            )
+
+        fn = self.get_function(action)
+        if fn is None:
+            return self.format_reply(action, SERVER_BAD_MSG), 0.0
+
+        fn(parameters)
+        return self.format_reply(action, SERVER_OK), 0.0
 
     def parse_message(self, message: str) -> tuple[str | None, list]:
         if not len(message):
-            print("[ERROR] Invalid instruction, empty message")
+            log.error("Invalid instruction, empty message")
             return None, []
 
         if message[-1] != "#":
-            print("[ERROR] Invalid instruction, wrong format")
+            log.error("Invalid instruction, wrong format")
             return None, []
 
         instruction = message[:-1].split()
+        if not instruction:
+            log.error("Invalid instruction, empty message")
+            return None, []
         action, parameters = instruction[0], instruction[1:]
         return action, parameters
 
+    def format_reply(self, action: str, ok: int, data: str = "") -> bytes:
+        """
+        Builds a reply the way SERVER.mod does: "<code> <ok> <data> #"
+        """
+        code = int(action) if action.isdigit() else 0
+        return f"{code} {ok} {data} {REPLY_TERMINATOR}".encode()
+
     def get_function(self, action: str) -> Callable[[any], None] | None:
         if action not in self.function_dict.keys():
-            print(f"[ERROR] Invalid action {action}")
+            log.error(f"Invalid action {action}")
             return None
 
         return self.function_dict[action]
 
-    def get_joints(self) -> None:
+    def get_joints(self, parameters: list) -> None:
         """
         Returns the current angles of the robots joints, in degrees.
         """
-        print("Recieved get_joints action")
+        log.debug("Recieved get_joints action")
 
     def set_joints(self, joints: list) -> None:
         """
         Executes a move immediately, from current joint angles,
         to 'joints', in degrees.
         """
-        print(f"Recieved set_joints action with parameters: {joints}")
+        log.debug("Recieved set_joints action with parameters: %s", joints)
 
     def set_tool(self, tool: list = [[0, 0, 0], [1, 0, 0, 0]]) -> None:
-        print(f"Recieved set_tool action with parameters: {tool}")
+        log.debug("Recieved set_tool action with parameters: %s", tool)
 
     def move_tcp(self, pose: Pose) -> None:
-        print(f"Recieved move_tcp action with parameters: {json.dumps(pose)}")
+        log.debug("Recieved move_tcp action with parameters: %s", json.dumps(pose))
 
 
 if __name__ == "__main__":
-    server = MockServer()
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+    server = MockServer(log_level=os.environ.get("LOG_LEVEL", "INFO"))
     server.run()
@@ -0,0 +1,206 @@
+import math
+
+# Mirrors the SERVER_BAD_MSG/SERVER_OK codes of SERVER.mod
+SERVER_BAD_MSG = 0
+SERVER_OK = 1
+
+# Same limit as MAX_BUFFER in SERVER.mod
+MAX_BUFFER = 512
+
+
+class RobotSimulator:
+    """
+    Keeps the state the SERVER module keeps (joints, pose, tool, workobject,
+    speed, zone, external axis and the remote buffer) and executes every
+    instruction code abb.Robot uses against it.
+
+    Motion takes the time the commanded speed implies on a virtual clock,
+    self.clock. time_scale is how many virtual seconds pass per real second,
+    so MockServer delays a motion reply by duration / time_scale, and
+    float("inf") answers at once while the virtual clock still advances.
+
+    There is no kinematic model: joint moves only change the joints and
+    cartesian moves only change the pose.
+    """
+
+    def __init__(self, time_scale: float = 1.0, max_buffer: int = MAX_BUFFER) -> None:
+        """
+        max_buffer: remote buffer size, raise it to benchmark large uploads
+        """
+        self.time_scale = time_scale
+        self.max_buffer = max_buffer
+        self.clock = 0.0
+
+        # Defaults of Initialize in SERVER.mod
+        self.joints = [0.0, 0.0, 0.0, 0.0, 90.0, 0.0]
+        self.pose = [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0]]
+        self.tool = [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0]]
+        self.workobject = [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0]]
+        self.speed = [100.0, 50.0, 0.0, 0.0]
+        self.zone = [False, 0.3, 0.3, 0.03]
+        self.external_axis = [0.0] * 6
+        # (target, speed, zone) of every added pose
+        self.buffer: list[tuple[list, list, list]] = []
+        self.circ_point = None
+
+        # instruction code: (handler, accepted parameter counts)
+        self.instructions = {
+            0: (self.ping, {0}),
+            1: (self.move_linear, {7}),
+            2: (self.move_joints, {6}),
+            3: (self.get_cartesian, {0}),
+            4: (self.get_joints, {0}),
+            5: (self.get_external_axis, {0}),
+            6: (self.set_tool, {7}),
+            7: (self.set_workobject, {7}),
+            8: (self.set_speed, {2, 4}),
+            9: (self.set_zone, {4}),
+            30: (self.buffer_add, {7}),
+            31: (self.buffer_clear, {0}),
+            32: (self.buffer_len, {0}),
+            33: (self.buffer_execute, {0, 1}),
+            34: (self.move_external_axis, {6}),
+            35: (self.set_circ_point, {7}),
+            36: (self.move_circular, {7}),
+            98: (self.get_robotinfo, {0}),
+            99: (self.ping, {0}),
+        }
+
+    def execute(self, action: str, parameters: list) -> tuple[int, str, float]:
+        """
+        Runs one instruction, returns (ok, reply data, duration in virtual
+        seconds) and advances the clock by the duration.
+        """
+        try:
+            code = int(action)
+            params = [float(p) for p in parameters]
+        except ValueError:
+            return SERVER_BAD_MSG, "", 0.0
+        if code not in self.instructions:
+            return SERVER_BAD_MSG, "", 0.0
+        handler, counts = self.instructions[code]
+        if len(params) not in counts:
+            return SERVER_BAD_MSG, "", 0.0
+
+        result = handler(params)
+        if result is None:
+            return SERVER_BAD_MSG, "", 0.0
+        data, duration = result
+        self.clock += duration
+        return SERVER_OK, data, duration
+
+    def real_time(self, duration: float) -> float:
+        return duration / self.time_scale
+
+    # Timing
+
+    def travel(self, amount: float, speed: float) -> float:
+        if not amount:
+            return 0.0
+        # A zero speed would stall the real robot, keep the clock finite
+        return amount / max(speed, 1e-3)
+
+    def linear_duration(self, start: list, end: list, speed: list) -> float:
+        distance = math.dist(start[0], end[0])
+        dot = abs(sum(a * b for a, b in zip(start[1], end[1])))
+        rotation = math.degrees(2 * math.acos(min(1.0, dot)))
+        return max(self.travel(distance, speed[0]), self.travel(rotation, speed[1]))
+
+    def arc_duration(self, start: list, via: list, end: list, speed: list) -> float:
+        # Chord lengths through the via point underestimate the arc slightly
+        distance = math.dist(start[0], via[0]) + math.dist(via[0], end[0])
+        return self.travel(distance, speed[0])
+
+    def joint_duration(self, start: list, end: list) -> float:
+        rotation = max(abs(a - b) for a, b in zip(start, end))
+        return self.travel(rotation, self.speed[1])
+
+    # Instructions, each takes the parsed parameters and returns (data, duration),
+    # or None to reject the instruction
+
+    def ping(self, params: list) -> tuple[str, float]:
+        return "", 0.0
+
+    def move_linear(self, params: list) -> tuple[str, float]:
+        target = [params[0:3], params[3:7]]
+        duration = self.linear_duration(self.pose, target, self.speed)
+        self.pose = target
+        return "", duration
+
+    def move_joints(self, params: list) -> tuple[str, float]:
+        duration = self.joint_duration(self.joints, params)
+        self.joints = params
+        return "", duration
+
+    def get_cartesian(self, params: list) -> tuple[str, float]:
+        position = " ".join(format(v, ".2f") for v in self.pose[0])
+        rotation = " ".join(format(v, ".3f") for v in self.pose[1])
+        return f"{position} {rotation}", 0.0
+
+    def get_joints(self, params: list) -> tuple[str, float]:
+        return " ".join(format(v, ".2f") for v in self.joints), 0.0
+
+    def get_external_axis(self, params: list) -> tuple[str, float]:
+        return " ".join(format(v, ".2f") for v in self.external_axis), 0.0
+
+    def set_tool(self, params: list) -> tuple[str, float]:
+        self.tool = [params[0:3], params[3:7]]
+        return "", 0.0
+
+    def set_workobject(self, params: list) -> tuple[str, float]:
+        self.workobject = [params[0:3], params[3:7]]
+        return "", 0.0
+
+    def set_speed(self, params: list) -> tuple[str, float]:
+        self.speed = params + self.speed[len(params) :]
+        return "", 0.0
+
+    def set_zone(self, params: list) -> tuple[str, float]:
+        if params[0] == 1:
+            self.zone = [True, 0.0, 0.0, 0.0]
+        else:
+            self.zone = [False] + params[1:4]
+        return "", 0.0
+
+    def buffer_add(self, params: list) -> tuple[str, float]:
+        if len(self.buffer) < self.max_buffer:
+            self.buffer.append(
+                ([params[0:3], params[3:7]], list(self.speed), list(self.zone))
+            )
+        return "", 0.0
+
+    def buffer_clear(self, params: list) -> tuple[str, float]:
+        self.buffer = []
+        return "", 0.0
+
+    def buffer_len(self, params: list) -> tuple[str, float]:
+        return format(len(self.buffer), ".2f"), 0.0
+
+    def buffer_execute(self, params: list) -> tuple[str, float] | None:
+        # Like SERVER.mod, an expected size that does not match moves nothing
+        if params and params[0] != len(self.buffer):
+            return None
+        duration = 0.0
+        for target, speed, _ in self.buffer:
+            duration += self.linear_duration(self.pose, target, speed)
+            self.pose = target
+        return "", duration
+
+    def move_external_axis(self, params: list) -> tuple[str, float]:
+        duration = self.joint_duration(self.external_axis, params)
+        self.external_axis = params
+        return "", duration
+
+    def set_circ_point(self, params: list) -> tuple[str, float]:
+        self.circ_point = [params[0:3], params[3:7]]
+        return "", 0.0
+
+    def move_circular(self, params: list) -> tuple[str, float]:
+        target = [params[0:3], params[3:7]]
+        via = self.circ_point or target
+        duration = self.arc_duration(self.pose, via, target, self.speed)
+        self.pose = target
+        return "", duration
+
+    def get_robotinfo(self, params: list) -> tuple[str, float]:
+        return "SIM-0001*MOCK_1.0*RobotSimulator", 0.0
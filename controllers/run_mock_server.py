@@ -1,5 +1,46 @@
+import logging
+import argparse
+
 from mock.server import MockServer
+from mock.simulator import RobotSimulator
 
 if __name__ == "__main__":
-    server = MockServer()
+    parser = argparse.ArgumentParser(description="Local stand-in for the RAPID SERVER")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "--log-level", default="INFO", help="DEBUG logs every message, WARNING is quiet"
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="OPCODE=SECONDS",
+        help="delay replies to an opcode, e.g. --latency 01=0.05",
+    )
+    parser.add_argument(
+        "--simulate", action="store_true", help="answer from a simulated robot"
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=1.0,
+        help="virtual seconds of simulated motion per real second, inf for no waiting",
+    )
+    parser.add_argument(
+        "--max-buffer", type=int, default=512, help="simulated remote buffer size"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(format="[%(asctime)s] %(levelname)-7s %(message)s")
+    latency = {}
+    for entry in args.latency:
+        opcode, seconds = entry.split("=")
+        latency[opcode.zfill(2)] = float(seconds)
+
+    simulator = None
+    if args.simulate:
+        simulator = RobotSimulator(args.time_scale, args.max_buffer)
+    server = MockServer(
+        args.port, log_level=args.log_level, latency=latency, simulator=simulator
+    )
     server.run()
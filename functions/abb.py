@@ -9,25 +9,75 @@ targets can be passed as [[XYZ], [Quats]] OR [XYZ, Quats]
 
 """
 
+import sys
 import socket
 import json
 import time
-import inspect
-from threading import Thread
-from collections import deque
 import logging
 
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
+# Every reply from the SERVER module ends with this byte, so a reply is
+# complete as soon as it shows up in the receive buffer.
+REPLY_TERMINATOR = b"#"
+# Instruction codes of moves: the robot only replies to them once it has
+# finished the move, however long that takes.
+MOTION_CODES = {"01", "02", "33", "34", "36"}
+
+zone_dict = {
+    "z0": [0.3, 0.3, 0.03],
+    "z1": [1, 1, 0.1],
+    "z5": [5, 8, 0.8],
+    "z10": [10, 15, 1.5],
+    "z15": [15, 23, 2.3],
+    "z20": [20, 30, 3],
+    "z30": [30, 45, 4.5],
+    "z50": [50, 75, 7.5],
+    "z100": [100, 150, 15],
+    "z200": [200, 300, 30],
+}
+
 
 class Robot:
-    def __init__(self, ip="192.168.125.1", port_motion=5000, port_logger=5001):
-        self.delay = 0.08
+    def __init__(
+        self,
+        ip="192.168.125.1",
+        port_motion=5000,
+        port_logger=5001,
+        timeout=2.5,
+        telemetry=False,
+        metrics=None,
+        motion_timeout=None,
+    ):
+        """
+        timeout: seconds to wait for a complete reply to a command before
+                 socket.timeout is raised
+        motion_timeout: the same for moves (MOTION_CODES), which are only
+                        answered once the robot has finished them.
+                        None waits as long as the move takes.
+        telemetry: also connect to the LOGGER module on port_logger, and
+                   serve get_cartesian/get_joints from its stream
+        metrics: a metrics.RobotMetrics (or anything with its record and
+                 record_timeout methods) to record every command in,
+                 None to record nothing
+        """
+        self.timeout = timeout
+        self.motion_timeout = motion_timeout
+        self.metrics = metrics
+        self.recv_buffer = bytearray()
+        # Replies still owed to commands that timed out
+        self.stale = 0
+        # Last (message, reply) that set each controller setting, see
+        # send_setting. Units stay on this side, they only scale the
+        # messages, so changing them changes the messages compared here.
+        self.state = {}
+        self.saved_round_trips = 0
+        self.telemetry = None
 
         self.connect_motion((ip, port_motion))
-        # log_thread = Thread(target = self.get_net,
-        #                    args   = ((ip, port_logger))).start()
+        if telemetry:
+            self.connect_logger((ip, port_logger))
 
         self.ip = ip
         self.port_motion = port_motion
@@ -42,24 +92,26 @@ class Robot:
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.settimeout(2.5)
         self.sock.connect(remote)
-        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.recv_buffer.clear()
+        self.stale = 0
+        # Settings may have been changed while we were not connected
+        self.state.clear()
         log.info("Connected to robot motion server at %s", str(remote))
 
     def connect_logger(self, remote, maxlen=None):
-        self.pose = deque(maxlen=maxlen)
-        self.joints = deque(maxlen=maxlen)
+        """
+        Starts a background reader on the LOGGER module. While its samples
+        are fresh, get_cartesian and get_joints are answered from them
+        instead of asking the motion server.
 
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.connect(remote)
-        s.setblocking(1)
-        try:
-            while True:
-                data = map(float, s.recv(4096).split())
-                if int(data[1]) == 0:
-                    self.pose.append([data[2:5], data[5:]])
-                # elif int(data[1]) == 1: self.joints.append([a[2:5], a[5:]])
-        finally:
-            s.shutdown(socket.SHUT_RDWR)
+        maxlen: number of samples kept, see self.telemetry.poses/joints
+        """
+        from telemetry import Telemetry
+
+        if self.telemetry is not None:
+            self.telemetry.stop()
+        self.telemetry = Telemetry(remote, capacity=maxlen or 4096).start()
 
     def set_units(self, linear, angular):
         units_l = {"millimeters": 1.0, "meters": 1000.0, "inches": 25.4}
@@ -82,16 +134,17 @@ class Robot:
         """
         if len(joints) != 6:
             return False
-        msg = "02 "
-        for joint in joints:
-            msg += format(joint * self.scale_angle, "+08.2f") + " "
-        msg += "#"
+        msg = "02 " + format_joints([joint * self.scale_angle for joint in joints])
         return self.send(msg)
 
     def get_cartesian(self):
         """
         Returns the current pose of the robot, in millimeters
         """
+        if self.telemetry is not None:
+            pose = self.telemetry.latest_pose()
+            if pose is not None:
+                return pose
         msg = "03 #"
         data = self.send(msg).split()
         r = [float(s) for s in data]
@@ -101,6 +154,10 @@ class Robot:
         """
         Returns the current angles of the robots joints, in degrees.
         """
+        if self.telemetry is not None:
+            joints = self.telemetry.latest_joints()
+            if joints is not None:
+                return [joint / self.scale_angle for joint in joints]
         msg = "04 #"
         data = self.send(msg).split()
         return [float(s) / self.scale_angle for s in data[2:8]]
@@ -122,7 +179,8 @@ class Robot:
         ['24-53243', 'ROBOTWARE_5.12.1021.01', '2400/16 Type B']
         """
         msg = "98 #"
-        data = str(self.send(msg))[5:].split("*")
+        # Reply is "98 1 <serial>*<version>*<type>"
+        data = self.send(msg).decode().split(" ", 2)[2].split("*")
         log.debug("get_robotinfo result: %s", str(data))
         return data
 
@@ -136,7 +194,7 @@ class Robot:
         tool flange center axis and the flange face.
         """
         msg = "06 " + self.format_pose(tool)
-        self.send(msg)
+        self.send_setting("tool", msg)
         self.tool = tool
 
     def load_json_tool(self, file_obj):
@@ -155,7 +213,7 @@ class Robot:
         then subsequent cartesian moves will be in this coordinate frame.
         """
         msg = "07 " + self.format_pose(work_obj)
-        self.send(msg)
+        self.send_setting("workobject", msg)
 
     def set_speed(self, speed=[100, 50, 50, 50]):
         """
@@ -165,26 +223,10 @@ class Robot:
 
         if len(speed) != 4:
             return False
-        msg = "08 "
-        msg += format(speed[0], "+08.1f") + " "
-        msg += format(speed[1], "+08.2f") + " "
-        msg += format(speed[2], "+08.1f") + " "
-        msg += format(speed[3], "+08.2f") + " #"
-        self.send(msg)
+        msg = "08 " + format_speed(speed)
+        self.send_setting("speed", msg)
 
     def set_zone(self, zone_key="z1", point_motion=False, manual_zone=[]):
-        zone_dict = {
-            "z0": [0.3, 0.3, 0.03],
-            "z1": [1, 1, 0.1],
-            "z5": [5, 8, 0.8],
-            "z10": [10, 15, 1.5],
-            "z15": [15, 23, 2.3],
-            "z20": [20, 30, 3],
-            "z30": [30, 45, 4.5],
-            "z50": [50, 75, 7.5],
-            "z100": [100, 150, 15],
-            "z200": [200, 300, 30],
-        }
         """
         Sets the motion zone of the robot. This can also be thought of as
         the flyby zone, AKA if the robot is going from point A -> B -> C,
@@ -202,43 +244,71 @@ class Robot:
                    is not rigidly constrained
         zone_ori: degrees, zone size for the tool reorientation
         """
-
-        if point_motion:
-            zone = [0, 0, 0]
-        elif len(manual_zone) == 3:
-            zone = manual_zone
-        elif zone_key in zone_dict.keys():
-            zone = zone_dict[zone_key]
-        else:
+        zone = format_zone(zone_key, point_motion, manual_zone)
+        if zone is None:
             return False
-
-        msg = "09 "
-        msg += str(int(point_motion)) + " "
-        msg += format(zone[0], "+08.4f") + " "
-        msg += format(zone[1], "+08.4f") + " "
-        msg += format(zone[2], "+08.4f") + " #"
-        self.send(msg)
+        msg = "09 " + zone
+        self.send_setting("zone", msg)
 
     def buffer_add(self, pose):
         """
         Appends single pose to the remote buffer
-        Move will execute at current speed (which you can change between buffer_add calls)
+        Move will execute at current speed and zone (which you can change between buffer_add calls)
         """
         msg = "30 " + self.format_pose(pose)
         self.send(msg)
 
-    def buffer_set(self, pose_list):
+    def buffer_set(self, pose_list, zones=None):
         """
-        Adds every pose in pose_list to the remote buffer
+        Replaces the remote buffer with every pose in pose_list.
+
+        zones: optional zone_dict key (or "fine" for point motion) per pose,
+               see path.simplify_path. The robot is left in the last zone.
+
+        The clear, every add and the final length check are sent in
+        pipelined mode, so the upload is bound by the socket rather than by
+        one round trip per pose. Every rejected pose is logged with its index.
         """
-        self.clear_buffer()
-        for pose in pose_list:
-            self.buffer_add(pose)
-        if self.buffer_len() == len(pose_list):
+        messages = ["31 #"]
+        # Index of the last zone message, which leaves the robot in its zone
+        zone_index = None
+        if zones is None:
+            messages += ["30 " + self.format_pose(pose) for pose in pose_list]
+        else:
+            if len(zones) != len(pose_list):
+                return False
+            zone = None
+            for pose, key in zip(pose_list, zones):
+                # Each pose is stored with the zone current when it is added
+                if key != zone:
+                    msg = format_zone(key, point_motion=key == "fine")
+                    if msg is None:
+                        return False
+                    zone_index = len(messages)
+                    messages.append("09 " + msg)
+                    zone = key
+                messages.append("30 " + self.format_pose(pose))
+        messages.append("32 #")
+        if zone_index is not None:
+            self.state.pop("zone", None)
+        replies = self.send_pipelined(messages)
+        if zone_index is not None:
+            message, reply = messages[zone_index], replies[zone_index]
+            if reply_ok(message, reply):
+                self.state["zone"] = (message, reply)
+
+        failed = False
+        for index, (message, reply) in enumerate(zip(messages, replies)):
+            if not reply_ok(message, reply):
+                failed = True
+                log.warning(
+                    "buffer_set: %r rejected by robot, reply: %s", message, reply
+                )
+        if not failed and int(float(replies[-1].split()[2])) == len(pose_list):
             log.debug("Successfully added %i poses to remote buffer", len(pose_list))
             return True
         else:
-            log.warn("Failed to add poses to remote buffer!")
+            log.warning("Failed to add poses to remote buffer!")
             self.clear_buffer()
             return False
 
@@ -265,14 +335,81 @@ class Robot:
         msg = "33 #"
         return self.send(msg)
 
+    def execute_trajectory(self, poses, chunk_size=None, timeout=None):
+        """
+        Executes linear moves through every row of poses, an (N, 7) array
+        (or anything numpy.asarray turns into one) of [x, y, z, q1, q2, q3, q4]
+        rows, at the current speed and zone.
+
+        Trajectories longer than the remote buffer are sent in chunks of
+        chunk_size poses (defaults to the buffer size). The next chunk is
+        loaded into the buffer right behind the execute of the current one,
+        so the robot loads it as soon as it is done, but its execute is only
+        sent once the current chunk has executed and the whole next chunk
+        made it into the buffer.
+
+        timeout: seconds to wait for one chunk to finish executing,
+                 defaults to motion_timeout
+        Returns True if every chunk executed, False if the robot rejected
+        one, in which case nothing after it executes.
+        """
+        from trajectory import MAX_BUFFER, encode_trajectory
+
+        chunks = encode_trajectory(poses, self.scale_linear, chunk_size or MAX_BUFFER)
+        timeout = self.motion_timeout if timeout is None else timeout
+        log.debug("execute_trajectory sending %i chunks", len(chunks))
+        # Replies owed for the messages written so far, and received so far
+        owed = 0
+        received = 0
+
+        def write(payload, count, write_timeout):
+            nonlocal owed
+            self.sock.settimeout(write_timeout)
+            self.sock.sendall(payload)
+            owed += count
+
+        def accepted(index, count, reply_timeout):
+            nonlocal received
+            replies = []
+            for _ in range(count):
+                replies.append(self.recv_reply(reply_timeout))
+                received += 1
+            if all(reply.split()[1:2] == [b"1"] for reply in replies):
+                return True
+            log.warning(
+                "execute_trajectory: chunk %i rejected by robot, replies: %s",
+                index,
+                replies,
+            )
+            self.stale += owed - received
+            return False
+
+        if not chunks:
+            return True
+        try:
+            load, _, count = chunks[0]
+            write(load, count, self.timeout)
+            for index, (_, execute, count) in enumerate(chunks):
+                # Its clear and adds
+                if not accepted(index, count, self.timeout):
+                    return False
+                write(execute, 1, self.timeout)
+                if index + 1 < len(chunks):
+                    # sendall may block until the robot is done with this chunk
+                    load, _, next_count = chunks[index + 1]
+                    write(load, next_count, timeout)
+                if not accepted(index, 1, timeout):
+                    return False
+        except socket.timeout:
+            self.stale += owed - received
+            raise
+        return True
+
     def set_external_axis(self, axis_unscaled=[-550, 0, 0, 0, 0, 0]):
         if len(axis_unscaled) != 6:
             return False
-        msg = "34 "
-        for axis in axis_unscaled:
-            msg += format(axis, "+08.2f") + " "
-        msg += "#"
-        return self.send(msg)
+        msg = "34 " + format_joints(axis_unscaled)
+        return self.send_setting("external_axis", msg)
 
     def move_circular(self, pose_onarc, pose_end):
         """
@@ -283,7 +420,7 @@ class Robot:
         msg_1 = "36 " + self.format_pose(pose_end)
 
         data = self.send(msg_0).split()
-        if data[1] != "1":
+        if data[1] != b"1":
             log.warn("move_circular incorrect response, bailing!")
             return False
         return self.send(msg_1)
@@ -298,21 +435,155 @@ class Robot:
         return
         # return self.send(msg)
 
-    def send(self, message, wait_for_response=True):
+    def send_setting(self, key, message):
+        """
+        Sends message, which sets the controller setting key, unless the
+        setting was last set with the same message. Then the round trip is
+        skipped and the reply from back then is returned.
+        """
+        sent = self.state.get(key)
+        if sent is not None and sent[0] == message:
+            self.saved_round_trips += 1
+            return sent[1]
+        # Until the reply arrives, the setting on the controller is unknown
+        self.state.pop(key, None)
+        reply = self.send(message)
+        # A rejected message leaves the setting as unknown as before
+        if reply_ok(message, reply):
+            self.state[key] = (message, reply)
+        return reply
+
+    def reply_timeout(self, message):
+        """
+        Seconds to wait for the reply to message, None to wait as long as
+        it takes: motion_timeout for moves, timeout for everything else
+        """
+        if message[:2] in MOTION_CODES:
+            return self.motion_timeout
+        return self.timeout
+
+    def send(self, message, wait_for_response=True, timeout=None):
         """
         Send a formatted message to the robot socket.
         if wait_for_response, we wait for the response and return it
-        """
-        caller = inspect.stack()[1][3]
-        log.debug("%-14s sending: %s", caller, message)
-        self.sock.sendto(message.encode(), (self.ip, self.port_motion))
-        time.sleep(self.delay)
+        (without the reply terminator)
+
+        timeout: seconds to wait for the reply, defaults to reply_timeout
+        """
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            caller = sys._getframe(1).f_code.co_name
+            log.debug("%-14s sending: %s", caller, message)
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        payload = message.encode()
+        self.sock.settimeout(self.timeout)
+        self.sock.sendall(payload)
         if not wait_for_response:
             return
-        data = self.sock.recv(4096)
-        log.debug("%-14s recieved: %s", caller, data)
+        if timeout is None:
+            timeout = self.reply_timeout(message)
+        try:
+            data = self.recv_reply(timeout)
+        except socket.timeout:
+            self.stale += 1
+            if metrics is not None:
+                metrics.record_timeout(message[:2], len(payload))
+            raise
+        if metrics is not None:
+            metrics.record(
+                message[:2],
+                len(payload),
+                len(data) + len(REPLY_TERMINATOR),
+                time.perf_counter() - start,
+            )
+        if debug:
+            log.debug("%-14s recieved: %s", caller, data)
         return data
 
+    def send_pipelined(self, messages, window=64, timeout=None):
+        """
+        Pipelined mode: writes formatted messages back to back, keeping up to
+        'window' of them in flight, and returns their replies in the same
+        order as 'messages'. The timeout applies to each reply, and
+        defaults to reply_timeout of its message.
+
+        The robot still executes the messages one at a time, in order.
+        """
+        messages = list(messages)
+        log.debug("send_pipelined sending %i messages", len(messages))
+        metrics = self.metrics
+        # When each message was written, to time its reply
+        sent_at = []
+        replies = []
+
+        def write(batch):
+            self.sock.settimeout(self.timeout)
+            self.sock.sendall("".join(batch).encode())
+            sent_at.extend([time.perf_counter()] * len(batch))
+
+        def receive():
+            i = len(replies)
+            if timeout is None:
+                reply = self.recv_reply(self.reply_timeout(messages[i]))
+            else:
+                reply = self.recv_reply(timeout)
+            if metrics is not None:
+                metrics.record(
+                    messages[i][:2],
+                    len(messages[i]),
+                    len(reply) + len(REPLY_TERMINATOR),
+                    time.perf_counter() - sent_at[i],
+                )
+            replies.append(reply)
+
+        try:
+            write(messages[:window])
+            for message in messages[window:]:
+                receive()
+                write([message])
+            while len(replies) < len(messages):
+                receive()
+        except socket.timeout:
+            self.stale += len(sent_at) - len(replies)
+            if metrics is not None:
+                message = messages[len(replies)]
+                metrics.record_timeout(message[:2], len(message))
+            raise
+        return replies
+
+    def recv_reply(self, timeout=None):
+        """
+        Reads from the motion socket until one complete reply has arrived,
+        and returns it as soon as it has. Bytes received past the end of the
+        reply are kept for the next call, and replies owed to commands that
+        timed out earlier are dropped.
+
+        timeout: seconds to wait for the reply, None to wait indefinitely.
+        Raises socket.timeout if no complete reply arrives in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        remaining = None
+        while True:
+            end = self.recv_buffer.find(REPLY_TERMINATOR)
+            if end != -1:
+                data = bytes(self.recv_buffer[:end]).strip()
+                del self.recv_buffer[: end + len(REPLY_TERMINATOR)]
+                if not self.stale:
+                    return data
+                self.stale -= 1
+                continue
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("No reply from robot within %.3f s" % timeout)
+            self.sock.settimeout(remaining)
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("Robot closed the motion connection")
+            self.recv_buffer += chunk
+
     def format_pose(self, pose):
         pose = check_coordinates(pose)
         msg = ""
@@ -324,6 +595,8 @@ class Robot:
         return msg
 
     def close(self):
+        if self.telemetry is not None:
+            self.telemetry.stop()
         self.send("99 #", False)
         self.sock.shutdown(socket.SHUT_RDWR)
         self.sock.close()
@@ -336,6 +609,60 @@ class Robot:
         self.close()
 
 
+def reply_ok(message, reply):
+    """
+    True if reply acknowledges message: the robot echoes the instruction
+    code of the message, followed by 1 (SERVER_OK)
+    """
+    data = reply.split()
+    return (
+        len(data) >= 2
+        and data[0].isdigit()
+        and int(data[0]) == int(message.split()[0])
+        and data[1] == b"1"
+    )
+
+
+def format_joints(joints):
+    """
+    Encodes six already scaled joint (or external axis) values
+    """
+    msg = ""
+    for joint in joints:
+        msg += format(joint, "+08.2f") + " "
+    msg += "#"
+    return msg
+
+
+def format_speed(speed):
+    msg = format(speed[0], "+08.1f") + " "
+    msg += format(speed[1], "+08.2f") + " "
+    msg += format(speed[2], "+08.1f") + " "
+    msg += format(speed[3], "+08.2f") + " #"
+    return msg
+
+
+def format_zone(zone_key="z1", point_motion=False, manual_zone=[]):
+    """
+    Encodes a zone the way Robot.set_zone describes it,
+    returns None if zone_key is not in zone_dict
+    """
+    if point_motion:
+        zone = [0, 0, 0]
+    elif len(manual_zone) == 3:
+        zone = manual_zone
+    elif zone_key in zone_dict.keys():
+        zone = zone_dict[zone_key]
+    else:
+        return None
+
+    msg = str(int(point_motion)) + " "
+    msg += format(zone[0], "+08.4f") + " "
+    msg += format(zone[1], "+08.4f") + " "
+    msg += format(zone[2], "+08.4f") + " #"
+    return msg
+
+
 def check_coordinates(coordinates):
     if (
         (len(coordinates) == 2)
@@ -0,0 +1,316 @@
+"""
+abb_async.py: asyncio client for the same RAPID SERVER module as abb.Robot
+
+One event loop can drive many controllers concurrently. Every command is a
+coroutine, so per-call timeouts and cancellation come from asyncio itself:
+
+    async with await AsyncRobot.connect("192.168.125.1") as robot:
+        joints = await asyncio.wait_for(robot.get_joints(), 0.5)
+
+Messages are encoded exactly as abb.Robot encodes them.
+"""
+
+import asyncio
+import logging
+
+from abb import (
+    Robot,
+    REPLY_TERMINATOR,
+    format_joints,
+    format_speed,
+    format_zone,
+    reply_ok,
+)
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+
+class AsyncRobot:
+    # Pure encoding helpers, shared with the blocking client
+    set_units = Robot.set_units
+    format_pose = Robot.format_pose
+    get_tool = Robot.get_tool
+    reply_timeout = Robot.reply_timeout
+
+    def __init__(
+        self, ip="192.168.125.1", port_motion=5000, timeout=2.5, motion_timeout=None
+    ):
+        """
+        Use AsyncRobot.connect to get a connected and configured robot.
+
+        timeout: default seconds to wait for the reply to a command
+        motion_timeout: the same for moves, see abb.Robot
+        """
+        self.ip = ip
+        self.port_motion = port_motion
+        self.timeout = timeout
+        self.motion_timeout = motion_timeout
+        self.reader = None
+        self.writer = None
+        # Commands share one socket and the robot answers in order
+        self.lock = asyncio.Lock()
+        # Replies still owed to commands that were cancelled or timed out
+        self.stale = 0
+        # Last message the controller accepted for each setting, see
+        # restore_settings
+        self.settings = {}
+        self.set_units("millimeters", "degrees")
+
+    @classmethod
+    async def connect(
+        cls, ip="192.168.125.1", port_motion=5000, timeout=2.5, motion_timeout=None
+    ):
+        """
+        Connects to the robot motion server and sends the same default
+        setup as abb.Robot does.
+        """
+        robot = cls(ip, port_motion, timeout, motion_timeout)
+        await robot.connect_motion()
+        await robot.setup()
+        return robot
+
+    async def setup(self, tool=[[0, 0, 0], [1, 0, 0, 0]]):
+        await self.set_tool(tool)
+        await self.set_workobject()
+        await self.set_speed()
+        await self.set_zone()
+
+    async def restore_settings(self):
+        """
+        Sends the last tool, workobject, speed and zone the controller
+        accepted again, e.g. after a reconnect reset them to its defaults
+        """
+        for key, message in list(self.settings.items()):
+            await self.send_setting(key, message)
+
+    async def send_setting(self, key, message):
+        """
+        Sends message, which sets the controller setting key, and remembers
+        it if the controller accepted it
+        """
+        reply = await self.send(message)
+        if reply_ok(message, reply):
+            self.settings[key] = message
+        return reply
+
+    async def connect_motion(self):
+        remote = (self.ip, self.port_motion)
+        log.info("Attempting to connect to robot motion server at %s", str(remote))
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(*remote), self.timeout
+        )
+        self.stale = 0
+        log.info("Connected to robot motion server at %s", str(remote))
+
+    async def set_cartesian(self, pose):
+        """
+        Executes a move immediately from the current pose,
+        to 'pose', with units of millimeters.
+        """
+        msg = "01 " + self.format_pose(pose)
+        return await self.send(msg)
+
+    async def set_joints(self, joints):
+        """
+        Executes a move immediately, from current joint angles,
+        to 'joints', in degrees.
+        """
+        if len(joints) != 6:
+            return False
+        msg = "02 " + format_joints([joint * self.scale_angle for joint in joints])
+        return await self.send(msg)
+
+    async def get_cartesian(self):
+        """
+        Returns the current pose of the robot, in millimeters
+        """
+        msg = "03 #"
+        data = (await self.send(msg)).split()
+        r = [float(s) for s in data]
+        return [r[2:5], r[5:9]]
+
+    async def get_joints(self):
+        """
+        Returns the current angles of the robots joints, in degrees.
+        """
+        msg = "04 #"
+        data = (await self.send(msg)).split()
+        return [float(s) / self.scale_angle for s in data[2:8]]
+
+    async def set_tool(self, tool=[[0, 0, 0], [1, 0, 0, 0]]):
+        msg = "06 " + self.format_pose(tool)
+        await self.send_setting("tool", msg)
+        self.tool = tool
+
+    async def set_workobject(self, work_obj=[[0, 0, 0], [1, 0, 0, 0]]):
+        msg = "07 " + self.format_pose(work_obj)
+        await self.send_setting("workobject", msg)
+
+    async def set_speed(self, speed=[100, 50, 50, 50]):
+        """
+        speed: [robot TCP linear speed (mm/s), TCP orientation speed (deg/s),
+                external axis linear, external axis orientation]
+        """
+        if len(speed) != 4:
+            return False
+        msg = "08 " + format_speed(speed)
+        await self.send_setting("speed", msg)
+
+    async def set_zone(self, zone_key="z1", point_motion=False, manual_zone=[]):
+        """
+        See abb.Robot.set_zone
+        """
+        zone = format_zone(zone_key, point_motion, manual_zone)
+        if zone is None:
+            return False
+        msg = "09 " + zone
+        await self.send_setting("zone", msg)
+
+    async def buffer_add(self, pose):
+        """
+        Appends single pose to the remote buffer
+        """
+        msg = "30 " + self.format_pose(pose)
+        await self.send(msg)
+
+    async def buffer_set(self, pose_list):
+        """
+        Replaces the remote buffer with every pose in pose_list,
+        in pipelined mode. See abb.Robot.buffer_set
+        """
+        messages = ["31 #"]
+        messages += ["30 " + self.format_pose(pose) for pose in pose_list]
+        messages.append("32 #")
+        replies = await self.send_pipelined(messages)
+
+        failed = False
+        for message, reply in zip(messages, replies):
+            if not reply_ok(message, reply):
+                failed = True
+                log.warning(
+                    "buffer_set: %r rejected by robot, reply: %s", message, reply
+                )
+        if not failed and int(float(replies[-1].split()[2])) == len(pose_list):
+            log.debug("Successfully added %i poses to remote buffer", len(pose_list))
+            return True
+        else:
+            log.warning("Failed to add poses to remote buffer!")
+            await self.clear_buffer()
+            return False
+
+    async def clear_buffer(self):
+        msg = "31 #"
+        data = await self.send(msg)
+        buffer_len = await self.buffer_len()
+        if buffer_len != 0:
+            log.warning("clear_buffer failed! buffer_len: %i", buffer_len)
+            raise NameError("clear_buffer failed!")
+        return data
+
+    async def buffer_len(self):
+        """
+        Returns the length (number of poses stored) of the remote buffer
+        """
+        msg = "32 #"
+        data = (await self.send(msg)).split()
+        return int(float(data[2]))
+
+    async def buffer_execute(self):
+        """
+        Immediately execute linear moves to every pose in the remote buffer.
+        """
+        msg = "33 #"
+        return await self.send(msg)
+
+    async def move_circular(self, pose_onarc, pose_end):
+        """
+        Executes a movement in a circular path from current position,
+        through pose_onarc, to pose_end
+        """
+        msg_0 = "35 " + self.format_pose(pose_onarc)
+        msg_1 = "36 " + self.format_pose(pose_end)
+
+        data = (await self.send(msg_0)).split()
+        if data[1] != b"1":
+            log.warning("move_circular incorrect response, bailing!")
+            return False
+        return await self.send(msg_1)
+
+    async def send(self, message, wait_for_response=True, timeout=None):
+        """
+        Send a formatted message to the robot and, if wait_for_response,
+        return its reply (without the reply terminator).
+
+        Safe to cancel: a reply that arrives after its command was
+        cancelled or timed out is discarded before the next one is read.
+        timeout: seconds to wait for the reply, defaults to reply_timeout
+        """
+        if timeout is None:
+            timeout = self.reply_timeout(message)
+        async with self.lock:
+            log.debug("sending: %s", message)
+            self.writer.write(message.encode())
+            if not wait_for_response:
+                await self.writer.drain()
+                return
+            try:
+                await self.writer.drain()
+                data = await asyncio.wait_for(self.recv_reply(), timeout)
+            except BaseException:
+                self.stale += 1
+                raise
+            log.debug("recieved: %s", data)
+            return data
+
+    async def send_pipelined(self, messages, window=64, timeout=None):
+        """
+        Writes formatted messages back to back, keeping up to 'window' of
+        them in flight, and returns their replies in order.
+        The timeout applies to each reply, and defaults to reply_timeout
+        of its message.
+        """
+        messages = list(messages)
+        replies = []
+
+        async def receive():
+            message = messages[len(replies)]
+            wait = self.reply_timeout(message) if timeout is None else timeout
+            replies.append(await asyncio.wait_for(self.recv_reply(), wait))
+
+        async with self.lock:
+            self.writer.write("".join(messages[:window]).encode())
+            sent = min(window, len(messages))
+            try:
+                for message in messages[window:]:
+                    await self.writer.drain()
+                    await receive()
+                    self.writer.write(message.encode())
+                    sent += 1
+                await self.writer.drain()
+                while len(replies) < len(messages):
+                    await receive()
+            except BaseException:
+                self.stale += sent - len(replies)
+                raise
+        return replies
+
+    async def recv_reply(self):
+        # Drop replies owed to cancelled commands, then read ours
+        while self.stale:
+            await self.reader.readuntil(REPLY_TERMINATOR)
+            self.stale -= 1
+        data = await self.reader.readuntil(REPLY_TERMINATOR)
+        return data[: -len(REPLY_TERMINATOR)].strip()
+
+    async def close(self):
+        await self.send("99 #", False)
+        self.writer.close()
+        await self.writer.wait_closed()
+        log.info("Disconnected from ABB robot.")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
@@ -0,0 +1,195 @@
+"""
+fleet.py: keeps warm connections to many robot controllers and fans
+commands out to all of them concurrently, on one asyncio event loop.
+
+    async def main():
+        fleet = RobotFleet({"cell_1": "192.168.125.1", "cell_2": ("10.0.0.2", 5000)})
+        await fleet.connect()
+        joints = await fleet.gather("get_joints")     # {"cell_1": [...], ...}
+        await fleet.broadcast("set_speed", [200, 50, 50, 50])
+        await fleet.close()
+
+    asyncio.run(main())
+
+A call takes about one round trip however many robots are in the fleet.
+"""
+
+import asyncio
+import logging
+
+from abb import MOTION_CODES
+from abb_async import AsyncRobot
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Commands that must not be sent twice: if the connection drops while one of
+# them is in flight we reconnect, but leave retrying to the caller. The same
+# goes for raw messages ("send") with one of the MOTION_CODES, whose reply
+# may have been lost after the robot moved.
+NOT_RETRIED = {"buffer_add", "buffer_execute", "move_circular", "close"}
+
+
+def retried(method, args):
+    if method in NOT_RETRIED:
+        return False
+    if method == "send":
+        return bool(args) and str(args[0])[:2] not in MOTION_CODES
+    return True
+
+
+class RobotFleet:
+    def __init__(self, addresses, port_motion=5000, timeout=2.5, motion_timeout=None):
+        """
+        addresses: {name: ip} or {name: (ip, port_motion)}
+        timeout: default seconds to wait for a single reply
+        motion_timeout: the same for moves, see abb.Robot
+        """
+        self.timeout = timeout
+        self.motion_timeout = motion_timeout
+        self.addresses = {}
+        for name, address in addresses.items():
+            if isinstance(address, str):
+                address = (address, port_motion)
+            self.addresses[name] = tuple(address)
+        self.robots = {}
+        self.reconnects = {name: 0 for name in self.addresses}
+        # Held while a robot is reconnected and the dropped call retried, so
+        # concurrent calls (and keepalive) do not reconnect it twice
+        self.locks = {name: asyncio.Lock() for name in self.addresses}
+
+    async def connect(self, return_exceptions=False):
+        """
+        Connects to and sets up every robot in parallel.
+        With return_exceptions, robots that fail to connect are left out of
+        the fleet and their errors are returned as {name: exception}.
+        """
+        names = list(self.addresses)
+        results = await asyncio.gather(
+            *(
+                AsyncRobot.connect(
+                    *self.addresses[name], self.timeout, self.motion_timeout
+                )
+                for name in names
+            ),
+            return_exceptions=return_exceptions,
+        )
+        errors = {}
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                log.warning("Could not connect to robot %s: %s", name, result)
+                errors[name] = result
+            else:
+                self.robots[name] = result
+        return errors
+
+    async def reconnect(self, name):
+        """
+        Replaces the connection to robot 'name' and restores the tool,
+        workobject, speed and zone last set on it.
+        """
+        async with self.locks[name]:
+            await self.replace_connection(name)
+
+    async def replace_connection(self, name):
+        """
+        reconnect, for callers that hold self.locks[name]
+        """
+        robot = self.robots[name]
+        log.info("Reconnecting to robot %s at %s", name, self.addresses[name])
+        if robot.writer is not None:
+            robot.writer.close()
+        await robot.connect_motion()
+        await robot.restore_settings()
+        self.reconnects[name] += 1
+
+    async def call(self, name, method, *args, timeout=None, **kwargs):
+        """
+        Calls AsyncRobot.<method>(*args, **kwargs) on robot 'name'.
+        If its connection has dropped, it is re-established and the call is
+        retried once, except for the commands in NOT_RETRIED and raw moves.
+
+        timeout: seconds the whole call may take. By default only each reply
+                 is timed, by the robot's timeout or motion_timeout.
+        """
+        robot = self.robots[name]
+        connection = self.reconnects[name]
+        try:
+            return await asyncio.wait_for(
+                getattr(robot, method)(*args, **kwargs), timeout
+            )
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            log.warning("Robot %s dropped during %s: %s", name, method, e)
+            async with self.locks[name]:
+                # Unless a concurrent call has reconnected since this one
+                # started, its connection is the one that dropped
+                if self.reconnects[name] == connection:
+                    await self.replace_connection(name)
+                if not retried(method, args):
+                    raise
+                return await asyncio.wait_for(
+                    getattr(robot, method)(*args, **kwargs), timeout
+                )
+
+    async def gather(self, method, *args, names=None, timeout=None, **kwargs):
+        """
+        Calls the same method with the same arguments on every robot (or on
+        'names') concurrently and returns {name: result}. A robot that fails
+        has its exception as its result instead of failing the whole call.
+        """
+        names = list(self.robots) if names is None else list(names)
+        results = await asyncio.gather(
+            *(self.call(name, method, *args, timeout=timeout, **kwargs) for name in names),
+            return_exceptions=True,
+        )
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                log.warning("%s failed on robot %s: %r", method, name, result)
+        return dict(zip(names, results))
+
+    async def broadcast(self, method, *args, names=None, timeout=None, **kwargs):
+        """
+        Like gather, but raises the first error once every robot is done
+        """
+        results = await self.gather(
+            method, *args, names=names, timeout=timeout, **kwargs
+        )
+        for result in results.values():
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    async def call_each(self, method, arguments, timeout=None):
+        """
+        Calls method on several robots concurrently with different arguments.
+        arguments: {name: [args]}, e.g. a set of target joints per robot
+        """
+        names = list(arguments)
+        results = await asyncio.gather(
+            *(self.call(name, method, *arguments[name], timeout=timeout) for name in names),
+            return_exceptions=True,
+        )
+        return dict(zip(names, results))
+
+    async def keepalive(self, interval=5.0):
+        """
+        Pings every robot each 'interval' seconds so dropped connections are
+        re-established before the next real command needs them.
+        Run it as a task: asyncio.create_task(fleet.keepalive())
+        """
+        while True:
+            await self.gather("send", "00 #")
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        await asyncio.gather(
+            *(robot.close() for robot in self.robots.values()), return_exceptions=True
+        )
+        self.robots = {}
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
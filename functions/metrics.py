@@ -0,0 +1,123 @@
+"""
+metrics.py: per-opcode counters and latency histograms for abb.Robot
+
+    metrics = RobotMetrics()
+    robot = Robot(ip, metrics=metrics)
+    ...
+    print(json.dumps(metrics.snapshot(), indent=2))
+
+Anything with the same record/record_timeout methods can be passed to
+Robot instead, e.g. an adapter that forwards to a monitoring system.
+"""
+
+from bisect import bisect_left
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket
+# counts everything slower than LATENCY_BUCKETS[-1]
+LATENCY_BUCKETS = [
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+]
+
+
+class OpcodeMetrics:
+    def __init__(self):
+        self.count = 0
+        self.timeouts = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile latency,
+        None if it is in the overflow bucket or nothing was recorded
+        """
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.histogram):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return None
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "timeouts": self.timeouts,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "latency_sum_s": self.latency_sum,
+            "latency_max_s": self.latency_max,
+            "latency_p50_s": self.quantile(0.5),
+            "latency_p99_s": self.quantile(0.99),
+            "histogram": list(self.histogram),
+        }
+
+
+class RobotMetrics:
+    def __init__(self):
+        self.opcodes = {}
+
+    def get(self, opcode):
+        metrics = self.opcodes.get(opcode)
+        if metrics is None:
+            metrics = self.opcodes[opcode] = OpcodeMetrics()
+        return metrics
+
+    def record(self, opcode, bytes_sent, bytes_received, latency):
+        """
+        One command with instruction code 'opcode' was answered after
+        'latency' seconds
+        """
+        metrics = self.get(opcode)
+        metrics.count += 1
+        metrics.bytes_sent += bytes_sent
+        metrics.bytes_received += bytes_received
+        metrics.latency_sum += latency
+        if latency > metrics.latency_max:
+            metrics.latency_max = latency
+        metrics.histogram[bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def record_timeout(self, opcode, bytes_sent):
+        metrics = self.get(opcode)
+        metrics.timeouts += 1
+        metrics.bytes_sent += bytes_sent
+
+    def snapshot(self):
+        """
+        Plain dict of everything recorded so far, ready for json.dumps.
+        histogram[i] counts latencies up to latency_buckets_s[i], the
+        last entry counts the slower ones.
+        """
+        opcodes = {
+            opcode: metrics.snapshot() for opcode, metrics in sorted(self.opcodes.items())
+        }
+        totals = {
+            field: sum(metrics[field] for metrics in opcodes.values())
+            for field in ("count", "timeouts", "bytes_sent", "bytes_received")
+        }
+        return {
+            "latency_buckets_s": list(LATENCY_BUCKETS),
+            "totals": totals,
+            "opcodes": opcodes,
+        }
+
+    def reset(self):
+        self.opcodes = {}
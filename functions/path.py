@@ -0,0 +1,184 @@
+"""
+path.py: simplifies dense paths (e.g. CAM exports) before they are uploaded
+with Robot.buffer_set
+
+    poses, zones, report = simplify_path(cam_poses, tolerance=0.5)
+    report["zones"]  # e.g. {"fine": 2, "z0": 1, "z1": 15}
+    robot.buffer_set(poses, zones=zones)
+    robot.buffer_execute()
+
+Points are removed Ramer-Douglas-Peucker style: a point stays only if the
+path through the remaining points would pass further than half of tolerance
+(mm) or angle_tolerance (degrees) from it. Every kept point then gets the
+largest zone from abb.zone_dict whose corner cut stays within the other
+half, so the robot blends through it instead of stopping. The cut is small
+where the path turns little, so zones are usually much larger than the
+tolerance (see select_zones). The two deviations add up, so the executed
+path stays within the whole tolerance.
+"""
+
+import logging
+
+import numpy as np
+
+from abb import zone_dict
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Zone of a point the robot has to reach exactly, e.g. the end of the path
+FINE = "fine"
+
+
+def as_pose_array(poses):
+    """
+    Returns poses ([[XYZ], [Quats]] or [XYZ + Quats] each) as an (N, 7) array
+    """
+    if isinstance(poses, np.ndarray):
+        array = poses.astype(np.float64).reshape(-1, 7)
+    else:
+        rows = [
+            list(pose[0]) + list(pose[1]) if len(pose) == 2 else list(pose)
+            for pose in poses
+        ]
+        array = np.asarray(rows, dtype=np.float64).reshape(-1, 7)
+    # q and -q are the same orientation, keep neighbours in one hemisphere
+    # so interpolating between them takes the short way
+    dot = np.einsum("ij,ij->i", array[1:, 3:], array[:-1, 3:])
+    flip = np.cumprod(np.where(dot < 0, -1.0, 1.0))
+    array[1:, 3:] *= flip[:, None]
+    return array
+
+
+def deviation(poses, start, end):
+    """
+    Distance (mm) and angle (degrees) from every pose strictly between start
+    and end to the straight, linearly interpolated move from start to end
+    """
+    inner = poses[start + 1 : end]
+    a, b = poses[start], poses[end]
+    direction = b[:3] - a[:3]
+    length = direction @ direction
+    if length > 0:
+        t = np.clip((inner[:, :3] - a[:3]) @ direction / length, 0.0, 1.0)
+    else:
+        t = np.linspace(0.0, 1.0, len(inner) + 2)[1:-1]
+    closest = a[:3] + t[:, None] * direction
+    distance = np.linalg.norm(inner[:, :3] - closest, axis=1)
+
+    # Normalized linear interpolation is close enough to slerp for the
+    # short arcs between neighbouring points
+    orientation = a[3:] + t[:, None] * (b[3:] - a[3:])
+    orientation /= np.linalg.norm(orientation, axis=1)[:, None]
+    quats = inner[:, 3:] / np.linalg.norm(inner[:, 3:], axis=1)[:, None]
+    dot = np.abs(np.einsum("ij,ij->i", quats, orientation))
+    angle = np.degrees(2 * np.arccos(np.clip(dot, 0.0, 1.0)))
+    return distance, angle
+
+
+def decimate(poses, tolerance=0.5, angle_tolerance=0.5):
+    """
+    Returns the indices of the poses to keep, always including the first and
+    the last one
+    """
+    if len(poses) < 3:
+        return np.arange(len(poses))
+    keep = np.zeros(len(poses), dtype=bool)
+    keep[[0, -1]] = True
+    # Iterative, deep paths would overflow the recursion limit
+    stack = [(0, len(poses) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        distance, angle = deviation(poses, start, end)
+        # Worst offender relative to its own tolerance
+        excess = np.maximum(distance / tolerance, angle / angle_tolerance)
+        worst = int(np.argmax(excess))
+        if excess[worst] > 1.0:
+            split = start + 1 + worst
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def select_zones(poses, tolerance=0.5, angle_tolerance=0.5):
+    """
+    Returns a zone_dict key for every pose: the largest zone that fits in
+    half of the shorter move next to the pose, and whose deviation from the
+    corner stays within tolerance and angle_tolerance. The last pose, and
+    poses no zone fits, get FINE.
+
+    Blending cuts the corner inside the zone, so the path passes at most
+    radius * sin(turn / 2) from a pose where it turns by turn, and the tool
+    turns away from the programmed orientation by no more than zone_ori, nor
+    than the orientation changes over the neighbouring moves. Poses on
+    gentle curves, or where the tool keeps its orientation, get zones much
+    larger than the tolerances. The move into the first pose is unknown,
+    it gets zones no larger than the tolerances.
+    """
+    # Candidates from the smallest to the largest zone
+    candidates = sorted(zone_dict.items(), key=lambda item: item[1][0])
+    moves = np.diff(poses[:, :3], axis=0)
+    lengths = np.linalg.norm(moves, axis=1)
+    # Shorter of the moves into and out of every pose, none out of the last
+    shorter = np.minimum(np.insert(lengths, 0, np.inf), np.append(lengths, 0.0))
+    room = shorter / 2
+
+    # sin of half the change of direction at every inner pose, 1 (a full
+    # turn back) where it is unknown
+    corner = np.ones(len(poses))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos_turn = np.einsum("ij,ij->i", moves[:-1], moves[1:])
+        cos_turn /= lengths[:-1] * lengths[1:]
+    cos_turn = np.where(np.isfinite(cos_turn), np.clip(cos_turn, -1.0, 1.0), -1.0)
+    corner[1:-1] = np.sqrt((1 - cos_turn) / 2)
+
+    # Largest orientation change (degrees) over the moves next to every pose
+    quats = poses[:, 3:] / np.linalg.norm(poses[:, 3:], axis=1)[:, None]
+    dot = np.abs(np.einsum("ij,ij->i", quats[1:], quats[:-1]))
+    changes = np.degrees(2 * np.arccos(np.clip(dot, 0.0, 1.0)))
+    turn = np.maximum(np.insert(changes, 0, np.inf), np.append(changes, 0.0))
+
+    zones = []
+    for space, sin_half, ori_turn in zip(room, corner, turn):
+        zone = FINE
+        for key, (pzone_tcp, _, zone_ori) in candidates:
+            if (
+                pzone_tcp > space
+                or pzone_tcp * sin_half > tolerance
+                or min(zone_ori, ori_turn) > angle_tolerance
+            ):
+                break
+            zone = key
+        zones.append(zone)
+    return zones
+
+
+def simplify_path(poses, tolerance=0.5, angle_tolerance=0.5):
+    """
+    poses: [[XYZ], [Quats]] or [XYZ + Quats] per pose, or an (N, 7) array
+    tolerance: mm the executed path may deviate from poses
+    angle_tolerance: degrees the tool orientation may deviate
+
+    Returns (kept poses as [[XYZ], [Quats]], a zone_dict key or FINE for each
+    kept pose, report), where report is a dict with the number of points in,
+    kept and removed.
+    """
+    array = as_pose_array(poses)
+    # Half of each budget for removing points, half for the corner cuts of
+    # the zones of the points that are left
+    kept = decimate(array, tolerance / 2, angle_tolerance / 2)
+    simplified = array[kept]
+    zones = select_zones(simplified, tolerance / 2, angle_tolerance / 2)
+
+    report = {
+        "points_in": len(array),
+        "points_out": len(kept),
+        "removed": len(array) - len(kept),
+        "zones": {zone: zones.count(zone) for zone in sorted(set(zones))},
+    }
+    log.debug("simplify_path: %s", report)
+    poses = [[row[:3], row[3:]] for row in simplified.tolist()]
+    return poses, zones, report
@@ -0,0 +1,169 @@
+"""
+telemetry.py: background reader for the RAPID LOGGER module (port 5001)
+
+LOGGER streams alternating pose and joint frames, each ending with "#":
+    0 <date> <time> <clock> x y z q1 q2 q3 q4 #
+    1 <date> <time> <clock> j1 j2 j3 j4 j5 j6 #
+
+Frames are parsed into preallocated, fixed-size NumPy ring buffers, so the
+latest samples can be read without a round trip on the motion socket.
+"""
+
+import time
+import socket
+import logging
+from threading import Thread, Event
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+FRAME_TERMINATOR = b"#"
+FRAME_POSE = b"0"
+FRAME_JOINTS = b"1"
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer of float64 rows that always returns the latest k rows
+    as one contiguous, read-only view (no copy).
+
+    Every row is stored twice, at i and i + capacity, so the latest k rows
+    never wrap around the end of the array.
+    """
+
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, width))
+        self.count = 0
+
+    def append(self, row):
+        index = self.count % self.capacity
+        self.data[index] = row
+        self.data[index + self.capacity] = row
+        # Only publish the row once it is fully written
+        self.count += 1
+
+    def latest(self, k=1):
+        """
+        View of the latest k rows, oldest first. Fewer rows are returned if
+        fewer have been appended. The rows are overwritten once 'capacity'
+        newer ones arrive, copy the view to keep it longer.
+        """
+        count = self.count
+        k = min(k, count, self.capacity)
+        end = (count - 1) % self.capacity + self.capacity + 1
+        view = self.data[end - k : end]
+        view.flags.writeable = False
+        return view
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+
+class Telemetry:
+    """
+    Columns of both buffers: [received, clock, values...], where received is
+    the host time.monotonic() at which the frame arrived, clock is the
+    controller's clock in seconds and values are x y z q1 q2 q3 q4 (mm) for
+    poses and six joint angles (degrees) for joints.
+    """
+
+    def __init__(self, remote, capacity=4096, max_age=0.25):
+        """
+        remote: (ip, port_logger)
+        capacity: samples kept per buffer
+        max_age: seconds after which latest_pose/latest_joints report a
+                 sample as stale and return None
+        """
+        self.remote = remote
+        self.max_age = max_age
+        self.poses = RingBuffer(capacity, 9)
+        self.joints = RingBuffer(capacity, 8)
+        self.frames = 0
+        self.bad_frames = 0
+        self.stopped = Event()
+        self.sock = None
+        self.thread = None
+
+    def start(self):
+        log.info("Attempting to connect to robot logger at %s", str(self.remote))
+        self.sock = socket.create_connection(self.remote, timeout=2.5)
+        self.sock.settimeout(0.5)
+        log.info("Connected to robot logger at %s", str(self.remote))
+        self.stopped.clear()
+        self.thread = Thread(target=self.run, name="abb-telemetry", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        pending = b""
+        try:
+            while not self.stopped.is_set():
+                try:
+                    data = self.sock.recv(4096)
+                except socket.timeout:
+                    continue
+                if not data:
+                    log.warning("Robot logger closed the connection")
+                    break
+                *frames, pending = (pending + data).split(FRAME_TERMINATOR)
+                received = time.monotonic()
+                for frame in frames:
+                    self.parse(frame, received)
+        except OSError as e:
+            if not self.stopped.is_set():
+                log.warning("Robot logger connection lost: %s", e)
+        finally:
+            self.sock.close()
+
+    def parse(self, frame, received):
+        data = frame.split()
+        if not data:
+            return
+        try:
+            # data[1:3] is the date and time the LOGGER module was started
+            values = [received] + [float(s) for s in data[3:]]
+        except ValueError:
+            values = []
+        if data[0] == FRAME_POSE and len(values) == 9:
+            self.poses.append(values)
+        elif data[0] == FRAME_JOINTS and len(values) == 8:
+            self.joints.append(values)
+        else:
+            self.bad_frames += 1
+            log.debug("Dropping malformed telemetry frame: %s", frame)
+            return
+        self.frames += 1
+
+    def fresh(self, buffer):
+        if not len(buffer):
+            return None
+        row = buffer.latest(1)[0]
+        if time.monotonic() - row[0] > self.max_age:
+            return None
+        return row
+
+    def latest_pose(self):
+        """
+        Latest pose as [[x, y, z], [q1, q2, q3, q4]] or None if stale
+        """
+        row = self.fresh(self.poses)
+        if row is None:
+            return None
+        return [row[2:5].tolist(), row[5:9].tolist()]
+
+    def latest_joints(self):
+        """
+        Latest joint angles in degrees or None if stale
+        """
+        row = self.fresh(self.joints)
+        if row is None:
+            return None
+        return row[2:8].tolist()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
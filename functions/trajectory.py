@@ -0,0 +1,69 @@
+"""
+trajectory.py: encodes whole trajectories for the remote buffer of SERVER
+
+A trajectory is an (N, 7) array of poses, one [x, y, z, q1, q2, q3, q4] row
+per pose. It is checked and scaled as one array, and every "30" (buffer
+add) message of a chunk is formatted with a single string operation, so no
+per-pose Python lists are built.
+
+Robot.execute_trajectory streams the chunks to the robot.
+"""
+
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# Same limit as MAX_BUFFER in SERVER.mod, poses added past it are dropped
+MAX_BUFFER = 512
+
+# Same formats as Robot.format_pose
+POSE_FORMAT = "30 " + "%+08.1f " * 3 + "%+08.5f " * 4 + "#"
+
+
+def check_trajectory(poses):
+    """
+    Returns poses as a float64 (N, 7) array, raises NameError (like
+    check_coordinates) if it has another shape or non finite values
+    """
+    poses = np.asarray(poses, dtype=np.float64)
+    if poses.ndim != 2 or poses.shape[1] != 7:
+        log.warning("Recieved malformed trajectory of shape %s", str(poses.shape))
+        raise NameError("Malformed trajectory!")
+    if not np.isfinite(poses).all():
+        log.warning("Recieved trajectory with non finite values")
+        raise NameError("Malformed trajectory!")
+    return poses
+
+
+def encode_chunk(poses):
+    """
+    Encodes already scaled poses as one run of buffer add messages
+    """
+    return (POSE_FORMAT * len(poses)) % tuple(poses.ravel().tolist())
+
+
+def encode_trajectory(poses, scale_linear=1.0, chunk_size=MAX_BUFFER):
+    """
+    Splits poses into chunks of at most chunk_size poses, and encodes each
+    as the messages that load and run it: clear the buffer and add every
+    pose, then execute if the buffer holds exactly that many poses.
+
+    Returns a list of (load payload bytes, execute message bytes, number of
+    messages in the load payload).
+    """
+    if not 0 < chunk_size <= MAX_BUFFER:
+        raise ValueError(f"chunk_size must be between 1 and {MAX_BUFFER}")
+    poses = check_trajectory(poses)
+    scaled = poses.copy()
+    scaled[:, :3] *= scale_linear
+
+    chunks = []
+    for start in range(0, len(scaled), chunk_size):
+        chunk = scaled[start : start + chunk_size]
+        load = "31 #" + encode_chunk(chunk)
+        execute = "33 %i #" % len(chunk)
+        chunks.append((load.encode(), execute.encode(), len(chunk) + 1))
+    return chunks
@@ -0,0 +1,36 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+# The modules import their siblings by bare name, as when run as scripts
+for directory in ("functions", "LLM", "DATA", "controllers"):
+    sys.path.insert(0, str(ROOT / directory))
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """
+    Starts MockServer in a thread, on a free port: mock_server(**kwargs)
+    returns the server, kwargs go to MockServer (e.g. simulator=...)
+    """
+    from mock.server import MockServer
+
+    monkeypatch.delenv("PORT", raising=False)
+    started = []
+
+    def start(**kwargs):
+        server = MockServer(0, log_level="WARNING", **kwargs)
+        # Accept connections before run() gets going (it listens again)
+        server.connection.listen(128)
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        started.append((server, thread))
+        return server
+
+    yield start
+    for server, thread in started:
+        server.stop()
+        thread.join()
@@ -0,0 +1,68 @@
+import socket
+
+import numpy as np
+import pytest
+
+from abb import Robot
+from mock.simulator import RobotSimulator
+
+
+def test_moves_wait_for_their_reply(mock_server):
+    # 500 mm at 100 mm/s: 0.5 s of real time, past the 0.2 s reply timeout
+    server = mock_server(simulator=RobotSimulator(time_scale=10))
+    robot = Robot("127.0.0.1", port_motion=server.port, timeout=0.2)
+    assert robot.set_cartesian([[500, 0, 0], [1, 0, 0, 0]]).split()[:2] == [b"1", b"1"]
+    assert robot.get_cartesian()[0] == [500, 0, 0]
+    robot.close()
+
+
+def test_motion_timeout(mock_server):
+    server = mock_server(simulator=RobotSimulator(time_scale=10))
+    robot = Robot("127.0.0.1", port_motion=server.port, motion_timeout=0.2)
+    with pytest.raises(socket.timeout):
+        robot.set_cartesian([[500, 0, 0], [1, 0, 0, 0]])
+    # The late reply to the move is dropped, not taken for the next one
+    assert robot.get_cartesian()[0] == [500, 0, 0]
+    robot.close()
+
+
+def line(count):
+    poses = np.zeros((count, 7))
+    poses[:, 0] = np.arange(1, count + 1)
+    poses[:, 3] = 1
+    return poses
+
+
+def test_execute_trajectory(mock_server):
+    simulator = RobotSimulator(time_scale=float("inf"), max_buffer=100)
+    server = mock_server(simulator=simulator)
+    robot = Robot("127.0.0.1", port_motion=server.port)
+    assert robot.execute_trajectory(line(250), chunk_size=100)
+    assert simulator.pose[0] == [250, 0, 0]
+    robot.close()
+
+
+def test_execute_trajectory_stops_at_rejected_chunk(mock_server):
+    # The buffer only takes 100 of the first 200 poses, so "33 200" fails
+    simulator = RobotSimulator(time_scale=float("inf"), max_buffer=100)
+    server = mock_server(simulator=simulator)
+    robot = Robot("127.0.0.1", port_motion=server.port)
+    assert not robot.execute_trajectory(line(300), chunk_size=200)
+    # The next chunk, which would fit, must not have executed either
+    assert robot.get_cartesian()[0] == [0, 0, 0]
+    assert simulator.pose[0] == [0, 0, 0]
+    robot.close()
+
+
+def test_send_setting_skips_repeats_only_if_accepted(mock_server):
+    server = mock_server(simulator=RobotSimulator(time_scale=float("inf")))
+    robot = Robot("127.0.0.1", port_motion=server.port)
+    robot.set_speed([200, 50, 50, 50])
+    robot.set_speed([200, 50, 50, 50])
+    assert robot.saved_round_trips == 1
+    # Set speed needs 2 or 4 parameters, the robot rejects it
+    assert robot.send_setting("speed", "08 #").split()[:2] == [b"8", b"0"]
+    assert "speed" not in robot.state
+    robot.send_setting("speed", "08 #")
+    assert robot.saved_round_trips == 1
+    robot.close()
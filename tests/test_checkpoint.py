@@ -0,0 +1,90 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from checkpoint import CheckpointLog, read_log, repair
+from stub_openai import StubServer
+from synthetic_data import Generator
+
+
+def write(path, text):
+    path.write_bytes(text.encode())
+
+
+@pytest.mark.parametrize(
+    "tail", ['{"query": "c", "res', '{"query": "c"}}\n', "\x00\x00\x00"]
+)
+def test_read_log_drops_a_broken_last_line(tmp_path, tail):
+    path = tmp_path / "log.jsonl"
+    write(path, '{"query": "a"}\n{"query": "b"}\n' + tail)
+    assert read_log(path) == [{"query": "a"}, {"query": "b"}]
+    assert read_log(tmp_path / "missing.jsonl") == []
+
+
+@pytest.mark.parametrize(
+    "tail", ['{"query": "c", "res', '{"query": "c"}}\n', '{"query": "c"}}\n{"qu']
+)
+def test_repair_cuts_after_the_last_record(tmp_path, tail):
+    path = tmp_path / "log.jsonl"
+    records = '{"query": "a"}\n{"query": "b"}\n'
+    write(path, records + tail)
+    repair(path)
+    assert path.read_text() == records
+    # Nothing to cut
+    repair(path)
+    assert path.read_text() == records
+
+
+def test_appends_after_a_crash(tmp_path):
+    path = tmp_path / "logs" / "log.jsonl"
+    with CheckpointLog(path, sync_every=2) as log:
+        for query in "ab":
+            log.append({"query": query})
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"query": "c", "re')
+
+    with CheckpointLog(path) as log:
+        assert [record["query"] for record in log.records] == ["a", "b"]
+        log.append({"query": "c", "result": None})
+    assert read_log(path) == [
+        {"query": "a"},
+        {"query": "b"},
+        {"query": "c", "result": None},
+    ]
+
+
+def test_resumed_run_formats_only_the_rest(tmp_path):
+    server = StubServer(("127.0.0.1", 0), latency=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    queries = ["Give me joint values", "Rotate joint 2 by 45 degrees"]
+    queries += ["Move the TCP along the x-axis by 50 mm"]
+    path = tmp_path / "formatted.jsonl"
+    try:
+        # A run that got through the first query, and crashed writing the second
+        with CheckpointLog(path) as log:
+            log.append({"query": queries[0], "result": {"functions": []}})
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps({"query": queries[1]})[:-3])
+
+        generator = Generator("stub", base_url=base_url, concurrency=2)
+        with CheckpointLog(path) as log:
+            added = asyncio.run(generator.format_queries(queries, log, dedup=False))
+        assert added == 2
+        assert server.requests == 2
+        records = read_log(path)
+        # The record logged before the crash is kept as it was, the others
+        # are added in the order they finish
+        assert records[0] == {"query": queries[0], "result": {"functions": []}}
+        assert sorted(record["query"] for record in records[1:]) == sorted(queries[1:])
+
+        with CheckpointLog(path) as log:
+            added = asyncio.run(generator.format_queries(queries, log, dedup=False))
+        assert added == 0
+        assert server.requests == 2
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from action_models import choose_function, generic_function
+from constrained import CharAutomaton, TokenAutomaton
+from tiny_model import build_tokenizer
+
+CALLS = {
+    "functions": [
+        {
+            "function_name": "move_joint",
+            "inputs": [
+                {"input_name": "joint_2", "input_value": "45"},
+                {"input_name": "unit", "input_value": "deg\\"},
+            ],
+        },
+        {"function_name": "get_joint_values", "inputs": []},
+    ]
+}
+
+
+def run(automaton, text):
+    state = automaton.start
+    for c in text:
+        state = automaton.step(state, c)
+        if state is None:
+            return None
+    return state
+
+
+def compact(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return build_tokenizer()
+
+
+def test_char_automaton_accepts_schema_output():
+    automaton = CharAutomaton(generic_function)
+    assert run(automaton, compact(CALLS)) in automaton.accept
+    assert run(automaton, compact({"functions": []})) in automaton.accept
+    # Cut short
+    assert run(automaton, compact(CALLS)[:-1]) not in automaton.accept
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        compact({"functions": [{"function_name": "wave", "inputs": []}]}),
+        compact({"functions": [{"inputs": [], "function_name": "move_tcp"}]}),
+        '{"functions": []}',
+        '{"functions":[]},',
+        '{"functions":[{"function_name":"move_tcp","inputs":[{"input_name":"a\x01',
+    ],
+)
+def test_char_automaton_rejects(text):
+    assert run(CharAutomaton(generic_function), text) is None
+
+
+def test_char_automaton_limits_leading_whitespace():
+    automaton = CharAutomaton(choose_function)
+    output = compact({"function_name": ["move_tcp", "get_joint_values"]})
+    for whitespace in ["", " ", "\n", " \n"]:
+        assert run(automaton, whitespace + output) in automaton.accept
+    assert run(automaton, "   ") is None
+    assert run(automaton, "\n\n\n" + output) is None
+
+
+def test_token_automaton(tokenizer):
+    automaton = TokenAutomaton(generic_function, tokenizer)
+    state = automaton.start
+    for token in tokenizer(" " + compact(CALLS), add_special_tokens=False).input_ids:
+        assert not automaton.mask(state, len(tokenizer), "cpu")[token]
+        state = automaton.next_states[state][token]
+    # Only end of sequence is left
+    assert list(automaton.next_states[state]) == [tokenizer.eos_token_id]
+
+    space = tokenizer.convert_tokens_to_ids("Ġ")
+    state = automaton.next_states[automaton.start][space]
+    state = automaton.next_states[state][space]
+    assert space not in automaton.next_states[state]
+    assert tokenizer.convert_tokens_to_ids("{") in automaton.next_states[state]
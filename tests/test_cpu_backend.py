@@ -0,0 +1,44 @@
+import torch
+from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+
+import prompts
+from backend import TransformersBackend
+from cpu_backend import CPUBackend
+from tiny_model import build_tiny_model
+
+PROMPTS = [
+    prompts.classifier_prompt_1.format(user_query=query)
+    for query in ["Rotate joint 2 by 45 degrees", "Give me joint values"]
+]
+
+
+def linear_layers(model, kind):
+    return [module for module in model.modules() if type(module) is kind]
+
+
+def test_quantizes_linear_layers():
+    model, tokenizer = build_tiny_model()
+    count = len(linear_layers(model, torch.nn.Linear))
+    backend = CPUBackend(model=model, tokenizer=tokenizer)
+    assert backend.quantized
+    assert linear_layers(backend.model, torch.nn.Linear) == []
+    assert len(linear_layers(backend.model, DynamicLinear)) == count
+
+    model, tokenizer = build_tiny_model()
+    backend = CPUBackend(model=model, tokenizer=tokenizer, quantize=False)
+    assert len(linear_layers(backend.model, torch.nn.Linear)) == count
+
+
+def test_generates_like_transformers_backend():
+    model, tokenizer = build_tiny_model()
+    reference = TransformersBackend(device="cpu", model=model, tokenizer=tokenizer)
+    expected = reference.generate(PROMPTS, max_new_tokens=8)
+
+    model, tokenizer = build_tiny_model()
+    backend = CPUBackend(model=model, tokenizer=tokenizer)
+    texts = backend.generate(PROMPTS, max_new_tokens=8)
+    assert isinstance(texts, list) and len(texts) == len(expected)
+    assert all(isinstance(text, str) for text in texts)
+    # Padded on the left, as the server batches them
+    assert backend.tokenizer.padding_side == "left"
+    assert backend.model.device.type == "cpu"
@@ -0,0 +1,43 @@
+from dedup import deduplicate, find_clusters, key_tokens, normalize, split_clusters
+
+QUERIES = [
+    "Rotate the 6th joint by -30 degrees",
+    "Rotate the sixth joint by -30 degrees.",
+    "Rotate the 6th joint by -30 deg",
+    "Rotate the fifth joint by -30 degrees",
+    "Rotate joint 2 by 30 degrees",
+    "Rotate joint 3 by 30 degrees",
+    "Move the TCP 50 millimeters along the x-axis",
+    "Move the TCP 50 millimeters along the x-axis!",
+    "Move the TCP 50 millimeters along the y-axis",
+]
+
+
+def test_key_tokens():
+    assert key_tokens(normalize("Rotate the sixth joint by π/2 radians")) == (
+        "6",
+        "pi",
+        "2",
+        "rad",
+    )
+    assert key_tokens(normalize("Move 5 centimetres along y, to the left")) == (
+        "5",
+        "cm",
+        "y",
+        "left",
+    )
+
+
+def test_find_clusters():
+    clusters = find_clusters(QUERIES)
+    # The first query of a cluster is its representative
+    assert clusters == [0, 0, 0, 3, 4, 5, 6, 6, 8]
+    assert deduplicate(QUERIES) == [QUERIES[i] for i in (0, 3, 4, 5, 6, 8)]
+
+
+def test_split_clusters_keeps_clusters_together():
+    clusters = [i // 3 for i in range(300)]
+    sides = split_clusters(clusters, test_size=0.2, seed=0)
+    assert 50 <= sides.count("test") <= 70
+    for root in set(clusters):
+        assert len({side for side, r in zip(sides, clusters) if r == root}) == 1
@@ -0,0 +1,84 @@
+import json
+
+from abb import Robot
+from dispatch import CallParser, MotionDispatcher, stream_to_robot
+from fast_path import parse
+from mock.simulator import RobotSimulator
+
+
+def move_tcp(**inputs):
+    return {
+        "function_name": "move_tcp",
+        "inputs": [
+            {"input_name": name, "input_value": value}
+            for name, value in inputs.items()
+        ],
+    }
+
+
+OUTPUT = json.dumps(
+    {
+        "functions": [
+            move_tcp(x="50", relative="true"),
+            move_tcp(y="-20", z="", relative="true"),
+        ]
+    },
+    separators=(",", ":"),
+)
+
+
+def test_call_parser_returns_calls_as_they_complete():
+    parser = CallParser()
+    first, second = json.loads(OUTPUT)["functions"]
+    # Up to the closing brace of the first call
+    end = OUTPUT.index(',{"function_name"')
+    calls = []
+    for i in range(0, end, 7):
+        calls += parser.feed(OUTPUT[i : min(i + 7, end)])
+    assert calls == [first]
+    assert not parser.done
+    assert parser.feed(OUTPUT[end:]) == [second]
+    assert parser.done
+
+
+def test_move_tcp_in_meters(mock_server):
+    simulator = RobotSimulator(time_scale=float("inf"))
+    server = mock_server(simulator=simulator)
+    robot = Robot("127.0.0.1", port_motion=server.port)
+    robot.set_units("meters", "degrees")
+    robot.set_cartesian([[0.5, 0, 0.3], [1, 0, 0, 0]])
+
+    # x/y/z are millimeters whatever the unit of the robot
+    report = stream_to_robot([OUTPUT[:60], OUTPUT[60:]], MotionDispatcher(robot))
+    assert report["complete"] and report["error"] is None
+    assert simulator.pose[0] == [550, -20, 300]
+
+    # Positions, as the schema has them, without a relative input
+    dispatcher = MotionDispatcher(robot)
+    dispatcher.submit(move_tcp(x="100", y="0", z="200"))
+    dispatcher.close()
+    assert dispatcher.error is None
+    assert simulator.pose[0] == [100, 0, 200]
+    robot.close()
+
+
+def test_move_tcp_to_and_along(mock_server):
+    simulator = RobotSimulator(time_scale=float("inf"))
+    server = mock_server(simulator=simulator)
+    robot = Robot("127.0.0.1", port_motion=server.port)
+    robot.set_cartesian([[500, 0, 300], [1, 0, 0, 0]])
+
+    dispatcher = MotionDispatcher(robot)
+    for call in parse("Move TCP to (300, 150, 200) mm")["functions"]:
+        dispatcher.submit(call)
+    dispatcher.close()
+    assert dispatcher.error is None
+    assert simulator.pose[0] == [300, 150, 200]
+
+    dispatcher = MotionDispatcher(robot)
+    for call in parse("Move the TCP 50 mm along the x-axis")["functions"]:
+        dispatcher.submit(call)
+    dispatcher.close()
+    assert dispatcher.error is None
+    assert simulator.pose[0] == [350, 150, 200]
+    robot.close()
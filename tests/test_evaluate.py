@@ -0,0 +1,116 @@
+import math
+
+from evaluate import canonical_label, canonical_prediction, evaluate, score
+
+
+def label(*functions):
+    return {
+        "functions": [
+            {
+                "function_name": name,
+                "inputs": [
+                    {"name": key, "value": value, "unit": unit}
+                    for key, (value, unit) in inputs.items()
+                ],
+            }
+            for name, inputs in functions
+        ]
+    }
+
+
+def prediction(*functions):
+    return {
+        "functions": [
+            {
+                "function_name": name,
+                "inputs": [
+                    {"input_name": key, "input_value": value}
+                    for key, value in inputs.items()
+                ],
+            }
+            for name, inputs in functions
+        ]
+    }
+
+
+def test_canonical_label():
+    # One call per joint, in radians, one angle shared by all joints
+    calls = canonical_label(
+        label(("move_joint", {"joint": ([2, 4], None), "angle": ([90.0], "deg")}))
+    )
+    assert calls == [
+        ("move_joint", {"joint": 2.0, "angle": math.pi / 2}),
+        ("move_joint", {"joint": 4.0, "angle": math.pi / 2}),
+    ]
+    # Millimeters, and no call for an empty function name
+    calls = canonical_label(
+        label(("move_tcp", {"x": (0.5, "m"), "y": ("3", "cm")}), ("", {}))
+    )
+    assert calls == [("move_tcp", {"x": 500.0, "y": 30.0})]
+    assert canonical_label({"functions": []}) == []
+
+
+def test_canonical_prediction():
+    assert canonical_prediction(None) is None
+    assert canonical_prediction({}) == []
+    calls = canonical_prediction(
+        prediction(
+            ("move_joint", {"joint": "[2, 7]", "angle": "0.5"}),
+            ("move_tcp", {"x": "20", "relative": "true"}),
+            ("get_joint_values", {}),
+        )
+    )
+    assert calls == [
+        ("move_joint", {"joint": 2, "angle": 0.5}),
+        ("move_joint", {"joint": 7, "angle": 0.5}),
+        ("move_tcp", {"x": 20.0}),
+        ("get_joint_values", {}),
+    ]
+
+
+def test_score():
+    expected = [("move_tcp", {"x": 20.0}), ("get_joint_values", {})]
+    assert score(expected, expected) == (True, True)
+    # Labels are rounded
+    close = [("move_tcp", {"x": 20.0001}), ("get_joint_values", {})]
+    assert score(expected, close) == (True, True)
+    wrong = [("move_tcp", {"x": 21.0}), ("get_joint_values", {})]
+    assert score(expected, wrong) == (True, False)
+    extra = [("move_tcp", {"x": 20.0, "y": 0.0}), ("get_joint_values", {})]
+    assert score(expected, extra) == (True, False)
+    assert score(expected, expected[::-1]) == (False, False)
+    assert score(expected, None) == (False, False)
+    # Function names only
+    names = [("move_tcp", None)]
+    assert score(names, [("move_tcp", {"x": 1.0})]) == (True, None)
+    assert score(names, None) == (False, None)
+
+
+def test_evaluate():
+    examples = [
+        ("Move along x by 20 mm", [("move_tcp", {"x": 20.0})]),
+        ("Rotate the base", [("move_joint", {"joint": 0.0, "angle": 1.0})]),
+        ("Wave", [("move_tcp", None)]),
+    ]
+    answers = {
+        "Move along x by 20 mm": prediction(("move_tcp", {"x": "20"})),
+        "Rotate the base": prediction(("move_joint", {"joint": "0", "angle": "2"})),
+        "Wave": None,
+    }
+    metrics = evaluate(examples, lambda queries: [answers[q] for q in queries], 2)
+    assert metrics["queries"] == 3
+    assert metrics["sequence_accuracy"] == 2 / 3
+    assert metrics["argument_accuracy"] == 1 / 2
+    assert metrics["answered"] == 2 / 3
+    assert [failure["query"] for failure in metrics["failures"]] == [
+        "Rotate the base",
+        "Wave",
+    ]
+
+
+def test_evaluate_no_examples():
+    metrics = evaluate([], lambda queries: [None] * len(queries))
+    assert metrics["queries"] == 0
+    assert metrics["failures"] == []
+    for key in ("sequence_accuracy", "argument_accuracy", "answered", "p50_ms"):
+        assert metrics[key] is None
@@ -0,0 +1,88 @@
+import pytest
+
+from fast_path import FastPath, parse
+
+
+def calls(result):
+    return [
+        (
+            function["function_name"],
+            {item["input_name"]: item["input_value"] for item in function["inputs"]},
+        )
+        for function in result["functions"]
+    ]
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        # Joints from 0, angles in radians
+        (
+            "Rotate joint 2 by 45 degrees",
+            [("move_joint", {"joint": "1", "angle": "0.785398"})],
+        ),
+        (
+            "Rotate the robot base by -90 degrees",
+            [("move_joint", {"joint": "0", "angle": "-1.570796"})],
+        ),
+        (
+            "Turn the sixth joint by pi/2",
+            [("move_joint", {"joint": "5", "angle": "1.570796"})],
+        ),
+        (
+            "Rotate the 3rd joint for 0.5 radians",
+            [("move_joint", {"joint": "2", "angle": "0.5"})],
+        ),
+        # The unit of the last clause applies to the ones before it
+        (
+            "Rotate joint 1 by 30 and joint 4 by 60 degrees",
+            [
+                ("move_joint", {"joint": "0", "angle": "0.523599"}),
+                ("move_joint", {"joint": "3", "angle": "1.047198"}),
+            ],
+        ),
+        # TCP coordinates in millimeters
+        (
+            "Move TCP to (0.3, 0.15, -0.2) meters",
+            [("move_tcp", {"x": "300", "y": "150", "z": "-200", "relative": "false"})],
+        ),
+        (
+            "Move the TCP along the negative y-axis by 5 cm",
+            [("move_tcp", {"y": "-50", "relative": "true"})],
+        ),
+        ("Give me joint values", [("get_joint_values", {})]),
+        (
+            "Move the tool along the x-axis by 20 mm, then tell me the joint angles",
+            [
+                ("move_tcp", {"x": "20", "relative": "true"}),
+                ("get_joint_values", {}),
+            ],
+        ),
+    ],
+)
+def test_parse(query, expected):
+    assert calls(parse(query)) == expected
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "Move the TCP 10 cm to the left",
+        "Rotate joint 7 by 10 degrees",
+        "Rotate joint 2 by 30",
+        "Rotate joint 2 and joint 3 by 30 degrees",
+        "Move TCP to (300, 150, 200)",
+        "Rotate joint 2 by 30 degrees and wave",
+        "What is the weather like?",
+        "",
+    ],
+)
+def test_parse_leaves_ambiguous_queries_to_the_llm(query):
+    assert parse(query) is None
+
+
+def test_fast_path_falls_back():
+    fast_path = FastPath(fallback=lambda query: {"functions": []})
+    assert calls(fast_path("Give me joint values")) == [("get_joint_values", {})]
+    assert fast_path("Wave at me") == {"functions": []}
+    assert (fast_path.hits, fast_path.misses, fast_path.hit_rate) == (1, 1, 0.5)
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from fleet import RobotFleet
+from mock.simulator import RobotSimulator
+
+
+def test_reconnect_restores_settings(mock_server):
+    simulator = RobotSimulator(time_scale=float("inf"))
+    server = mock_server(simulator=simulator)
+
+    async def run():
+        fleet = RobotFleet({"cell": ("127.0.0.1", server.port)})
+        await fleet.connect()
+        await fleet.call("cell", "set_speed", [300, 60, 50, 50])
+        await fleet.call("cell", "set_zone", "z10")
+        await fleet.reconnect("cell")
+        assert fleet.reconnects["cell"] == 1
+        assert await fleet.call("cell", "get_joints") == simulator.joints
+        await fleet.close()
+
+    asyncio.run(run())
+    assert simulator.speed[:2] == [300, 60]
+    assert simulator.zone[1:] == [10, 15, 1.5]
+
+
+def drop(fleet, name):
+    # The connection goes away under the robot, as when the cable is pulled
+    fleet.robots[name].writer.transport.abort()
+
+
+def test_concurrent_calls_reconnect_once(mock_server):
+    simulator = RobotSimulator(time_scale=float("inf"))
+    server = mock_server(simulator=simulator)
+
+    async def run():
+        fleet = RobotFleet({"cell": ("127.0.0.1", server.port)})
+        await fleet.connect()
+        drop(fleet, "cell")
+        results = await asyncio.gather(
+            fleet.call("cell", "get_joints"), fleet.call("cell", "send", "04 #")
+        )
+        assert fleet.reconnects["cell"] == 1
+        assert results[0] == simulator.joints
+        assert results[1].split()[:2] == [b"4", b"1"]
+        await fleet.close()
+
+    asyncio.run(run())
+
+
+def test_raw_moves_are_not_retried(mock_server):
+    simulator = RobotSimulator(time_scale=float("inf"))
+    server = mock_server(simulator=simulator)
+
+    async def run():
+        fleet = RobotFleet({"cell": ("127.0.0.1", server.port)})
+        await fleet.connect()
+        drop(fleet, "cell")
+        with pytest.raises(ConnectionError):
+            await fleet.call("cell", "send", "02 +0010.00 " + "+0000.00 " * 5 + "#")
+        # Reconnected for the next call, which moves the robot once
+        assert fleet.reconnects["cell"] == 1
+        await fleet.call("cell", "set_joints", [20, 0, 0, 0, 0, 0])
+        await fleet.close()
+
+    asyncio.run(run())
+    assert simulator.joints[0] == 20
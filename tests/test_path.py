@@ -0,0 +1,76 @@
+import numpy as np
+
+from path import FINE, decimate, select_zones, simplify_path
+
+
+def poses_along(points):
+    poses = np.zeros((len(points), 7))
+    poses[:, :3] = points
+    poses[:, 3] = 1
+    return poses
+
+
+def test_decimate_keeps_corners_only():
+    # Two straight, densely sampled legs meeting at a right angle
+    leg = np.linspace(0, 100, 101)
+    points = [[x, 0, 0] for x in leg] + [[100, y, 0] for y in leg[1:]]
+    kept = decimate(poses_along(points), tolerance=0.5)
+    assert kept.tolist() == [0, 100, 200]
+
+
+def test_decimate_keeps_points_out_of_tolerance():
+    points = [[0, 0, 0], [50, 0.4, 0], [100, 0, 0], [150, 0.6, 0], [200, 0, 0]]
+    # Only 150 is further than 0.5 from the line, and the others are within
+    # 0.5 of the line through it as well
+    assert decimate(poses_along(points), tolerance=0.5).tolist() == [0, 3, 4]
+    # 100 is 0.4 from the line through 150
+    assert decimate(poses_along(points), tolerance=0.3).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_select_zones():
+    points = [[0, 0, 0], [100, 0, 0], [101, 0, 0], [101, 100, 0]]
+    zones = select_zones(poses_along(points), tolerance=5, angle_tolerance=1)
+    # z5 fits the first, the 1 mm move next to the middle ones only fits z0
+    assert zones == ["z5", "z0", "z0", FINE]
+    # z5 turns the tool by up to 0.8 degrees, the move into the first pose
+    # is unknown
+    assert select_zones(poses_along(points), tolerance=5)[0] == "z1"
+    # Going straight on through the second one, any zone keeps to the path
+    zones = select_zones(poses_along(points), tolerance=0.1)
+    assert zones == [FINE, "z0", FINE, FINE]
+
+
+def test_select_zones_on_gentle_corners():
+    # Turns by 0.92 degrees, z20 cuts only 0.16 mm off the corners, z30
+    # does not fit in the 50 mm moves
+    points = [[0, 0, 0], [50, 0.4, 0], [100, 0, 0], [150, 0.4, 0], [200, 0, 0]]
+    zones = select_zones(poses_along(points), tolerance=0.25)
+    assert zones == [FINE, "z20", "z20", "z20", FINE]
+    zones = select_zones(poses_along(points), tolerance=1)
+    assert zones == ["z1", "z20", "z20", "z20", FINE]
+    # The tool turns by 1 degree on every move: within angle_tolerance=1
+    # whatever the zone, otherwise only zones that turn it less fit
+    poses = poses_along(points)
+    angles = np.radians(np.arange(5))
+    poses[:, 3], poses[:, 6] = np.cos(angles / 2), np.sin(angles / 2)
+    assert select_zones(poses, tolerance=1)[1:4] == ["z1"] * 3
+    assert select_zones(poses, tolerance=1, angle_tolerance=1)[1:4] == ["z20"] * 3
+
+
+def test_simplify_path_splits_tolerance():
+    # 0.4 from the line: within the whole tolerance, but not within the half
+    # decimate gets
+    points = [[0, 0, 0], [50, 0.4, 0], [100, 0, 0]]
+    poses, zones, report = simplify_path(poses_along(points), tolerance=0.5)
+    assert [pose[0] for pose in poses] == points
+    # The corner is too gentle for z20 to cut more than 0.25 mm off it, z30
+    # does not fit in the 50 mm moves
+    assert zones == [FINE, "z20", FINE]
+    assert report["removed"] == 0
+    assert report["zones"] == {FINE: 2, "z20": 1}
+
+    poses, zones, report = simplify_path(poses_along(points), tolerance=1.0)
+    assert [pose[0] for pose in poses] == [[0, 0, 0], [100, 0, 0]]
+    # Into the first pose, z0 is the largest zone within 0.5 mm
+    assert zones == ["z0", FINE]
+    assert report["removed"] == 1
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+import torch
+
+import prompts
+from backend import TransformersBackend
+from inference_server import InferenceServer, generate
+from prefix_cache import PrefixCache
+from tiny_model import build_tiny_model
+
+QUERIES = [
+    "Rotate joint 2 by 45 degrees",
+    "Give me robot joint info",
+    "Move the TCP 10 cm up and then tell me where it is",
+]
+TEMPLATES = ["classifier_prompt", "classifier_prompt_1", "split_actions"]
+
+
+@pytest.fixture(scope="module")
+def tiny():
+    return build_tiny_model(hidden_size=64)
+
+
+def generate_whole(model, tokenizer, prompt, max_new_tokens):
+    input_ids = tokenizer(prompt, return_tensors="pt", add_special_tokens=False)
+    input_ids = input_ids.input_ids
+    output = model.generate(
+        input_ids,
+        attention_mask=torch.ones_like(input_ids),
+        max_new_tokens=max_new_tokens,
+        do_sample=False,
+        pad_token_id=tokenizer.eos_token_id,
+    )
+    return tokenizer.decode(output[0, input_ids.shape[1] :], skip_special_tokens=True)
+
+
+@pytest.mark.parametrize("name", TEMPLATES)
+def test_same_text_as_whole_prompt(tiny, name):
+    model, tokenizer = tiny
+    template = getattr(prompts, name)
+    cache = PrefixCache(model, tokenizer)
+    expected = [
+        generate_whole(model, tokenizer, template.format(user_query=query), 6)
+        for query in QUERIES
+    ]
+    assert cache.generate_batch(template, QUERIES, max_new_tokens=6) == expected
+    assert cache.generate(template, QUERIES[0], max_new_tokens=6) == expected[0]
+    # Split once, at the static part, for the queries
+    assert cache.splits == {template: True}
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_server_uses_prefix_cache(tiny):
+    model, tokenizer = tiny
+    backend = TransformersBackend("tiny", model=model, tokenizer=tokenizer)
+    server = InferenceServer(backend, address=("127.0.0.1", 0), prefix_cache=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%i" % server.server_address[1]
+    try:
+        for query in QUERIES:
+            reply = generate(
+                url,
+                template="classifier_prompt_1",
+                user_query=query,
+                max_new_tokens=6,
+            )
+            prompt = prompts.classifier_prompt_1.format(user_query=query)
+            assert reply["text"] == generate_whole(model, tokenizer, prompt, 6)
+        assert server.prefixes.misses == 1
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,62 @@
+from query_cache import QueryCache, normalize_query
+
+CONTEXT = {"model": "tiny", "template": "{user_query}", "max_new_tokens": 64}
+RESULT = {"functions": [{"function_name": "get_joint_values", "inputs": []}]}
+
+
+def test_normalized_queries_share_an_entry():
+    assert normalize_query("Rotate joint 2 by 30.0 Degrees") == normalize_query(
+        "  rotate joint 02 by 30deg. "
+    )
+    assert normalize_query("by 30.5 mm") != normalize_query("by 30.05 mm")
+
+    cache = QueryCache()
+    cache.put("Rotate joint 2 by 30.0 Degrees", RESULT, **CONTEXT)
+    assert cache.get("rotate  joint 2 by +30 deg", **CONTEXT) == RESULT
+    assert cache.get("rotate joint 2 by 30.5 deg", **CONTEXT) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    def compute(query):
+        raise AssertionError(f"{query!r} is cached")
+
+    assert cache.cached("Rotate joint 2 by 30 degrees!", compute, **CONTEXT) == RESULT
+
+
+def test_context_change_misses():
+    cache = QueryCache()
+    cache.put("Give me joint values", RESULT, robot="cell_1", **CONTEXT)
+    assert cache.get("Give me joint values", robot="cell_1", **CONTEXT) == RESULT
+    assert cache.get("Give me joint values", robot="cell_2", **CONTEXT) is None
+    changed = dict(CONTEXT, template="{user_query}\n")
+    assert cache.get("Give me joint values", robot="cell_1", **changed) is None
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = QueryCache(max_entries=2)
+    for query in ("a", "b"):
+        cache.put(query, query, **CONTEXT)
+    # Using "a" makes "b" the oldest
+    assert cache.get("a", **CONTEXT) == "a"
+    cache.put("c", "c", **CONTEXT)
+    assert len(cache.entries) == 2
+    assert cache.get("b", **CONTEXT) is None
+    assert cache.get("a", **CONTEXT) == "a"
+    assert cache.get("c", **CONTEXT) == "c"
+
+
+def test_sqlite_entries_survive_a_new_cache(tmp_path):
+    path = tmp_path / "cache" / "queries.sqlite"
+    cache = QueryCache(path, max_entries=1)
+    cache.put("Give me joint values", RESULT, **CONTEXT)
+    cache.put("Rotate the base by 30 degrees", {"functions": []}, **CONTEXT)
+    # Dropped from memory, still on disk
+    assert cache.get("Give me joint values", **CONTEXT) == RESULT
+    assert cache.disk_hits == 1
+    cache.close()
+
+    cache = QueryCache(path)
+    assert cache.get("give me joint values", **CONTEXT) == RESULT
+    assert cache.get("Rotate the base by 30 deg", **CONTEXT) == {"functions": []}
+    assert cache.disk_hits == 2
+    assert cache.prune(**dict(CONTEXT, model="other")) == 2
+    cache.close()
@@ -0,0 +1,93 @@
+import socket
+import time
+
+import numpy as np
+
+from abb import Robot
+from metrics import RobotMetrics
+from mock.simulator import RobotSimulator
+from telemetry import RingBuffer, Telemetry
+
+
+def test_ring_buffer_wraparound():
+    buffer = RingBuffer(4, 2)
+    assert len(buffer) == 0
+    assert buffer.latest(3).shape == (0, 2)
+
+    for i in range(3):
+        buffer.append([i, -i])
+    assert len(buffer) == 3
+    assert buffer.latest(5)[:, 0].tolist() == [0, 1, 2]
+
+    for i in range(3, 10):
+        buffer.append([i, -i])
+    assert len(buffer) == 4
+    # Still contiguous after wrapping around twice, oldest first
+    latest = buffer.latest(4)
+    assert latest[:, 0].tolist() == [6, 7, 8, 9]
+    assert latest[:, 1].tolist() == [-6, -7, -8, -9]
+    assert buffer.latest()[:, 0].tolist() == [9]
+    assert np.shares_memory(latest, buffer.data)
+    assert not latest.flags.writeable
+
+
+def logger_socket():
+    # Stands in for the LOGGER module
+    listener = socket.create_server(("127.0.0.1", 0))
+    return listener, listener.getsockname()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+POSE = b"0 2024-01-30 23:29:10 1.5 100.0 200.0 300.0 1 0 0 0 #"
+JOINTS = b"1 2024-01-30 23:29:10 1.5 10.5 20.5 30 40 50 60 #"
+
+
+def test_telemetry_parses_frames_split_across_reads():
+    listener, remote = logger_socket()
+    telemetry = Telemetry(remote, capacity=8).start()
+    conn, _ = listener.accept()
+    with listener, conn:
+        conn.sendall(POSE + JOINTS[:30])
+        time.sleep(0.05)
+        # Cut in the middle of a number, and a frame not finished yet
+        conn.sendall(JOINTS[30:] + b"1 bad frame #" + JOINTS[:-2])
+        wait_for(lambda: telemetry.frames + telemetry.bad_frames == 3)
+        assert len(telemetry.joints) == 1
+        row = telemetry.joints.latest()[0]
+        assert row[1:].tolist() == [1.5, 10.5, 20.5, 30, 40, 50, 60]
+        assert telemetry.latest_pose() == [[100, 200, 300], [1, 0, 0, 0]]
+        assert telemetry.bad_frames == 1
+
+        conn.sendall(JOINTS[-2:])
+        wait_for(lambda: len(telemetry.joints) == 2)
+    telemetry.stop()
+
+
+def test_robot_reads_joints_from_telemetry(mock_server):
+    simulator = RobotSimulator(time_scale=float("inf"))
+    server = mock_server(simulator=simulator)
+    listener, (ip, port) = logger_socket()
+    metrics = RobotMetrics()
+    robot = Robot(
+        ip, port_motion=server.port, port_logger=port, telemetry=True, metrics=metrics
+    )
+    conn, _ = listener.accept()
+    with listener, conn:
+        conn.sendall(POSE + JOINTS)
+        wait_for(lambda: robot.telemetry.frames == 2)
+        assert robot.get_joints() == [10.5, 20.5, 30, 40, 50, 60]
+        assert robot.get_cartesian() == [[100, 200, 300], [1, 0, 0, 0]]
+        # Neither went to the motion server
+        assert "04" not in metrics.opcodes and "03" not in metrics.opcodes
+
+        # A stale sample is not served
+        robot.telemetry.max_age = 0
+        assert robot.get_joints() == simulator.joints
+        assert metrics.opcodes["04"].count == 1
+        robot.close()